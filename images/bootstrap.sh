@@ -4,7 +4,10 @@ set -e
 
 SCRIPT_DIR=$( cd -- "$( dirname -- "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )
 
-"$SCRIPT_DIR/install-tedge.sh" "apt"
+# Skip the installation if the device has already been prepared (e.g. pooled containers)
+if ! command -v tedge >/dev/null 2>&1; then
+    "$SCRIPT_DIR/install-tedge.sh" "apt"
+fi
 
 echo ----------------------------------------------------------
 echo Bootstraping device
@@ -0,0 +1,25 @@
+#!/bin/sh
+# Create a self-signed CA and server certificate (if not already present),
+# then start the mock tenant
+set -e
+
+CERT_DIR="${CERT_DIR:-/certs}"
+SERVER_NAME="${SERVER_NAME:-c8y-mock}"
+
+mkdir -p "$CERT_DIR"
+if [ ! -f "$CERT_DIR/server.crt" ]; then
+    openssl req -x509 -newkey rsa:2048 -nodes -days 365 \
+        -subj "/CN=c8y-mock-ca" \
+        -keyout "$CERT_DIR/ca.key" -out "$CERT_DIR/ca.crt" 2>/dev/null
+
+    openssl req -newkey rsa:2048 -nodes \
+        -subj "/CN=$SERVER_NAME" \
+        -keyout "$CERT_DIR/server.key" -out "$CERT_DIR/server.csr" 2>/dev/null
+
+    printf "subjectAltName=DNS:%s,DNS:localhost,IP:127.0.0.1\n" "$SERVER_NAME" > "$CERT_DIR/server.ext"
+    openssl x509 -req -days 365 \
+        -in "$CERT_DIR/server.csr" -CA "$CERT_DIR/ca.crt" -CAkey "$CERT_DIR/ca.key" -CAcreateserial \
+        -extfile "$CERT_DIR/server.ext" -out "$CERT_DIR/server.crt" 2>/dev/null
+fi
+
+exec python3 /app/server.py --cert "$CERT_DIR/server.crt" --key "$CERT_DIR/server.key" "$@"
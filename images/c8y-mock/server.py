@@ -0,0 +1,1071 @@
+"""Minimal local Cumulocity IoT stand-in used for offline integration tests
+
+It provides:
+* an MQTT broker (TLS) which accepts the thin-edge.io bridge, and handles the
+  SmartREST 2.0 static templates and the JSON via MQTT topics
+* the REST endpoints used by the tests (inventory, identity, measurement, event,
+  alarm, operation, binaries, trusted certificates), via HTTPS (devices) and
+  HTTP (test runner)
+
+All data is kept in memory. Only the features used by the integration tests
+are implemented, and authentication is not checked.
+"""
+import argparse
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import json
+import logging
+import re
+import ssl
+import struct
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+log = logging.getLogger("c8y-mock")
+
+TENANT = "t12345"
+
+
+def now_iso() -> str:
+    """Current time in the Cumulocity format (utc, milliseconds)"""
+    return (
+        datetime.now(timezone.utc)
+        .isoformat(timespec="milliseconds")
+        .replace("+00:00", "Z")
+    )
+
+
+def parse_time(value: str) -> Optional[datetime]:
+    """Parse an ISO 8601 timestamp (as used in the query parameters)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def certificate_fingerprint(pem: str) -> str:
+    """Fingerprint (sha1 of the DER encoding) of a certificate, like Cumulocity"""
+    lines = [
+        line.strip()
+        for line in pem.strip().splitlines()
+        if line.strip() and not line.startswith("-----")
+    ]
+    try:
+        return hashlib.sha1(base64.b64decode("".join(lines))).hexdigest()
+    except ValueError:
+        return uuid.uuid4().hex
+
+
+class Store:
+    """In-memory tenant data. All access is serialized by a single lock"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._next_id = 1000
+        self.managed_objects: Dict[str, Dict[str, Any]] = {}
+        self.identities: Dict[Tuple[str, str], str] = {}
+        self.measurements: List[Dict[str, Any]] = []
+        self.events: List[Dict[str, Any]] = []
+        self.alarms: List[Dict[str, Any]] = []
+        self.operations: List[Dict[str, Any]] = []
+        self.binaries: Dict[str, Tuple[str, bytes]] = {}
+        self.certificates: Dict[str, Dict[str, Any]] = {}
+        # Called when an operation is created: func(operation)
+        self.on_operation: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    def new_id(self) -> str:
+        """Create a new unique id"""
+        with self.lock:
+            self._next_id += 1
+            return str(self._next_id)
+
+    @staticmethod
+    def _ref(mo_id: str) -> Dict[str, Any]:
+        return {"id": mo_id, "self": f"/inventory/managedObjects/{mo_id}"}
+
+    # Inventory / identity
+    def create_managed_object(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a managed object"""
+        with self.lock:
+            mo_id = self.new_id()
+            timestamp = now_iso()
+            managed_object = {
+                "creationTime": timestamp,
+                "lastUpdated": timestamp,
+                "owner": "device",
+                "childDevices": {"references": []},
+                "childAdditions": {"references": []},
+                "childAssets": {"references": []},
+                **body,
+                **self._ref(mo_id),
+            }
+            self.managed_objects[mo_id] = managed_object
+            return managed_object
+
+    def update_managed_object(self, mo_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Update (merge) the fragments of a managed object"""
+        with self.lock:
+            managed_object = self.managed_objects[mo_id]
+            body = {k: v for k, v in body.items() if k not in ("id", "self")}
+            managed_object.update(body)
+            managed_object["lastUpdated"] = now_iso()
+            return managed_object
+
+    def delete_managed_object(self, mo_id: str):
+        """Delete a managed object and its identities"""
+        with self.lock:
+            self.managed_objects.pop(mo_id, None)
+            for key in [k for k, v in self.identities.items() if v == mo_id]:
+                del self.identities[key]
+            for managed_object in self.managed_objects.values():
+                refs = managed_object.get("childDevices", {}).get("references", [])
+                refs[:] = [ref for ref in refs if ref["managedObject"]["id"] != mo_id]
+
+    def add_child(self, parent_id: str, child_id: str):
+        """Add a child device reference"""
+        with self.lock:
+            refs = self.managed_objects[parent_id]["childDevices"]["references"]
+            if all(ref["managedObject"]["id"] != child_id for ref in refs):
+                child = self.managed_objects[child_id]
+                refs.append(
+                    {
+                        "managedObject": {
+                            **self._ref(child_id),
+                            "name": child.get("name", ""),
+                        }
+                    }
+                )
+            self.managed_objects[child_id]["c8y_mock_parent"] = parent_id
+
+    def create_identity(self, mo_id: str, external_id: str, id_type: str):
+        """Assign an external id to a managed object"""
+        with self.lock:
+            self.identities[(id_type, external_id)] = mo_id
+
+    def get_identity(
+        self, external_id: str, id_type: str = "c8y_Serial"
+    ) -> Optional[str]:
+        """Get the managed object id of an external id"""
+        with self.lock:
+            return self.identities.get((id_type, external_id))
+
+    def external_id(self, mo_id: str, id_type: str = "c8y_Serial") -> Optional[str]:
+        """Get the external id of a managed object"""
+        with self.lock:
+            for (ext_type, external_id), value in self.identities.items():
+                if value == mo_id and ext_type == id_type:
+                    return external_id
+        return None
+
+    def get_or_create_device(
+        self, external_id: str, name: str = None, device_type: str = None
+    ) -> str:
+        """Get (or register) a device by its serial"""
+        with self.lock:
+            mo_id = self.get_identity(external_id)
+            if mo_id is None:
+                mo_id = self.create_managed_object(
+                    {
+                        "name": name or external_id,
+                        "type": device_type or "thin-edge.io",
+                        "c8y_IsDevice": {},
+                        "com_cumulocity_model_Agent": {},
+                        "owner": f"device_{external_id}",
+                    }
+                )["id"]
+                self.create_identity(mo_id, external_id, "c8y_Serial")
+            return mo_id
+
+    # Data
+    def _add(
+        self, collection: List[Dict[str, Any]], body: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        with self.lock:
+            item_id = self.new_id()
+            item = {"time": now_iso(), **body, "id": item_id, "creationTime": now_iso()}
+            source_id = (item.get("source") or {}).get("id")
+            if source_id:
+                item["source"] = {**item["source"], "id": str(source_id)}
+            collection.append(item)
+            return item
+
+    def create_measurement(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a measurement"""
+        return self._add(self.measurements, body)
+
+    def create_event(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Create an event"""
+        return self._add(self.events, body)
+
+    def create_alarm(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Create an alarm (or increase the count of an existing active alarm)"""
+        with self.lock:
+            source_id = str((body.get("source") or {}).get("id", ""))
+            for alarm in self.alarms:
+                if (
+                    alarm["source"]["id"] == source_id
+                    and alarm.get("type") == body.get("type")
+                    and alarm.get("status") != "CLEARED"
+                ):
+                    alarm["count"] = alarm.get("count", 1) + 1
+                    alarm.update({k: v for k, v in body.items() if k != "source"})
+                    return alarm
+            return self._add(self.alarms, {"status": "ACTIVE", "count": 1, **body})
+
+    def create_operation(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Create an operation, and deliver it to the device"""
+        operation = self._add(
+            self.operations,
+            {"status": "PENDING", **body, "deviceId": str(body.get("deviceId", ""))},
+        )
+        if self.on_operation is not None:
+            self.on_operation(operation)
+        return operation
+
+    def update_operation_status(
+        self, device_id: str, fragment: str, status: str, **fields
+    ) -> Optional[Dict[str, Any]]:
+        """Update the oldest operation of a device which has the given fragment and
+        is not yet finished (SmartREST 501/502/503)
+        """
+        with self.lock:
+            order = ["EXECUTING", "PENDING"] if status != "EXECUTING" else ["PENDING"]
+            for current in order:
+                for operation in self.operations:
+                    if (
+                        operation["deviceId"] == device_id
+                        and fragment in operation
+                        and operation["status"] == current
+                    ):
+                        operation["status"] = status
+                        operation.update(fields)
+                        return operation
+        return None
+
+
+FILTERS = {
+    "source": lambda item, value: (item.get("source") or {}).get("id") == value,
+    "type": lambda item, value: item.get("type") == value,
+    "fragmentType": lambda item, value: value in item,
+    "valueFragmentType": lambda item, value: value in item,
+    "status": lambda item, value: item.get("status") in value.split(","),
+    "severity": lambda item, value: item.get("severity") == value,
+    "deviceId": lambda item, value: item.get("deviceId") == value,
+    "agentId": lambda item, value: item.get("deviceId") == value,
+}
+
+
+def filter_items(
+    items: List[Dict[str, Any]], query: Dict[str, str]
+) -> List[Dict[str, Any]]:
+    """Filter items by the supported query parameters"""
+    result = list(items)
+    for name, func in FILTERS.items():
+        if query.get(name):
+            result = [item for item in result if func(item, query[name])]
+
+    series = query.get("valueFragmentSeries")
+    fragment = query.get("valueFragmentType")
+    if series:
+        result = [
+            item
+            for item in result
+            if any(
+                isinstance(value, dict) and series in value
+                for key, value in item.items()
+                if not fragment or key == fragment
+            )
+        ]
+
+    date_from, date_to = parse_time(query.get("dateFrom")), parse_time(
+        query.get("dateTo")
+    )
+    if date_from or date_to:
+        filtered = []
+        for item in result:
+            timestamp = parse_time(item.get("time", ""))
+            if timestamp is None:
+                continue
+            if date_from and timestamp < date_from:
+                continue
+            if date_to and timestamp >= date_to:
+                continue
+            filtered.append(item)
+        result = filtered
+    return result
+
+
+def paginate(
+    items: List[Dict[str, Any]], name: str, query: Dict[str, str], path: str
+) -> Dict[str, Any]:
+    """Create a Cumulocity collection response"""
+    page_size = int(query.get("pageSize", "5"))
+    current = int(query.get("currentPage", "1"))
+    start = (current - 1) * page_size
+    page = items[start : start + page_size]
+    total_pages = max(1, -(-len(items) // page_size)) if page_size else 1
+    params = {**query, "currentPage": str(current + 1)}
+    return {
+        name: page,
+        "statistics": {
+            "currentPage": current,
+            "pageSize": page_size,
+            "totalPages": total_pages,
+        },
+        "self": path,
+        "next": path + "?" + "&".join(f"{k}={v}" for k, v in params.items()),
+    }
+
+
+# Operation fragments which are delivered as SmartREST static templates.
+# Other operations are delivered as JSON via devicecontrol/notifications
+def _csv(*values: Any) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(
+        ["" if value is None else value for value in values]
+    )
+    return buffer.getvalue()
+
+
+def smartrest_operation(operation: Dict[str, Any], serial: str) -> Optional[str]:
+    """Convert an operation to a SmartREST static response template (if supported)"""
+    if "c8y_Restart" in operation:
+        return _csv(510, serial)
+    if "c8y_Command" in operation:
+        return _csv(511, serial, operation["c8y_Command"].get("text", ""))
+    if "c8y_SoftwareUpdate" in operation:
+        values = [528, serial]
+        for item in operation["c8y_SoftwareUpdate"]:
+            values.extend(
+                [
+                    item.get("name"),
+                    item.get("version"),
+                    item.get("url"),
+                    item.get("action"),
+                ]
+            )
+        return _csv(*values)
+    if "c8y_LogfileRequest" in operation:
+        request = operation["c8y_LogfileRequest"]
+        return _csv(
+            522,
+            serial,
+            request.get("logFile"),
+            request.get("dateFrom"),
+            request.get("dateTo"),
+            request.get("searchText"),
+            request.get("maximumLines"),
+        )
+    if "c8y_UploadConfigFile" in operation:
+        return _csv(526, serial, operation["c8y_UploadConfigFile"].get("type"))
+    if "c8y_DownloadConfigFile" in operation:
+        request = operation["c8y_DownloadConfigFile"]
+        return _csv(524, serial, request.get("url"), request.get("type"))
+    return None
+
+
+ALARM_SEVERITIES = {
+    "301": "CRITICAL",
+    "302": "MAJOR",
+    "303": "MINOR",
+    "304": "WARNING",
+}
+
+
+class SmartRest:
+    """Handle SmartREST 2.0 static templates and JSON via MQTT messages"""
+
+    def __init__(self, store: Store, send: Callable[[str, str, str], None]):
+        """
+        Args:
+            store (Store): Tenant data
+            send (Callable[[str, str, str], None]): Send a message to a client:
+                func(client_id, topic, payload)
+        """
+        self.store = store
+        self.send = send
+
+    def handle(self, client_id: str, topic: str, payload: bytes):
+        """Handle a message published by a client"""
+        text = payload.decode("utf8", errors="replace")
+        parts = topic.split("/")
+        try:
+            if parts[:2] == ["s", "uat"]:
+                token = base64.urlsafe_b64encode(uuid.uuid4().bytes).decode("ascii")
+                self.send(client_id, "s/dat", f"71,{token}")
+            elif parts[:2] == ["s", "us"]:
+                serial = parts[2] if len(parts) > 2 else client_id
+                for line in text.splitlines():
+                    if line.strip():
+                        self.handle_smartrest(client_id, serial, line)
+            elif topic.startswith(("measurement/", "event/", "alarm/", "inventory/")):
+                self.handle_json(client_id, topic, json.loads(text))
+            else:
+                log.debug("Ignoring message. topic=%s", topic)
+        except Exception as ex:  # pylint: disable=broad-except
+            log.warning("Could not handle message. topic=%s, error=%s", topic, ex)
+            self.send(client_id, "s/e", f"40,{ex}")
+
+    def _device(self, client_id: str, serial: str) -> str:
+        mo_id = self.store.get_or_create_device(client_id)
+        if serial != client_id:
+            # Child device (which was not explicitly registered using 101)
+            child_id = self.store.get_or_create_device(serial)
+            self.store.add_child(mo_id, child_id)
+            return child_id
+        return mo_id
+
+    def handle_smartrest(self, client_id: str, serial: str, line: str):
+        """Handle a single SmartREST static template message"""
+        store = self.store
+        values = next(csv.reader([line]))
+        template, args = values[0], values[1:]
+
+        def arg(index: int, default: str = "") -> str:
+            return args[index] if len(args) > index and args[index] != "" else default
+
+        if template == "100":
+            mo_id = store.get_or_create_device(serial, arg(0, serial), arg(1))
+            store.update_managed_object(mo_id, {"name": arg(0, serial)})
+            return
+
+        device_id = self._device(client_id, serial)
+        source = {"id": device_id}
+
+        if template == "101":
+            child_id = store.get_or_create_device(arg(0), arg(1, arg(0)), arg(2))
+            store.add_child(device_id, child_id)
+        elif template == "110":
+            store.update_managed_object(
+                device_id,
+                {
+                    "c8y_Hardware": {
+                        "serialNumber": arg(0),
+                        "model": arg(1),
+                        "revision": arg(2),
+                    }
+                },
+            )
+        elif template == "114":
+            store.update_managed_object(device_id, {"c8y_SupportedOperations": args})
+        elif template == "116":
+            items = [
+                {"name": args[i], "version": arg(i + 1), "url": arg(i + 2)}
+                for i in range(0, len(args), 3)
+            ]
+            store.update_managed_object(device_id, {"c8y_SoftwareList": items})
+        elif template == "117":
+            store.update_managed_object(
+                device_id,
+                {"c8y_RequiredAvailability": {"responseInterval": int(arg(0, "0"))}},
+            )
+        elif template == "200":
+            body = {
+                "source": source,
+                "type": arg(0),
+                arg(0): {arg(1, arg(0)): {"value": float(arg(2, "0")), "unit": arg(3)}},
+            }
+            if arg(4):
+                body["time"] = arg(4)
+            store.create_measurement(body)
+        elif template in ALARM_SEVERITIES:
+            body = {
+                "source": source,
+                "type": arg(0),
+                "text": arg(1, arg(0)),
+                "severity": ALARM_SEVERITIES[template],
+            }
+            if arg(2):
+                body["time"] = arg(2)
+            store.create_alarm(body)
+        elif template == "306":
+            with store.lock:
+                for alarm in store.alarms:
+                    if alarm["source"]["id"] == device_id and alarm.get("type") == arg(
+                        0
+                    ):
+                        alarm["status"] = "CLEARED"
+        elif template == "400":
+            body = {"source": source, "type": arg(0), "text": arg(1, arg(0))}
+            if arg(2):
+                body["time"] = arg(2)
+            store.create_event(body)
+        elif template == "500":
+            with store.lock:
+                pending = [
+                    op
+                    for op in store.operations
+                    if op["deviceId"] == device_id and op["status"] == "PENDING"
+                ]
+            for operation in pending:
+                deliver_operation(store, self.send, operation)
+        elif template in ("501", "502", "503"):
+            status = {"501": "EXECUTING", "502": "FAILED", "503": "SUCCESSFUL"}[
+                template
+            ]
+            fields = {"failureReason": arg(1)} if template == "502" else {}
+            store.update_operation_status(device_id, arg(0), status, **fields)
+        else:
+            log.info("Unsupported SmartREST template. line=%s", line)
+
+    def handle_json(self, client_id: str, topic: str, body: Dict[str, Any]):
+        """Handle a JSON via MQTT message"""
+        store = self.store
+        if topic.startswith("inventory/managedObjects/update/"):
+            serial = topic.rsplit("/", 1)[-1]
+            store.update_managed_object(self._device(client_id, serial), body)
+            return
+
+        source = body.get("source") or {}
+        if "externalSource" in body:
+            external = body.pop("externalSource")
+            source = {
+                "id": self._device(client_id, external.get("externalId", client_id))
+            }
+        elif not source.get("id"):
+            source = {"id": self._device(client_id, client_id)}
+        body["source"] = source
+
+        if topic.startswith("measurement/measurements/create"):
+            store.create_measurement(body)
+        elif topic.startswith("event/events/create"):
+            store.create_event(body)
+        elif topic.startswith("alarm/alarms/create"):
+            store.create_alarm(body)
+
+
+def deliver_operation(store: Store, send: Callable[[str, str, str], None], operation):
+    """Send an operation to the MQTT connection of the (parent) device"""
+    device_id = operation["deviceId"]
+    with store.lock:
+        managed_object = store.managed_objects.get(device_id, {})
+        parent_id = managed_object.get("c8y_mock_parent")
+    serial = store.external_id(device_id) or device_id
+    client_id = store.external_id(parent_id) if parent_id else serial
+
+    message = smartrest_operation(operation, serial)
+    if message is not None:
+        send(client_id, "s/ds", message)
+    else:
+        send(client_id, "devicecontrol/notifications", json.dumps(operation))
+
+
+# MQTT 3.1.1 packet types
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = range(8, 15)
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Check if a topic matches a subscription filter (with + and # wildcards)"""
+    filter_parts, topic_parts = topic_filter.split("/"), topic.split("/")
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part not in ("+", topic_parts[index]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def encode_packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    """Encode an MQTT packet (fixed header and body)"""
+    header = bytearray([(packet_type << 4) | flags])
+    length = len(body)
+    while True:
+        byte, length = length % 128, length // 128
+        header.append(byte | (0x80 if length else 0))
+        if not length:
+            break
+    return bytes(header) + body
+
+
+def encode_string(value: str) -> bytes:
+    """Encode an MQTT utf8 string"""
+    data = value.encode("utf8")
+    return struct.pack("!H", len(data)) + data
+
+
+class MqttSession:
+    """Connection of a single MQTT client"""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.client_id = ""
+        self.subscriptions: List[str] = []
+        self._packet_id = 0
+
+    def send(self, packet: bytes):
+        """Queue a packet"""
+        self.writer.write(packet)
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0):
+        """Send a message to the client, if it is subscribed to the topic"""
+        if not any(topic_matches(f, topic) for f in self.subscriptions):
+            return
+        body = encode_string(topic)
+        flags = 0
+        if qos:
+            self._packet_id = self._packet_id % 65535 + 1
+            body += struct.pack("!H", self._packet_id)
+            flags = qos << 1
+        self.send(encode_packet(PUBLISH, flags, body + payload))
+
+
+class MqttBroker:
+    """Minimal MQTT 3.1.1 broker which routes messages to the tenant logic.
+    Clients do not communicate with each other (like Cumulocity), so messages
+    are only sent to the client they are addressed to.
+    """
+
+    def __init__(self, handler: Callable[[str, str, bytes], None]):
+        self.handler = handler
+        self.sessions: Dict[str, MqttSession] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def send(self, client_id: str, topic: str, payload: str):
+        """Send a message to a client (thread-safe)"""
+
+        def deliver():
+            session = self.sessions.get(client_id)
+            if session is None:
+                log.info(
+                    "Client is not connected. client_id=%s, topic=%s", client_id, topic
+                )
+                return
+            session.publish(topic, payload.encode("utf8"), qos=1)
+
+        if self.loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            deliver()
+        else:
+            self.loop.call_soon_threadsafe(deliver)
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """Handle a client connection"""
+        session = MqttSession(writer)
+        try:
+            while True:
+                first = await reader.readexactly(1)
+                packet_type, flags = first[0] >> 4, first[0] & 0x0F
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length) if length else b""
+                if not await self._handle_packet(session, packet_type, flags, body):
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            if self.sessions.get(session.client_id) is session:
+                del self.sessions[session.client_id]
+            log.info("Client disconnected. client_id=%s", session.client_id)
+            writer.close()
+
+    async def _handle_packet(
+        self, session: MqttSession, packet_type: int, flags: int, body: bytes
+    ) -> bool:
+        if packet_type == CONNECT:
+            name_length = struct.unpack("!H", body[:2])[0]
+            offset = 2 + name_length + 4  # protocol name, level, flags, keep alive
+            id_length = struct.unpack("!H", body[offset : offset + 2])[0]
+            session.client_id = body[offset + 2 : offset + 2 + id_length].decode("utf8")
+            previous = self.sessions.get(session.client_id)
+            if previous is not None:
+                previous.writer.close()
+            self.sessions[session.client_id] = session
+            log.info("Client connected. client_id=%s", session.client_id)
+            session.send(encode_packet(CONNACK, 0, b"\x00\x00"))
+        elif packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic_length = struct.unpack("!H", body[:2])[0]
+            topic = body[2 : 2 + topic_length].decode("utf8")
+            offset = 2 + topic_length
+            if qos:
+                packet_id = body[offset : offset + 2]
+                offset += 2
+                session.send(
+                    encode_packet(PUBACK if qos == 1 else PUBREC, 0, packet_id)
+                )
+            self.handler(session.client_id, topic, body[offset:])
+        elif packet_type == PUBREL:
+            session.send(encode_packet(PUBCOMP, 0, body[:2]))
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, bytearray()
+            while offset < len(body):
+                length = struct.unpack("!H", body[offset : offset + 2])[0]
+                topic_filter = body[offset + 2 : offset + 2 + length].decode("utf8")
+                qos = body[offset + 2 + length]
+                offset += 3 + length
+                if topic_filter not in session.subscriptions:
+                    session.subscriptions.append(topic_filter)
+                granted.append(min(qos, 1))
+            session.send(encode_packet(SUBACK, 0, packet_id + bytes(granted)))
+        elif packet_type == UNSUBSCRIBE:
+            packet_id, offset = body[:2], 2
+            while offset < len(body):
+                length = struct.unpack("!H", body[offset : offset + 2])[0]
+                topic_filter = body[offset + 2 : offset + 2 + length].decode("utf8")
+                offset += 2 + length
+                if topic_filter in session.subscriptions:
+                    session.subscriptions.remove(topic_filter)
+            session.send(encode_packet(UNSUBACK, 0, packet_id))
+        elif packet_type == PINGREQ:
+            session.send(encode_packet(PINGRESP, 0, b""))
+        elif packet_type == DISCONNECT:
+            return False
+        return True
+
+
+class RestHandler(BaseHTTPRequestHandler):
+    """Cumulocity REST API subset"""
+
+    store: Store = None
+    protocol_version = "HTTP/1.1"
+
+    ROUTES: List[Tuple[str, str, str]] = [
+        ("GET", r"/tenant/currentTenant", "current_tenant"),
+        ("GET", r"/user/currentUser", "current_user"),
+        ("GET", r"/inventory/managedObjects", "list_managed_objects"),
+        ("POST", r"/inventory/managedObjects", "create_managed_object"),
+        ("GET", r"/inventory/managedObjects/(?P<id>[^/]+)", "get_managed_object"),
+        ("PUT", r"/inventory/managedObjects/(?P<id>[^/]+)", "update_managed_object"),
+        ("DELETE", r"/inventory/managedObjects/(?P<id>[^/]+)", "delete_managed_object"),
+        (
+            "GET",
+            r"/inventory/managedObjects/(?P<id>[^/]+)/childDevices",
+            "child_devices",
+        ),
+        ("POST", r"/inventory/binaries", "create_binary"),
+        ("GET", r"/inventory/binaries/(?P<id>[^/]+)", "get_binary"),
+        (
+            "GET",
+            r"/identity/externalIds/(?P<type>[^/]+)/(?P<external_id>[^/]+)",
+            "get_identity",
+        ),
+        (
+            "DELETE",
+            r"/identity/externalIds/(?P<type>[^/]+)/(?P<external_id>[^/]+)",
+            "ok",
+        ),
+        ("POST", r"/identity/globalIds/(?P<id>[^/]+)/externalIds", "create_identity"),
+        ("GET", r"/measurement/measurements", "list_measurements"),
+        ("POST", r"/measurement/measurements", "create_measurement"),
+        ("GET", r"/event/events", "list_events"),
+        ("POST", r"/event/events", "create_event"),
+        ("GET", r"/event/events/(?P<id>[^/]+)", "get_event"),
+        ("POST", r"/event/events/(?P<id>[^/]+)/binaries", "create_event_binary"),
+        ("GET", r"/event/events/(?P<id>[^/]+)/binaries", "get_event_binary"),
+        ("GET", r"/alarm/alarms", "list_alarms"),
+        ("POST", r"/alarm/alarms", "create_alarm"),
+        ("PUT", r"/alarm/alarms/(?P<id>[^/]+)", "update_alarm"),
+        ("GET", r"/devicecontrol/operations", "list_operations"),
+        ("POST", r"/devicecontrol/operations", "create_operation"),
+        ("GET", r"/devicecontrol/operations/(?P<id>[^/]+)", "get_operation"),
+        ("PUT", r"/devicecontrol/operations/(?P<id>[^/]+)", "update_operation"),
+        ("GET", r"/tenant/tenants/[^/]+/trusted-certificates", "list_certificates"),
+        ("POST", r"/tenant/tenants/[^/]+/trusted-certificates", "create_certificate"),
+        (
+            "DELETE",
+            r"/tenant/tenants/[^/]+/trusted-certificates/(?P<id>[^/]+)",
+            "delete_certificate",
+        ),
+        ("DELETE", r"/user/[^/]+/users/[^/]+", "ok"),
+    ]
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        log.debug("%s - %s", self.address_string(), format % args)
+
+    def _route(self, method: str):
+        url = urlparse(self.path)
+        path = url.path.rstrip("/") or "/"
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        for route_method, pattern, name in self.ROUTES:
+            if route_method != method:
+                continue
+            match = re.fullmatch(pattern, path)
+            if match:
+                try:
+                    status, body = getattr(self, name)(
+                        query=query, path=path, **match.groupdict()
+                    )
+                except KeyError as ex:
+                    status, body = 404, {"error": "not found", "message": str(ex)}
+                except Exception as ex:  # pylint: disable=broad-except
+                    log.exception("Request failed. %s %s", method, self.path)
+                    status, body = 500, {"error": "server error", "message": str(ex)}
+                self._respond(status, body)
+                return
+        self._respond(404, {"error": "not found", "message": f"{method} {path}"})
+
+    def _respond(self, status: int, body: Any):
+        if isinstance(body, tuple):
+            content_type, data = body
+        else:
+            content_type, data = "application/json", json.dumps(body).encode("utf8")
+        if status == 204:
+            data = b""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json(self) -> Dict[str, Any]:
+        data = self._body()
+        return json.loads(data) if data else {}
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._route("GET")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self._route("POST")
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        self._route("PUT")
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        self._route("DELETE")
+
+    # pylint: disable=unused-argument,missing-function-docstring
+    def ok(self, **_kwargs):
+        return 204, None
+
+    def current_tenant(self, **_kwargs):
+        return 200, {"name": TENANT, "domainName": "c8y-mock"}
+
+    def current_user(self, **_kwargs):
+        return 200, {"id": "admin", "userName": "admin", "effectiveRoles": []}
+
+    def list_managed_objects(self, query, path, **_kwargs):
+        with self.store.lock:
+            items = list(self.store.managed_objects.values())
+        items = filter_items(items, query)
+        if query.get("ids"):
+            ids = query["ids"].split(",")
+            items = [item for item in items if item["id"] in ids]
+        return 200, paginate(items, "managedObjects", query, path)
+
+    def create_managed_object(self, **_kwargs):
+        return 201, self.store.create_managed_object(self._json())
+
+    def get_managed_object(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        with self.store.lock:
+            return 200, self.store.managed_objects[id]
+
+    def update_managed_object(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        return 200, self.store.update_managed_object(id, self._json())
+
+    def delete_managed_object(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        self.store.delete_managed_object(id)
+        return 204, None
+
+    def child_devices(
+        self, id, query, path, **_kwargs
+    ):  # pylint: disable=redefined-builtin
+        with self.store.lock:
+            refs = list(self.store.managed_objects[id]["childDevices"]["references"])
+        return 200, paginate(refs, "references", query, path)
+
+    def create_binary(self, **_kwargs):
+        binary_id = self.store.new_id()
+        content_type = self.headers.get("Content-Type", "application/octet-stream")
+        self.store.binaries[binary_id] = (content_type, self._body())
+        return 201, {"id": binary_id, "self": f"/inventory/binaries/{binary_id}"}
+
+    def get_binary(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        return 200, self.store.binaries[id]
+
+    def get_identity(
+        self, type, external_id, **_kwargs
+    ):  # pylint: disable=redefined-builtin
+        mo_id = self.store.get_identity(external_id, type)
+        if mo_id is None:
+            return 404, {"error": "identity/Not Found", "message": external_id}
+        return 200, {
+            "externalId": external_id,
+            "type": type,
+            "managedObject": {
+                "id": mo_id,
+                "self": f"/inventory/managedObjects/{mo_id}",
+            },
+        }
+
+    def create_identity(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        body = self._json()
+        self.store.create_identity(
+            id, body["externalId"], body.get("type", "c8y_Serial")
+        )
+        return 201, {**body, "managedObject": {"id": id}}
+
+    def _list(self, collection, name, query, path, newest_first=False):
+        with self.store.lock:
+            items = filter_items(collection, query)
+        revert = query.get("revert", "false").lower() == "true"
+        if newest_first != revert:
+            items.reverse()
+        return 200, paginate(items, name, query, path)
+
+    def list_measurements(self, query, path, **_kwargs):
+        return self._list(self.store.measurements, "measurements", query, path)
+
+    def create_measurement(self, **_kwargs):
+        body = self._json()
+        if "measurements" in body:
+            return 201, {
+                "measurements": [
+                    self.store.create_measurement(item) for item in body["measurements"]
+                ]
+            }
+        return 201, self.store.create_measurement(body)
+
+    def list_events(self, query, path, **_kwargs):
+        return self._list(self.store.events, "events", query, path, newest_first=True)
+
+    def create_event(self, **_kwargs):
+        return 201, self.store.create_event(self._json())
+
+    def get_event(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        with self.store.lock:
+            return 200, next(e for e in self.store.events if e["id"] == id)
+
+    def create_event_binary(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        content_type = self.headers.get("Content-Type", "application/octet-stream")
+        self.store.binaries[f"event-{id}"] = (content_type, self._body())
+        with self.store.lock:
+            event = next(e for e in self.store.events if e["id"] == id)
+            event["c8y_IsBinary"] = {"name": id, "type": content_type}
+        return 201, event
+
+    def get_event_binary(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        return 200, self.store.binaries[f"event-{id}"]
+
+    def list_alarms(self, query, path, **_kwargs):
+        return self._list(self.store.alarms, "alarms", query, path, newest_first=True)
+
+    def create_alarm(self, **_kwargs):
+        return 201, self.store.create_alarm(self._json())
+
+    def update_alarm(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        with self.store.lock:
+            alarm = next(a for a in self.store.alarms if a["id"] == id)
+            alarm.update(self._json())
+            return 200, alarm
+
+    def list_operations(self, query, path, **_kwargs):
+        return self._list(self.store.operations, "operations", query, path)
+
+    def create_operation(self, **_kwargs):
+        return 201, self.store.create_operation(self._json())
+
+    def get_operation(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        with self.store.lock:
+            return 200, next(o for o in self.store.operations if o["id"] == id)
+
+    def update_operation(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        with self.store.lock:
+            operation = next(o for o in self.store.operations if o["id"] == id)
+            operation.update(self._json())
+            return 200, operation
+
+    def list_certificates(self, **_kwargs):
+        with self.store.lock:
+            return 200, {"certificates": list(self.store.certificates.values())}
+
+    def create_certificate(self, **_kwargs):
+        body = self._json()
+        fingerprint = body.get("fingerprint") or certificate_fingerprint(
+            body.get("certInPemFormat", "")
+        )
+        certificate = {**body, "fingerprint": fingerprint}
+        self.store.certificates[fingerprint] = certificate
+        return 201, certificate
+
+    def delete_certificate(self, id, **_kwargs):  # pylint: disable=redefined-builtin
+        self.store.certificates.pop(id, None)
+        return 204, None
+
+
+def serve_http(store: Store, port: int, context: ssl.SSLContext = None):
+    """Serve the REST API (in a background thread)"""
+    handler = type("Handler", (RestHandler,), {"store": store})
+    server = ThreadingHTTPServer(("0.0.0.0", port), handler)
+    server.daemon_threads = True
+    if context is not None:
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(
+        target=server.serve_forever, name=f"http-{port}", daemon=True
+    ).start()
+    log.info("Serving REST API. port=%s, tls=%s", port, context is not None)
+
+
+def main():
+    """Start the mock tenant"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cert", default="/certs/server.crt")
+    parser.add_argument("--key", default="/certs/server.key")
+    parser.add_argument("--http-port", type=int, default=8080)
+    parser.add_argument("--https-port", type=int, default=443)
+    parser.add_argument("--mqtt-port", type=int, default=8883)
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=args.log_level, format="%(asctime)s %(levelname)s %(message)s"
+    )
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(args.cert, args.key)
+
+    store = Store()
+    broker = MqttBroker(lambda *a: None)
+    smartrest = SmartRest(store, broker.send)
+    broker.handler = smartrest.handle
+    store.on_operation = lambda operation: deliver_operation(
+        store, broker.send, operation
+    )
+
+    serve_http(store, args.http_port)
+    serve_http(store, args.https_port, context)
+
+    async def serve_mqtt():
+        broker.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(
+            broker.handle_client, "0.0.0.0", args.mqtt_port, ssl=context
+        )
+        log.info("Serving MQTT. port=%s", args.mqtt_port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve_mqtt())
+
+
+if __name__ == "__main__":
+    main()
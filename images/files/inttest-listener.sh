@@ -0,0 +1,12 @@
+#!/bin/sh
+# Enable the mosquitto listener used by the test runner (inttest-listener.conf)
+# only if the container was started with INTTEST_EXPOSE_MQTT=1. The container
+# environment is only available to pid 1, not to the systemd services
+set -e
+LISTENER_CONF=/etc/mosquitto/conf.d/inttest-listener.conf
+
+if tr '\0' '\n' < /proc/1/environ | grep -qx 'INTTEST_EXPOSE_MQTT=1'; then
+    ln -sf /etc/mosquitto/inttest-listener.conf "$LISTENER_CONF"
+else
+    rm -f "$LISTENER_CONF"
+fi
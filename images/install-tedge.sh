@@ -1,10 +1,25 @@
 #!/bin/bash
 
-install_via_apt() {
+add_apt_repository() {
     echo 'deb [trusted=yes] https://thinedgeio.jfrog.io/artifactory/stable stable main' > /etc/apt/sources.list.d/tedge.list
     apt-get update
+}
+
+install_via_apt() {
+    add_apt_repository
     apt-get install -y mosquitto
-    apt-get install -y tedge-full
+    # Optionally pin the version, e.g. TEDGE_VERSION=0.8.1
+    apt-get install -y "tedge-full${TEDGE_VERSION:+=$TEDGE_VERSION}"
+}
+
+# Print the version which install_via_apt would install
+apt_candidate_version() {
+    if [ -n "$TEDGE_VERSION" ]; then
+        echo "$TEDGE_VERSION"
+        return
+    fi
+    add_apt_repository >&2 || return 1
+    apt-cache policy tedge-full | sed -n 's/^ *Candidate: *//p'
 }
 
 install_via_script() {
@@ -16,6 +31,10 @@ case "$1" in
     apt)
         install_via_apt
         ;;
+
+    apt-version)
+        apt_candidate_version
+        ;;
     
     *)
         # Remove system.toml as the latest official release does not support custom reboot command
@@ -3,24 +3,63 @@
 
 import os
 import logging
+from typing import Optional
 import pytest
 from docker.errors import APIError
 from pytest_c8y.utils import RandomNameGenerator
 from pytest_c8y.device_management import DeviceManagement
+from integration.fixtures.c8y_realtime import Subscriber
 from integration.fixtures.device_mgmt import CumulocityDeviceManagement
+from integration.fixtures.docker.c8y_mock import C8yMockTenant
 from integration.fixtures.docker.factory import DockerDeviceFactory
+from integration.fixtures.docker.resources import CpuAllocator, HostScheduler
 from integration.fixtures.device.device import Device
+from integration.fixtures.mqtt.load import LoadGenerator
 
 
 log = logging.getLogger()
 
 
+@pytest.fixture(name="c8y_mock", scope="session")
+def fixture_c8y_mock() -> Optional[C8yMockTenant]:
+    """Local mock tenant which replaces the live Cumulocity tenant when the
+    INTTEST_C8Y_MOCK environment variable is set to 1, so the tests can run offline.
+    The mock tenant image is built via "invoke build-mock".
+
+    The Cumulocity settings of the environment are replaced by those of the mock tenant,
+    and restored at the end of the session.
+    """
+    if os.environ.get("INTTEST_C8Y_MOCK", "0") != "1":
+        yield None
+        return
+
+    mock = C8yMockTenant(
+        image=os.environ.get("INTTEST_C8Y_MOCK_IMAGE", "c8y-mock"),
+    ).start()
+    runner_env = mock.runner_env()
+    original_env = {name: os.environ.get(name) for name in runner_env}
+    os.environ.update(runner_env)
+    try:
+        yield mock
+        mock.stop()
+    finally:
+        for name, value in original_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
 @pytest.fixture(name="device_mgmt", scope="session")
-def fixture_device_mgmt(device_mgmt: DeviceManagement) -> CumulocityDeviceManagement:
+def fixture_device_mgmt(
+    c8y_mock: Optional[C8yMockTenant],  # pylint: disable=unused-argument
+    device_mgmt: DeviceManagement,
+) -> CumulocityDeviceManagement:
     """Provide a live CumulocityApi instance as defined by the environment.
     This fixture uses the device_mgmt fixture from pytest_c8y and extends via
     class inheritance
     """
+    # Note: c8y_mock is requested first, as it changes the environment used by device_mgmt
     mgmt = CumulocityDeviceManagement(device_mgmt.context)
     mgmt.configure_retries(timeout=30)
     return mgmt
@@ -56,11 +95,76 @@ def fixture_random_name_factory(variables: dict) -> str:
     return generate
 
 
-@pytest.fixture(name="dut")
-def device_under_test(device_mgmt: DeviceManagement, request, random_name: str):
-    """Create a docker device to use for testing"""
-    device_factory = DockerDeviceFactory()
+@pytest.fixture(name="device_factory", scope="session")
+def fixture_device_factory():
+    """Docker device factory which is shared by all tests in the session.
+    All factories use the same docker client, whose connection pool size can be
+    set via the INTTEST_DOCKER_POOL_SIZE environment variable.
+
+    A pool of pre-installed containers is kept ready when the INTTEST_POOL_SIZE
+    environment variable is set to a value greater than 0.
+    Devices are started from an image with tedge already installed when the
+    INTTEST_IMAGE_CACHE environment variable is set to 1.
+    New devices are only admitted when the host has enough free memory/cpu when
+    the INTTEST_HOST_SCHEDULER environment variable is set to 1.
+    Each device gets dedicated cpus (INTTEST_CPUS_PER_DEVICE, default 1), and the
+    test runner is pinned to a separate cpu, when INTTEST_PIN_CPUS is set to 1.
+    The MQTT broker of each device is published on an ephemeral host port (bound
+    to INTTEST_MQTT_HOST_IP), so tests can publish messages directly from the host,
+    when INTTEST_EXPOSE_MQTT is set to 1.
+    """
+    cpu_allocator = None
+    if os.environ.get("INTTEST_PIN_CPUS", "0") == "1":
+        cpu_allocator = CpuAllocator(
+            cpus_per_device=int(os.environ.get("INTTEST_CPUS_PER_DEVICE", "1")),
+        )
+        cpu_allocator.pin_runner()
+
+    device_factory = DockerDeviceFactory(
+        cache_images=os.environ.get("INTTEST_IMAGE_CACHE", "0") == "1",
+        scheduler=(
+            HostScheduler()
+            if os.environ.get("INTTEST_HOST_SCHEDULER", "0") == "1"
+            else None
+        ),
+        cpu_allocator=cpu_allocator,
+        expose_mqtt=os.environ.get("INTTEST_EXPOSE_MQTT", "0") == "1",
+        mqtt_host_ip=os.environ.get("INTTEST_MQTT_HOST_IP", "127.0.0.1"),
+    )
+
+    pool_size = int(os.environ.get("INTTEST_POOL_SIZE", "0"))
+    if pool_size > 0:
+        device_factory.enable_pool(
+            pool_size,
+            image="debian-systemd",
+            env_file=".env",
+            test_suite="inttest",
+        )
+
+    yield device_factory
+
+    device_factory.cleanup()
 
+
+@pytest.fixture(name="dut")
+def device_under_test(
+    device_mgmt: DeviceManagement,
+    device_factory: DockerDeviceFactory,
+    c8y_mock: Optional[C8yMockTenant],
+    request,
+    random_name: str,
+):
+    """Create a docker device to use for testing
+
+    On teardown, the device logs and configuration are saved to test_output.
+    Collecting the artifacts archive can be disabled by setting the INTTEST_ARTIFACTS
+    environment variable to 0, and its size is limited by INTTEST_ARTIFACTS_MAX_SIZE.
+    The container resource usage is sampled during the test, and saved as a csv
+    time series, when the INTTEST_STATS environment variable is set to 1.
+    The c8y/# and tedge/# messages of the device are recorded to a capture file
+    (see integration.fixtures.mqtt.capture), when the INTTEST_CAPTURE environment
+    variable is set to 1. It requires INTTEST_EXPOSE_MQTT=1.
+    """
     devices = {}
     device_sn = random_name
 
@@ -69,12 +173,30 @@ def device_under_test(device_mgmt: DeviceManagement, request, random_name: str):
         "debian-systemd",
         env_file=".env",
         test_suite="inttest",
+        env=c8y_mock.device_env() if c8y_mock else None,
     )
+    # Run commands via a long-lived shell session to reduce the per command latency
+    device.use_shell_session = os.environ.get("INTTEST_SHELL_SESSION", "0") == "1"
+
+    if os.environ.get("INTTEST_STATS", "0") == "1":
+        device.start_stats_sampler()
+
     # Install/Bootstrap tedge here after the container starts due to
     # install problems when systemd is not running (during the build stage)
     # But it also allows us to possibly customize which version is installed
     # for the test
+    if c8y_mock:
+        c8y_mock.install_ca(device)
     device.assert_command("/demo/bootstrap.sh", log_output=False, shell=True)
+    device.wait_until_ready()
+
+    if os.environ.get("INTTEST_CAPTURE", "0") == "1":
+        os.makedirs("test_output", exist_ok=True)
+        capture_name = str(request.node.name).replace("[", "-").replace("]", "")
+        device.start_capture(
+            os.path.join("test_output", f"inttest-{capture_name}-{device_sn}.capture")
+        )
+
     cert_fingerprint = (
         device.assert_command(
             "tedge cert show | grep '^Thumbprint:' | cut -d' ' -f2 | tr A-Z a-z"
@@ -148,10 +270,39 @@ def device_under_test(device_mgmt: DeviceManagement, request, random_name: str):
 
             file.write("\n--------------------- Device logs ---------------------\n")
 
-            file.write("\n".join(device.get_logs()))
+            device.write_logs(file)
+
+        if device.stats_sampler is not None:
+            device.stop_stats_sampler()
+            stats_file = os.path.join(
+                output_folder,
+                f"inttest-{test_id}-{test_name}-{device_sn}{test_result}.stats.csv",
+            )
+            with open(stats_file, "w", encoding="utf8", newline="") as file:
+                device.stats_sampler.buffer.write_csv(file)
+            log.info("Device resource usage: %s", device.stats_sampler.buffer.summary())
+
+        if device.capture is not None:
+            device.stop_capture()
+            log.info(
+                "Captured %d MQTT messages. file=%s",
+                device.capture.records,
+                device.capture.path,
+            )
+
+        if os.environ.get("INTTEST_ARTIFACTS", "1") == "1":
+            device.collect_artifacts(
+                os.path.join(
+                    output_folder,
+                    f"inttest-{test_id}-{test_name}-{device_sn}{test_result}.artifacts.tar.gz",
+                ),
+                max_size=os.environ.get("INTTEST_ARTIFACTS_MAX_SIZE", "20m"),
+            )
+
+        device.cleanup()
 
         log.info("Removing container")
-        device.container.remove(force=True)
+        device_factory.remove_device(device.container, device_sn)
 
         # Cleanup cloud device
         if cert_fingerprint:
@@ -160,3 +311,24 @@ def device_under_test(device_mgmt: DeviceManagement, request, random_name: str):
 
     except APIError as ex:
         log.error("Failed cleaning up the container. %s", ex)
+
+
+@pytest.fixture(name="load_generator")
+def fixture_load_generator(
+    dut: Device, c8y_mock: Optional[C8yMockTenant]
+) -> LoadGenerator:
+    """Measurement load generator for the device under test. The messages are
+    published from the host, so the MQTT broker must be published
+    (INTTEST_EXPOSE_MQTT=1). Drops and latency are measured using a realtime
+    subscription to the device's measurements (not supported by the mock tenant).
+    """
+    if os.environ.get("INTTEST_EXPOSE_MQTT", "0") != "1":
+        pytest.skip("Load tests require INTTEST_EXPOSE_MQTT=1")
+
+    device_id = dut.cloud.context.device_id
+    return LoadGenerator(
+        dut.device.publish_many,
+        subscribe=None
+        if c8y_mock
+        else lambda duration: Subscriber.to_measurements(device_id, int(duration) + 1),
+    )
@@ -1,7 +1,8 @@
 """c8y realtime fixture"""
 import json
 import subprocess
-from typing import Any, Callable, List, Optional
+import time
+from typing import Any, Callable, Iterator, List, Optional, Tuple
 
 
 class JsonReader:
@@ -35,6 +36,23 @@ class JsonReader:
             return [func(json.loads(line)) for line in self._proc.stdout]
         return [json.loads(line) for line in self._proc.stdout]
 
+    def iter_lines(self) -> Iterator[Tuple[float, Any]]:
+        """Read the output as it arrives
+
+        Yields:
+            Tuple[float, Any]: Time when the line was received (unix seconds) and
+                the parsed object
+        """
+        for line in self._proc.stdout:
+            received = time.time()
+            if line.strip():
+                yield received, json.loads(line)
+
+    def stop(self):
+        """Stop the process (if still running)"""
+        if self._proc.poll() is None:
+            self._proc.terminate()
+
 
 class Subscriber:
     """Subscriber factory"""
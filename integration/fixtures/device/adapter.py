@@ -1,7 +1,19 @@
 """Device adapter"""
+import json
 import logging
-from typing import List, Any, Tuple
+import shlex
+import time
+from typing import Iterable, List, Any, Optional, TextIO, Tuple
 from datetime import datetime, timezone
+from integration.fixtures.device.journal import JournalStore
+from integration.fixtures.device.readiness import (
+    DEFAULT_SERVICES,
+    ReadinessStatus,
+    probe_command,
+)
+
+# Prefix of the last line printed by journalctl when using --show-cursor
+JOURNAL_CURSOR_PREFIX = "-- cursor: "
 
 
 class DeviceAdapter:
@@ -17,6 +29,7 @@ class DeviceAdapter:
         self._start_time = None
         self._test_start_time = datetime.now(timezone.utc)
         self._is_existing_device = False
+        self._log_cursor = None
 
     @property
     def test_start_time(self) -> datetime:
@@ -71,6 +84,20 @@ class DeviceAdapter:
         """
         raise NotImplementedError()
 
+    def run_batch(
+        self, cmds: List[str], log_output: bool = True
+    ) -> List[Tuple[int, Any]]:
+        """Execute multiple shell commands (in order)
+
+        Args:
+            cmds (List[str]): Commands to execute
+            log_output (bool, optional): Log the stdout after the commands have executed
+
+        Returns:
+            List[Tuple[int, Any]]: Command output (exit_code, output) of each command
+        """
+        return [self.execute_command(cmd, log_output=log_output) for cmd in cmds]
+
     def assert_command(
         self, cmd: str, exp_exit_code: int = 0, log_output: bool = True, **kwargs
     ) -> Any:
@@ -87,6 +114,84 @@ class DeviceAdapter:
         """
         raise NotImplementedError()
 
+    def probe_ready(
+        self, services: Iterable[str] = DEFAULT_SERVICES, bridge: Optional[bool] = None
+    ) -> ReadinessStatus:
+        """Check the state of the services (and bridge) using a single command
+
+        Args:
+            services (Iterable[str], optional): Systemd services which should be active
+            bridge (Optional[bool], optional): Check if the cloud bridge is connected.
+                Defaults to None, which only checks it if the bridge is configured.
+
+        Returns:
+            ReadinessStatus: Readiness status
+        """
+        services = list(services)
+        _, output = self.execute_command(
+            probe_command(services, bridge), log_output=False
+        )
+        return ReadinessStatus.parse(
+            output.decode("utf8", errors="replace"), services, bridge
+        )
+
+    def wait_until_ready(
+        self,
+        services: Iterable[str] = DEFAULT_SERVICES,
+        bridge: Optional[bool] = None,
+        timeout: float = 60,
+        max_interval: float = 2.0,
+    ) -> ReadinessStatus:
+        """Wait until the services are active and the cloud bridge is connected.
+        The device is probed with an increasing interval (starting at 0.1s).
+
+        Args:
+            services (Iterable[str], optional): Systemd services which should be active.
+                Defaults to mosquitto, tedge-agent and tedge-mapper-c8y.
+            bridge (Optional[bool], optional): Wait for the cloud bridge to be
+                connected. Defaults to None, which only waits for it if the bridge is
+                configured (i.e. the device is connected to the cloud).
+            timeout (float, optional): Timeout in seconds. Defaults to 60.
+            max_interval (float, optional): Maximum interval between probes in seconds.
+                Defaults to 2.
+
+        Raises:
+            TimeoutError: The device was not ready within the timeout
+
+        Returns:
+            ReadinessStatus: Readiness status
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        interval = 0.1
+        probes = 0
+        while True:
+            status = None
+            try:
+                status = self.probe_ready(services, bridge)
+            except Exception as ex:  # pylint: disable=broad-except
+                # e.g. the device is still starting
+                logging.debug("Readiness probe failed. exception=%s", ex)
+            probes += 1
+
+            if status is not None and status.ready:
+                logging.info(
+                    "Device is ready. name=%s, duration=%.3f, probes=%d",
+                    self.name,
+                    time.monotonic() - start,
+                    probes,
+                )
+                return status
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(
+                    f"Device was not ready after {timeout} seconds. name={self.name}, "
+                    f"pending={status.pending if status else 'probe failed'}"
+                )
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, max_interval)
+
     @property
     def name(self) -> str:
         """Get the name of the device
@@ -109,33 +214,144 @@ class DeviceAdapter:
         """Connect the device to the network"""
         raise NotImplementedError()
 
-    def get_logs(self, since: Any = None) -> List[str]:
+    @property
+    def log_cursor(self) -> str:
+        """Journal cursor of the last log entry collected incrementally
+
+        Returns:
+            str: Journal cursor. None if no logs have been collected yet
+        """
+        return self._log_cursor
+
+    @log_cursor.setter
+    def log_cursor(self, cursor: str):
+        self._log_cursor = cursor
+
+    def _journal_command(
+        self, since: Any = None, incremental: bool = False, structured: bool = False
+    ) -> str:
+        """Build the journalctl command used to read the device logs
+
+        Args:
+            since (Any, optional): Get logs since the provided data. Defaults to None.
+            incremental (bool, optional): Only get the entries after the last cursor,
+                and print the new cursor as the last line. Defaults to False.
+            structured (bool, optional): Use the json output format (one entry per line).
+                Each entry contains its own cursor, so no cursor line is printed.
+                Defaults to False.
+
+        Returns:
+            str: journalctl command
+        """
+        cmd = "journalctl --no-pager -u 'tedge*' -u 'c8y*' -u mosquitto"
+
+        if structured:
+            cmd += " --quiet --output json"
+        elif incremental:
+            cmd += " --quiet --show-cursor"
+
+        if incremental and self._log_cursor:
+            cmd += f" --after-cursor {shlex.quote(self._log_cursor)}"
+        else:
+            cmd += " --lines 100000"
+            if since:
+                cmd += f' --since "{since}"'
+        return cmd
+
+    def _take_log_cursor(self, line: str) -> bool:
+        """Store the journal cursor if the line contains it
+
+        Args:
+            line (str): Log line
+
+        Returns:
+            bool: True if the line was the cursor line
+        """
+        if line.startswith(JOURNAL_CURSOR_PREFIX):
+            self._log_cursor = line[len(JOURNAL_CURSOR_PREFIX) :]
+            return True
+        return False
+
+    def get_logs(self, since: Any = None, incremental: bool = False) -> List[str]:
         """Get a list of log entries from the docker container
 
         Args:
-            timestamps (bool, optional): Included timestamps in the log entries. Defaults to False.
             since (Any, optional): Get logs since the provided data. Defaults to None.
+                Ignored when fetching incrementally and a previous cursor exists.
+            incremental (bool, optional): Only get the entries which are newer than
+                the last incremental call. Defaults to False.
 
         Returns:
             List[str]: List of log entries
         """
-        cmd = "journalctl --lines 100000 --no-pager -u 'tedge*' -u 'c8y*' -u mosquitto"
+        cmd = self._journal_command(since, incremental)
 
         output = []
-        if since:
-            cmd += f' --since "{since}"'
         exit_code, logs = self.execute_command(cmd, log_output=False)
 
         if exit_code != 0:
             logging.warning(
-                "Could not retrieve journalctl logs. cmd=%d, exit_code=%d",
+                "Could not retrieve journalctl logs. cmd=%s, exit_code=%d",
                 cmd,
                 exit_code,
             )
         output.extend(logs.decode("utf8").splitlines())
 
+        if incremental and output and self._take_log_cursor(output[-1]):
+            output.pop()
+
         return output
 
+    def write_logs(
+        self, file: TextIO, since: Any = None, incremental: bool = True
+    ) -> int:
+        """Write the log entries to a file
+
+        Args:
+            file (TextIO): File to write to
+            since (Any, optional): Get logs since the provided data. Defaults to None.
+            incremental (bool, optional): Only write the entries which are newer than
+                the last incremental call. Defaults to True.
+
+        Returns:
+            int: Number of log entries written
+        """
+        lines = self.get_logs(since, incremental=incremental)
+        for line in lines:
+            file.write(line + "\n")
+        return len(lines)
+
+    def get_journal(self, since: Any = None, incremental: bool = False) -> JournalStore:
+        """Get the log entries as structured data (in a compact columnar store)
+        which can be efficiently filtered
+
+        Args:
+            since (Any, optional): Get logs since the provided data. Defaults to None.
+            incremental (bool, optional): Only get the entries which are newer than
+                the last incremental call. Defaults to False.
+
+        Returns:
+            JournalStore: Journal entries
+        """
+        cmd = self._journal_command(since, incremental, structured=True)
+        exit_code, logs = self.execute_command(cmd, log_output=False)
+
+        if exit_code != 0:
+            logging.warning(
+                "Could not retrieve journalctl logs. cmd=%s, exit_code=%d",
+                cmd,
+                exit_code,
+            )
+
+        store = JournalStore()
+        for line in logs.splitlines():
+            if line.strip():
+                store.append_json(json.loads(line))
+
+        if incremental and store.cursor:
+            self._log_cursor = store.cursor
+        return store
+
     def get_id(self) -> str:
         """Get the device id
 
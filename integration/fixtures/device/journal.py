@@ -0,0 +1,305 @@
+"""Columnar storage of structured journal (journald) entries"""
+import json
+import re
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
+
+# Default priority (info) used for entries which do not include a priority
+DEFAULT_PRIORITY = 6
+
+TimeValue = Union[datetime, int, None]
+
+
+class JournalEntry(NamedTuple):
+    """Single journal entry"""
+
+    timestamp: int
+    unit: str
+    priority: int
+    message: str
+
+    @property
+    def time(self) -> datetime:
+        """Timestamp as a datetime (in utc)"""
+        return datetime.fromtimestamp(self.timestamp / 1e9, timezone.utc)
+
+
+def parse_json_entry(entry: Dict[str, Any]) -> Tuple[int, str, int, bytes]:
+    """Extract the fields of an entry in the journalctl json output format
+
+    Args:
+        entry (Dict[str, Any]): Journal entry (as decoded json)
+
+    Returns:
+        Tuple[int, str, int, bytes]: Timestamp (ns), unit, priority and message
+    """
+    message = entry.get("MESSAGE")
+    if isinstance(message, list):
+        # binary messages are provided as a list of bytes
+        message = bytes(message)
+    elif message is None:
+        message = b""
+    else:
+        message = message.encode("utf8")
+
+    return (
+        int(entry.get("__REALTIME_TIMESTAMP", 0)) * 1000,
+        # Messages from systemd about a unit (e.g. Started ...) use the UNIT field
+        entry.get("UNIT") or entry.get("_SYSTEMD_UNIT") or "",
+        int(entry.get("PRIORITY", DEFAULT_PRIORITY)),
+        message,
+    )
+
+
+def to_nanoseconds(value: TimeValue) -> Optional[int]:
+    """Convert a datetime to a unix timestamp in nanoseconds
+
+    Args:
+        value (TimeValue): Datetime (naive values are treated as utc) or
+            timestamp in nanoseconds
+
+    Returns:
+        Optional[int]: Timestamp in nanoseconds
+    """
+    if value is None or isinstance(value, int):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1_000_000) * 1000
+
+
+def to_bytes_pattern(pattern: Union[str, bytes, Pattern]) -> Pattern:
+    """Get a bytes regular expression which can be used to search the (utf8)
+    messages of the store. Str patterns (including compiled ones) are encoded
+
+    Args:
+        pattern (Union[str, bytes, Pattern]): Regular expression
+
+    Returns:
+        Pattern: Compiled bytes regular expression
+    """
+    if isinstance(pattern, str):
+        pattern = pattern.encode("utf8")
+    if isinstance(pattern, bytes):
+        return re.compile(pattern)
+    if isinstance(pattern.pattern, str):
+        # The unicode flag (set for all str patterns) is not allowed for bytes
+        return re.compile(pattern.pattern.encode("utf8"), pattern.flags & ~re.UNICODE)
+    return pattern
+
+
+class JournalStore:
+    """Compact column based store of journal entries.
+
+    * timestamps are stored as int64 nanoseconds since the unix epoch
+    * units are stored as integer codes of an interned category list
+    * priorities are stored as int8
+    * messages are stored in a single buffer with an offset per entry
+
+    Entries are expected to be appended in time order (as provided by journalctl),
+    which allows time ranges to be found using a binary search.
+    """
+
+    def __init__(self):
+        self.timestamps = array("q")
+        self.unit_codes = array("I")
+        self.priorities = array("b")
+        self._offsets = array("Q", [0])
+        self._messages = bytearray()
+        self._units: List[str] = []
+        self._unit_index: Dict[str, int] = {}
+        self._sorted = True
+        self.cursor: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def units(self) -> List[str]:
+        """Unit names (categories) in the order they were first seen"""
+        return list(self._units)
+
+    def _unit_code(self, unit: str) -> int:
+        code = self._unit_index.get(unit)
+        if code is None:
+            code = len(self._units)
+            self._units.append(unit)
+            self._unit_index[unit] = code
+        return code
+
+    def append(self, timestamp: int, unit: str, priority: int, message: bytes):
+        """Append an entry
+
+        Args:
+            timestamp (int): Timestamp in nanoseconds since the unix epoch
+            unit (str): Systemd unit
+            priority (int): Syslog priority (0=emerg ... 7=debug)
+            message (bytes): Message (utf8)
+        """
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            self._sorted = False
+        self.timestamps.append(timestamp)
+        self.unit_codes.append(self._unit_code(unit))
+        self.priorities.append(priority)
+        self._messages += message
+        self._offsets.append(len(self._messages))
+
+    def append_json(self, entry: Dict[str, Any]):
+        """Append an entry in the journalctl json output format
+
+        Args:
+            entry (Dict[str, Any]): Journal entry (as decoded json)
+        """
+        self.append(*parse_json_entry(entry))
+        self.cursor = entry.get("__CURSOR", self.cursor)
+
+    @classmethod
+    def from_json_lines(cls, lines: Iterable[Union[str, bytes]]) -> "JournalStore":
+        """Create a store from journalctl json output (one entry per line)
+
+        Args:
+            lines (Iterable[Union[str, bytes]]): Output lines
+
+        Returns:
+            JournalStore: Journal store
+        """
+        store = cls()
+        for line in lines:
+            if line and line.strip():
+                store.append_json(json.loads(line))
+        return store
+
+    def message_bytes(self, index: int) -> memoryview:
+        """Get the message of an entry without copying it"""
+        return memoryview(self._messages)[
+            self._offsets[index] : self._offsets[index + 1]
+        ]
+
+    def message(self, index: int) -> str:
+        """Get the message of an entry"""
+        return self._messages[self._offsets[index] : self._offsets[index + 1]].decode(
+            "utf8", errors="replace"
+        )
+
+    def unit(self, index: int) -> str:
+        """Get the unit of an entry"""
+        return self._units[self.unit_codes[index]]
+
+    def entry(self, index: int) -> JournalEntry:
+        """Get an entry"""
+        return JournalEntry(
+            self.timestamps[index],
+            self.unit(index),
+            self.priorities[index],
+            self.message(index),
+        )
+
+    def entries(self, indices: Iterable[int] = None) -> List[JournalEntry]:
+        """Get multiple entries (all entries by default)"""
+        if indices is None:
+            indices = range(len(self))
+        return [self.entry(index) for index in indices]
+
+    def time_range(self, start: TimeValue = None, end: TimeValue = None) -> range:
+        """Get the indices of the entries within a time range [start, end)
+
+        Args:
+            start (TimeValue, optional): Start time (inclusive)
+            end (TimeValue, optional): End time (exclusive)
+
+        Returns:
+            range: Entry indices
+        """
+        start_ns, end_ns = to_nanoseconds(start), to_nanoseconds(end)
+        if not self._sorted:
+            raise ValueError("Entries are not in time order. Use filter() instead")
+        lower = 0 if start_ns is None else bisect_left(self.timestamps, start_ns)
+        upper = len(self) if end_ns is None else bisect_left(self.timestamps, end_ns)
+        return range(lower, max(lower, upper))
+
+    def filter(
+        self,
+        unit: str = None,
+        max_priority: int = None,
+        start: TimeValue = None,
+        end: TimeValue = None,
+        pattern: Union[str, Pattern] = None,
+    ) -> List[int]:
+        """Find the entries matching all of the given criteria
+
+        Args:
+            unit (str, optional): Systemd unit (e.g. tedge-agent.service)
+            max_priority (int, optional): Only include entries with the given priority or
+                more severe, e.g. 3 for errors
+            start (TimeValue, optional): Start time (inclusive)
+            end (TimeValue, optional): End time (exclusive)
+            pattern (Union[str, Pattern], optional): Regular expression which the
+                message must contain. Anchors (e.g. ^, $) match the start and end
+                of each message
+
+        Returns:
+            List[int]: Entry indices
+        """
+        if self._sorted:
+            indices = self.time_range(start, end)
+        else:
+            start_ns, end_ns = to_nanoseconds(start), to_nanoseconds(end)
+            indices = [
+                i
+                for i, timestamp in enumerate(self.timestamps)
+                if (start_ns is None or timestamp >= start_ns)
+                and (end_ns is None or timestamp < end_ns)
+            ]
+
+        if unit is not None:
+            code = self._unit_index.get(unit)
+            if code is None:
+                return []
+            unit_codes = self.unit_codes
+            indices = [i for i in indices if unit_codes[i] == code]
+
+        if max_priority is not None:
+            priorities = self.priorities
+            indices = [i for i in indices if priorities[i] <= max_priority]
+
+        if pattern is not None:
+            pattern = to_bytes_pattern(pattern)
+            offsets = self._offsets
+            # Search a slice per entry, as the pos/endpos arguments of search()
+            # do not let ^ match at the start of each message. The view is
+            # released afterwards, as the buffer can not grow while it is exported
+            with memoryview(self._messages) as messages:
+                indices = [
+                    i
+                    for i in indices
+                    if pattern.search(messages[offsets[i] : offsets[i + 1]])
+                ]
+
+        return list(indices)
+
+    def count_by_unit(self, indices: Iterable[int] = None) -> Dict[str, int]:
+        """Count the entries per unit
+
+        Args:
+            indices (Iterable[int], optional): Only count these entries. Defaults to all.
+
+        Returns:
+            Dict[str, int]: Number of entries per unit
+        """
+        counts = [0] * len(self._units)
+        unit_codes = self.unit_codes
+        for i in range(len(self)) if indices is None else indices:
+            counts[unit_codes[i]] += 1
+        return {unit: count for unit, count in zip(self._units, counts) if count}
@@ -0,0 +1,135 @@
+"""Readiness probe of the tedge services on a device"""
+import shlex
+from typing import Dict, Iterable, NamedTuple, Optional
+
+DEFAULT_SERVICES = ("mosquitto", "tedge-agent", "tedge-mapper-c8y")
+
+# Mosquitto bridge configuration created by "tedge connect c8y". Devices without it
+# are not connected to the cloud
+BRIDGE_CONFIG = "/etc/tedge/mosquitto-conf/c8y-bridge.conf"
+
+BRIDGE_KEY = "bridge"
+
+# Services which are only enabled once the device is connected to the cloud
+CLOUD_SERVICES = ("tedge-agent", "tedge-mapper-c8y")
+
+
+def _is_checked(name: str, services: Iterable[str], bridge: Optional[bool]) -> bool:
+    """A check is always part of the probe output (not depending on the device)"""
+    if name == BRIDGE_KEY:
+        return bool(bridge)
+    return name in services and (bridge is not None or name not in CLOUD_SERVICES)
+
+
+def bridge_status_command(config: str = BRIDGE_CONFIG) -> str:
+    """Shell command which prints the (retained) bridge connection status
+    ("1" = connected) as a key=value line.
+
+    Newer tedge versions configure a custom notification topic, otherwise mosquitto
+    publishes the status to $SYS/broker/connection/<name>/state, so the topic is
+    read from the bridge configuration. The mosquitto clients are not installed on
+    the devices, so the tedge client is used, and only its first message is read,
+    so the command does not wait for the subscription to time out.
+
+    Args:
+        config (str, optional): Mosquitto bridge configuration file
+
+    Returns:
+        str: Shell command (bash)
+    """
+    config = shlex.quote(config)
+    return (
+        f"topic=$(sed -n 's/^notification_topic[[:space:]]*//p' {config} | head -n 1); "
+        '[ -n "$topic" ] || topic="\\$SYS/broker/connection/'
+        f"$(sed -n 's/^connection[[:space:]]*//p' {config} | head -n 1)/state\"; "
+        f"echo {BRIDGE_KEY}=$(read -r line "
+        '< <(timeout 1 tedge mqtt sub "$topic" 2>/dev/null); echo "$line")'
+    )
+
+
+def probe_command(services: Iterable[str], bridge: Optional[bool] = None) -> str:
+    """Shell command which prints the state of each service (and of the
+    cloud bridge) as key=value lines, so all checks take a single exec
+
+    Args:
+        services (Iterable[str]): Systemd services
+        bridge (Optional[bool], optional): Include the bridge connection status.
+            None only includes it, and the CLOUD_SERVICES, if the bridge is
+            configured. Defaults to None.
+
+    Returns:
+        str: Shell command
+    """
+    services = list(services)
+    commands = [
+        f"echo {shlex.quote(service)}=$(systemctl is-active {shlex.quote(service)} 2>/dev/null)"
+        for service in services
+        if _is_checked(service, services, bridge)
+    ]
+    if bridge is not False:
+        cloud_commands = [bridge_status_command()] + [
+            f"echo {service}=$(systemctl is-active {service} 2>/dev/null)"
+            for service in services
+            if not _is_checked(service, services, bridge)
+        ]
+        not_configured = f"echo {BRIDGE_KEY}=" if bridge else ":"
+        commands.append(
+            f"if [ -f {shlex.quote(BRIDGE_CONFIG)} ]; then {'; '.join(cloud_commands)}; "
+            f"else {not_configured}; fi"
+        )
+    return "; ".join(commands)
+
+
+class ReadinessStatus(NamedTuple):
+    """Result of a readiness probe"""
+
+    # State of each check, e.g. {"tedge-agent": "active", "bridge": "1"}
+    states: Dict[str, str]
+
+    @property
+    def ready(self) -> bool:
+        """All services are active and the bridge (if checked) is connected"""
+        return bool(self.states) and all(
+            state == ("1" if name == BRIDGE_KEY else "active")
+            for name, state in self.states.items()
+        )
+
+    @property
+    def pending(self) -> Dict[str, str]:
+        """Checks which are not ready yet"""
+        return {
+            name: state
+            for name, state in self.states.items()
+            if state != ("1" if name == BRIDGE_KEY else "active")
+        }
+
+    @classmethod
+    def parse(cls, output: str, services: Iterable[str], bridge: Optional[bool] = None):
+        """Parse the output of the probe command
+
+        Args:
+            output (str): Command output
+            services (Iterable[str]): Systemd services which were checked
+            bridge (Optional[bool], optional): The bridge connection status was
+                checked. None if it was only checked when configured.
+
+        Returns:
+            ReadinessStatus: Readiness status. Missing checks have an empty state
+        """
+        services = list(services)
+        states = {
+            name: ""
+            for name in [*services, BRIDGE_KEY]
+            if _is_checked(name, services, bridge)
+        }
+        for line in output.splitlines():
+            name, sep, state = line.partition("=")
+            if sep and (
+                name in services or (name == BRIDGE_KEY and bridge is not False)
+            ):
+                state = state.strip()
+                if name == BRIDGE_KEY:
+                    # Only the payload is relevant (some clients include the topic)
+                    state = state.split(" ")[-1] if state else state
+                states[name] = state
+        return cls(states)
@@ -0,0 +1,134 @@
+"""Streaming tar archives used to copy files to/from docker containers"""
+import io
+import os
+import tarfile
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+# pylint: disable=broad-except
+
+# Compression algorithms which are supported by both tarfile and docker's put_archive
+COMPRESSIONS = ("", "gz", "bz2", "xz")
+
+CHUNK_SIZE = 64 * 1024
+
+
+def tar_stream(
+    src: str, arcname: str, compression: str = "", chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Create a tar archive of a file or directory as a stream of chunks.
+
+    The archive is written by a background thread into a pipe, so only a
+    single chunk is held in memory at any time, regardless of the file size.
+
+    Args:
+        src (str): File or directory (on the host)
+        arcname (str): Name of the file or directory in the archive
+        compression (str, optional): Compression, e.g. gz, bz2, xz. Defaults to none.
+        chunk_size (int, optional): Maximum size of each chunk. Defaults to 64KB.
+
+    Raises:
+        ValueError: Unsupported compression
+        FileNotFoundError: Source does not exist
+
+    Yields:
+        bytes: Archive data
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(
+            f"Unsupported compression. value={compression}, supported={COMPRESSIONS}"
+        )
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"Source does not exist. path={src}")
+
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def write():
+        try:
+            with open(write_fd, "wb") as writer:
+                with tarfile.open(fileobj=writer, mode=f"w|{compression}") as tar:
+                    tar.add(src, arcname=arcname)
+        except Exception as ex:
+            errors.append(ex)
+
+    writer = threading.Thread(target=write, name="tar-writer", daemon=True)
+    writer.start()
+    try:
+        with open(read_fd, "rb") as reader:
+            while True:
+                chunk = reader.read1(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        # Closing the read end unblocks the writer if the consumer stopped early
+        writer.join()
+
+    if errors:
+        raise errors[0]
+
+
+class ChunkReader(io.RawIOBase):
+    """Read only file object on top of an iterable of chunks"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _rename_member(member: tarfile.TarInfo, old: str, new: str) -> Optional[str]:
+    if member.name == old:
+        return new
+    if member.name.startswith(old + "/"):
+        return new + member.name[len(old) :]
+    return None
+
+
+def extract_stream(
+    chunks: Iterable[bytes], dst_dir: str, name: str = None, new_name: str = None
+) -> int:
+    """Extract a tar archive stream (e.g. as returned by get_archive) to a
+    directory, one member at a time, without holding the archive in memory.
+
+    Args:
+        chunks (Iterable[bytes]): Tar archive data (uncompressed or compressed)
+        dst_dir (str): Directory (on the host) to extract to
+        name (str, optional): Name of the top-level file or directory in the archive
+        new_name (str, optional): Rename the top-level file or directory to this name
+
+    Returns:
+        int: Number of extracted members
+    """
+    Path(dst_dir).mkdir(parents=True, exist_ok=True)
+    count = 0
+    with io.BufferedReader(ChunkReader(chunks), CHUNK_SIZE) as reader:
+        with tarfile.open(fileobj=reader, mode="r|*") as tar:
+            for member in tar:
+                if name and new_name and name != new_name:
+                    renamed = _rename_member(member, name, new_name)
+                    if renamed is not None:
+                        member.name = renamed
+                if hasattr(tarfile, "tar_filter"):
+                    # Reject members which would be written outside of dst_dir
+                    tar.extract(member, dst_dir, filter="tar")
+                else:
+                    tar.extract(member, dst_dir)
+                count += 1
+    return count
@@ -0,0 +1,208 @@
+"""Collect files (logs, configuration etc.) from devices as compressed archives"""
+import io
+import logging
+import shlex
+import tarfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+from integration.fixtures.docker.archive import CHUNK_SIZE, ChunkReader
+from integration.fixtures.docker.resources import parse_size
+
+log = logging.getLogger()
+
+DEFAULT_ARTIFACT_PATHS = (
+    "/var/log/tedge/agent",
+    "/etc/tedge",
+    "/var/log/mosquitto",
+)
+
+DEFAULT_MAX_ARTIFACT_SIZE = "20m"
+
+# Staging directory on the container's root filesystem, so files can be hard linked
+STAGING_DIR = "/var/tmp/inttest-artifacts"
+
+# Prefix of the output lines of the staging command listing the skipped files
+SKIPPED_PREFIX = "skipped: "
+
+
+@dataclass
+class ArtifactSummary:
+    """Result of collecting the artifacts of a device"""
+
+    path: Optional[Path] = None
+    files: int = 0
+    size: int = 0
+    # Files which were not included as the size limit was reached
+    skipped: List[str] = field(default_factory=list)
+    error: Optional[Exception] = None
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """The artifacts were collected successfully"""
+        return self.error is None
+
+
+def staging_command(
+    paths: Iterable[str],
+    staging_dir: str = STAGING_DIR,
+    max_size: Union[str, int, None] = None,
+) -> str:
+    """Shell command which gathers the given paths (if they exist) into a
+    staging directory, so they can be retrieved using a single archive request.
+    Files are hard linked where possible to avoid copying their contents.
+
+    If a maximum size is given, files (in path order) which would exceed the
+    total size are removed from the staging directory, so they are not
+    transferred. Each removed file is printed (relative to the staging
+    directory) on a line starting with SKIPPED_PREFIX.
+
+    Args:
+        paths (Iterable[str]): Absolute paths of files or directories
+        staging_dir (str, optional): Staging directory
+        max_size (Union[str, int, None], optional): Maximum total size of the
+            staged files. Defaults to no limit.
+
+    Returns:
+        str: Shell command
+    """
+    staging_dir = shlex.quote(staging_dir)
+    quoted = " ".join(shlex.quote(path) for path in paths)
+    cmd = (
+        f"rm -rf {staging_dir} && mkdir -p {staging_dir} && "
+        f"for path in {quoted}; do "
+        f'[ -e "$path" ] || continue; '
+        f'cp -al --parents "$path" {staging_dir} 2>/dev/null '
+        f'|| cp -a --parents "$path" {staging_dir}; '
+        "done"
+    )
+    if max_size is None:
+        return cmd
+    return (
+        f"{cmd}; status=$?; total=0; "
+        f"find {staging_dir} -type f -printf '%s %P\\n' | LC_ALL=C sort -k2 | "
+        "while read -r size path; do "
+        f"if [ $((total + size)) -gt {parse_size(max_size)} ]; then "
+        f'rm -f {staging_dir}/"$path"; echo "{SKIPPED_PREFIX}$path"; '
+        "else total=$((total + size)); fi; "
+        "done; exit $status"
+    )
+
+
+def write_archive(
+    chunks: Iterable[bytes],
+    dst: Union[str, Path],
+    max_size: Union[str, int] = DEFAULT_MAX_ARTIFACT_SIZE,
+    strip_prefix: str = "",
+) -> ArtifactSummary:
+    """Write a tar archive stream (e.g. as returned by get_archive) to a gzip
+    compressed archive, while it is being received.
+
+    Files are included until the total (uncompressed) size of the files would
+    exceed the limit. Any remaining files are skipped, so the archive is always valid.
+    This only protects the output file, as the data has already been transferred,
+    so the size should also be limited before the transfer (see staging_command).
+
+    Args:
+        chunks (Iterable[bytes]): Tar archive data
+        dst (Union[str, Path]): Output file (.tar.gz)
+        max_size (Union[str, int], optional): Maximum total size of the included files
+        strip_prefix (str, optional): Remove this prefix from the member names
+
+    Returns:
+        ArtifactSummary: Summary of the written archive
+    """
+    max_bytes = parse_size(max_size)
+    summary = ArtifactSummary(path=Path(dst))
+    summary.path.parent.mkdir(parents=True, exist_ok=True)
+
+    with io.BufferedReader(ChunkReader(chunks), CHUNK_SIZE) as reader, tarfile.open(
+        fileobj=reader, mode="r|"
+    ) as src, tarfile.open(summary.path, mode="w:gz") as out:
+        for member in src:
+            if strip_prefix:
+                if member.name.rstrip("/") == strip_prefix.rstrip("/"):
+                    continue
+                if member.name.startswith(strip_prefix):
+                    member.name = member.name[len(strip_prefix) :]
+                if member.islnk() and member.linkname.startswith(strip_prefix):
+                    member.linkname = member.linkname[len(strip_prefix) :]
+
+            if not member.isfile():
+                out.addfile(member)
+                continue
+
+            if summary.size + member.size > max_bytes:
+                summary.skipped.append(member.name)
+                continue
+
+            out.addfile(member, src.extractfile(member))
+            summary.files += 1
+            summary.size += member.size
+
+    return summary
+
+
+def collect_artifacts(
+    container,
+    dst: Union[str, Path],
+    paths: Iterable[str] = DEFAULT_ARTIFACT_PATHS,
+    max_size: Union[str, int] = DEFAULT_MAX_ARTIFACT_SIZE,
+) -> ArtifactSummary:
+    """Collect files from a container into a compressed archive on the host.
+    The files are staged using a single exec, and then retrieved using a
+    single (streamed) archive request. The size limit is applied when staging,
+    so skipped files are not transferred. The staging directory is always removed.
+
+    Args:
+        container (Container): Container
+        dst (Union[str, Path]): Output file (.tar.gz)
+        paths (Iterable[str], optional): Files or directories to collect
+        max_size (Union[str, int], optional): Maximum total size of the included files
+
+    Returns:
+        ArtifactSummary: Summary of the collected artifacts
+    """
+    start = time.monotonic()
+    try:
+        exit_code, output = container.exec_run(
+            ["/bin/bash", "-c", staging_command(paths, max_size=max_size)]
+        )
+        skipped = []
+        for line in output.decode("utf8", errors="replace").splitlines():
+            if line.startswith(SKIPPED_PREFIX):
+                skipped.append(line[len(SKIPPED_PREFIX) :])
+            elif exit_code != 0:
+                log.warning(
+                    "Some artifacts could not be staged. exit_code=%s, output=%s",
+                    exit_code,
+                    line,
+                )
+
+        chunks, stat = container.get_archive(STAGING_DIR, chunk_size=None)
+        summary = write_archive(
+            chunks, dst, max_size=max_size, strip_prefix=stat["name"] + "/"
+        )
+        summary.skipped = skipped + summary.skipped
+    except Exception as ex:  # pylint: disable=broad-except
+        log.error(
+            "Could not collect artifacts. container=%s, error=%s", container.name, ex
+        )
+        summary = ArtifactSummary(error=ex)
+    finally:
+        try:
+            container.exec_run(["rm", "-rf", STAGING_DIR])
+        except Exception as ex:  # pylint: disable=broad-except
+            log.debug("Could not remove staging directory. error=%s", ex)
+
+    summary.duration = time.monotonic() - start
+    if summary.skipped:
+        log.warning(
+            "Artifact size limit reached, skipped %d files. container=%s, max_size=%s",
+            len(summary.skipped),
+            container.name,
+            max_size,
+        )
+    return summary
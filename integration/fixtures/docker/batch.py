@@ -0,0 +1,67 @@
+"""Batch device creation and removal results"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from integration.fixtures.docker.device import DockerDeviceAdapter
+
+
+@dataclass
+class DeviceCreationResult:
+    """Result of creating a single device as part of a batch"""
+
+    device_id: str
+    device: Optional[DockerDeviceAdapter] = None
+    error: Optional[Exception] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        """The device was created (and bootstrapped) successfully"""
+        return self.error is None
+
+
+@dataclass
+class BatchCreationResult:
+    """Result of creating a batch of devices. The results are in the same
+    order as the requested devices
+    """
+
+    results: List[DeviceCreationResult]
+    duration: float = 0.0
+
+    @property
+    def devices(self) -> List[Optional[DockerDeviceAdapter]]:
+        """Device adapters in the requested order. None if the device could not be created"""
+        return [result.device for result in self.results]
+
+    @property
+    def failed(self) -> List[DeviceCreationResult]:
+        """Results of devices which failed to be created or bootstrapped"""
+        return [result for result in self.results if not result.ok]
+
+    def phase_summary(self) -> Dict[str, Dict[str, float]]:
+        """Summarize the duration of each creation phase over all devices
+
+        Returns:
+            Dict[str, Dict[str, float]]: Average and maximum duration (in seconds) per phase
+        """
+        phases: Dict[str, List[float]] = {}
+        for result in self.results:
+            for phase, duration in result.timings.items():
+                phases.setdefault(phase, []).append(duration)
+
+        return {
+            phase: {
+                "avg": sum(durations) / len(durations),
+                "max": max(durations),
+            }
+            for phase, durations in phases.items()
+        }
+
+
+@dataclass
+class RemovalSummary:
+    """Summary of removing a batch of device containers"""
+
+    removed: int = 0
+    failed: int = 0
+    duration: float = 0.0
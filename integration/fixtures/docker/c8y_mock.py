@@ -0,0 +1,193 @@
+"""Local Cumulocity IoT stand-in (mock tenant) container for offline test runs"""
+import logging
+import os
+import tempfile
+import time
+import urllib.request
+from typing import Dict, Optional
+from docker import DockerClient
+from docker.errors import NotFound
+from docker.models.containers import Container
+from integration.fixtures.docker.client import (
+    get_docker_client,
+    get_or_create_network,
+)
+
+log = logging.getLogger()
+
+DEFAULT_IMAGE = "c8y-mock"
+DEFAULT_NAME = "c8y-mock"
+
+# Port of the plain HTTP REST API, used by the test runner (published on the host)
+HTTP_PORT = "8080/tcp"
+
+# Location of the mock tenant's CA certificate inside the container
+CA_CERT_PATH = "/certs/ca.crt"
+
+# Location of the CA certificate on the devices (read by update-ca-certificates)
+DEVICE_CA_CERT_PATH = "/usr/local/share/ca-certificates/c8y-mock.crt"
+
+TENANT = "t12345"
+USER = "admin"
+PASSWORD = "c8y-mock"
+
+
+class C8yMockTenant:
+    """Mock tenant container on the integration test network.
+
+    The devices connect to it via the hostname of the container (MQTT and HTTPS,
+    using a self-signed CA which needs to be installed on each device), and the
+    test runner uses its REST API via a published port on the host.
+    """
+
+    def __init__(
+        self,
+        image: str = DEFAULT_IMAGE,
+        name: str = DEFAULT_NAME,
+        network_name: str = None,
+        docker_client: DockerClient = None,
+        host_ip: str = "127.0.0.1",
+    ):
+        """Create a mock tenant. The container is not started until start() is called
+
+        Args:
+            image (str, optional): Docker image. Defaults to c8y-mock.
+            name (str, optional): Container name, which is also the hostname used
+                by the devices. Defaults to c8y-mock.
+            network_name (str, optional): Network. Defaults to the INTTEST_NETWORK
+                environment variable or inttest-network.
+            docker_client (DockerClient, optional): Docker client. Defaults to the
+                shared client.
+            host_ip (str, optional): Host ip address to publish the REST API on.
+                Defaults to 127.0.0.1.
+        """
+        self.image = image
+        self.name = name
+        self.network_name = network_name or os.environ.get(
+            "INTTEST_NETWORK", "inttest-network"
+        )
+        self.host_ip = host_ip
+        self._docker_client = docker_client or get_docker_client()
+        self.container: Optional[Container] = None
+        self._ca_cert: Optional[bytes] = None
+
+    def start(self, timeout: float = 30) -> "C8yMockTenant":
+        """Start the mock tenant container (replacing any existing one), and wait
+        for the REST API to be available
+
+        Args:
+            timeout (float, optional): Timeout in seconds. Defaults to 30.
+
+        Raises:
+            TimeoutError: REST API is not available within the timeout
+
+        Returns:
+            C8yMockTenant: The mock tenant
+        """
+        self.stop()
+        network = get_or_create_network(self._docker_client, self.network_name)
+        self.container = self._docker_client.containers.run(
+            self.image,
+            name=self.name,
+            hostname=self.name,
+            detach=True,
+            network=network.id,
+            ports={HTTP_PORT: (self.host_ip, None)},
+            labels={"tedge.inttest.mock": "1"},
+        )
+        log.info(
+            "Started mock tenant. name=%s, network=%s", self.name, self.network_name
+        )
+        self.wait_until_ready(timeout)
+        return self
+
+    def wait_until_ready(self, timeout: float = 30):
+        """Wait for the REST API to respond
+
+        Args:
+            timeout (float, optional): Timeout in seconds. Defaults to 30.
+
+        Raises:
+            TimeoutError: REST API is not available within the timeout
+        """
+        deadline = time.monotonic() + timeout
+        interval = 0.1
+        while True:
+            try:
+                with urllib.request.urlopen(
+                    f"{self.base_url}/tenant/currentTenant", timeout=2
+                ):
+                    return
+            except Exception as ex:  # pylint: disable=broad-except
+                if time.monotonic() + interval > deadline:
+                    raise TimeoutError(
+                        f"Mock tenant is not ready after {timeout}s. error={ex}"
+                    ) from ex
+            time.sleep(interval)
+            interval = min(interval * 2, 1.0)
+
+    def stop(self):
+        """Remove the mock tenant container (if it exists)"""
+        try:
+            container = self.container or self._docker_client.containers.get(self.name)
+            container.remove(force=True)
+            log.info("Removed mock tenant. name=%s", self.name)
+        except NotFound:
+            pass
+        self.container = None
+        self._ca_cert = None
+
+    @property
+    def base_url(self) -> str:
+        """Url of the REST API (from the host)"""
+        if self.container is None:
+            raise Exception("Mock tenant is not started")
+        self.container.reload()
+        ports = self.container.attrs["NetworkSettings"]["Ports"][HTTP_PORT]
+        host = ports[0]["HostIp"]
+        if host in ("", "0.0.0.0", "::"):
+            host = "127.0.0.1"
+        return f"http://{host}:{ports[0]['HostPort']}"
+
+    def runner_env(self) -> Dict[str, str]:
+        """Environment variables used by the Cumulocity client of the test runner"""
+        return {
+            "C8Y_BASEURL": self.base_url,
+            "C8Y_TENANT": TENANT,
+            "C8Y_USER": USER,
+            "C8Y_PASSWORD": PASSWORD,
+        }
+
+    def device_env(self) -> Dict[str, str]:
+        """Environment variables used by the device bootstrap script"""
+        return {
+            "C8Y_BASEURL": self.name,
+            "C8Y_HOST": self.name,
+            "C8Y_USER": USER,
+            "C8Y_PASSWORD": PASSWORD,
+        }
+
+    def ca_cert(self) -> bytes:
+        """Get the CA certificate (PEM) of the mock tenant's server certificate"""
+        if self._ca_cert is None:
+            if self.container is None:
+                raise Exception("Mock tenant is not started")
+            exit_code, output = self.container.exec_run(["cat", CA_CERT_PATH])
+            if exit_code != 0:
+                raise Exception(f"Could not read CA certificate. output={output}")
+            self._ca_cert = output
+        return self._ca_cert
+
+    def install_ca(self, device):
+        """Trust the mock tenant's CA on a device. Must be called before the device
+        connects to the cloud.
+
+        Args:
+            device (DockerDeviceAdapter): Device
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cert_file = os.path.join(tmpdir, os.path.basename(DEVICE_CA_CERT_PATH))
+            with open(cert_file, "wb") as file:
+                file.write(self.ca_cert())
+            device.copy_to(cert_file, DEVICE_CA_CERT_PATH)
+        device.assert_command("update-ca-certificates", log_output=False)
@@ -0,0 +1,117 @@
+"""Process-wide docker client and network cache"""
+import logging
+import os
+import threading
+from typing import Dict, Optional
+import docker
+from docker import DockerClient
+from docker.models.networks import Network
+
+# Default number of connections kept open to the docker daemon. The docker sdk
+# default (10) is too small when creating/removing many devices in parallel
+DEFAULT_MAX_POOL_SIZE = 32
+
+_lock = threading.Lock()
+_client: Optional[DockerClient] = None
+_networks: Dict[str, Network] = {}
+
+
+def get_docker_client(max_pool_size: int = None) -> DockerClient:
+    """Get the docker client shared by all factories in this process.
+    The client is created from the environment on first use.
+
+    The client can be used from multiple threads, each request borrows a
+    (keep-alive) connection from the client's connection pool.
+
+    Args:
+        max_pool_size (int, optional): Maximum number of connections to the docker
+            daemon. Only used when the client is created. Defaults to the
+            INTTEST_DOCKER_POOL_SIZE environment variable or DEFAULT_MAX_POOL_SIZE.
+
+    Returns:
+        DockerClient: Docker client
+    """
+    global _client  # pylint: disable=global-statement
+    with _lock:
+        if _client is None:
+            if max_pool_size is None:
+                max_pool_size = int(
+                    os.environ.get("INTTEST_DOCKER_POOL_SIZE", DEFAULT_MAX_POOL_SIZE)
+                )
+            _client = docker.from_env(max_pool_size=max_pool_size)
+            logging.info("Created docker client. max_pool_size=%d", max_pool_size)
+        elif max_pool_size is not None:
+            logging.info(
+                "Docker client already exists, ignoring max_pool_size=%d",
+                max_pool_size,
+            )
+        return _client
+
+
+def get_cached_network(name: str) -> Optional[Network]:
+    """Get a previously resolved network
+
+    Args:
+        name (str): Network name
+
+    Returns:
+        Optional[Network]: Network object. None if the network is not cached
+    """
+    with _lock:
+        return _networks.get(name)
+
+
+def cache_network(name: str, network: Optional[Network]):
+    """Store (or remove) a resolved network
+
+    Args:
+        name (str): Network name
+        network (Optional[Network]): Network object. None to remove it from the cache
+    """
+    with _lock:
+        if network is None:
+            _networks.pop(name, None)
+        else:
+            _networks[name] = network
+
+
+def find_network(docker_client: DockerClient, name: str) -> Optional[Network]:
+    """Find network by name
+
+    Args:
+        docker_client (DockerClient): Docker client
+        name (str): Network name or id
+
+    Returns:
+        Network: Network object
+    """
+    # Note: the filters match on partial names/ids, so an exact comparison
+    # is still required
+    for filters in [{"name": name}, {"id": name}]:
+        for network in docker_client.networks.list(filters=filters):
+            if name in [network.name, network.id]:
+                return network
+    return None
+
+
+def get_or_create_network(docker_client: DockerClient, name: str) -> Network:
+    """Get a (cached) network, or create it if it does not exist
+
+    Args:
+        docker_client (DockerClient): Docker client
+        name (str): Network name
+
+    Returns:
+        Network: Network object
+    """
+    network = get_cached_network(name)
+    if network is not None:
+        return network
+
+    network = find_network(docker_client, name)
+    if network is None:
+        network = docker_client.networks.create(
+            name, driver="bridge", check_duplicate=True
+        )
+    cache_network(name, network)
+    return network
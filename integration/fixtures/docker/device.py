@@ -1,13 +1,29 @@
 """Docker Device Simulator"""
+import json
 import os
 import logging
 from pathlib import Path
-from typing import List, Any, Tuple
+from typing import Callable, Dict, List, Any, Optional, Pattern, TextIO, Tuple, Union
+import threading
 import time
-import tarfile
 from datetime import datetime, timezone
 from docker.models.containers import Container
 from integration.fixtures.device.adapter import DeviceAdapter
+from integration.fixtures.device.journal import JournalEntry, JournalStore
+from integration.fixtures.docker.archive import extract_stream, tar_stream
+from integration.fixtures.docker.artifacts import (
+    DEFAULT_ARTIFACT_PATHS,
+    DEFAULT_MAX_ARTIFACT_SIZE,
+    ArtifactSummary,
+    collect_artifacts,
+)
+from integration.fixtures.docker.events import ContainerEventListener
+from integration.fixtures.docker.log_follower import JournalFollower
+from integration.fixtures.docker.shell import ShellSession, ShellSessionClosed
+from integration.fixtures.docker.stats import StatsSampler
+from integration.fixtures.docker.stream import CommandStream
+from integration.fixtures.mqtt.capture import CAPTURE_TOPICS, MqttCapture
+from integration.fixtures.mqtt.client import Message, MqttClientPool
 
 
 def convert_docker_timestamp(value: str) -> datetime:
@@ -36,14 +52,42 @@ def convert_docker_timestamp(value: str) -> datetime:
     return datetime.strptime(date, "%Y-%m-%dT%H:%M:%S%z")
 
 
+# Additional mosquitto listener (see images/files/inttest-listener.conf) which can be
+# published on the host, so tests can publish messages without a docker exec
+MQTT_HOST_PORT = "1884/tcp"
+
+# Docker events which change the state of a container
+STATE_EVENTS = {"start", "stop", "die", "restart"}
+
+
 class DockerDeviceAdapter(DeviceAdapter):
     """Docker Device"""
 
     # pylint: disable=too-many-public-methods
 
-    def __init__(self, name: str, device_id: str = None):
+    def __init__(
+        self,
+        name: str,
+        device_id: str = None,
+        use_shell_session: bool = False,
+        state_ttl: float = 5.0,
+    ):
         self._name = name
         self._container = None
+        self._cpuset = None
+        self._state = None
+        self._state_time = 0.0
+        self._state_generation = 0
+        self._state_ttl = state_ttl
+        self._state_lock = threading.Lock()
+        self._environment = {}
+        self._use_shell_session = use_shell_session
+        self._shell_session = None
+        self._shell_session_lock = threading.Lock()
+        self._log_follower = None
+        self._stats_sampler = None
+        self._mqtt_client = None
+        self._capture = None
         self.simulator = None
         self._start_time = None
         self._test_start_time = datetime.now(timezone.utc)
@@ -62,6 +106,132 @@ class DockerDeviceAdapter(DeviceAdapter):
     @container.setter
     def container(self, container: Container):
         self._container = container
+        self.invalidate_state()
+
+    @property
+    def cpuset(self) -> Optional[str]:
+        """Cpus which the container is pinned to, e.g. 2-3
+
+        Returns:
+            Optional[str]: Cpu set, or None if the container is not pinned
+        """
+        return self._cpuset
+
+    @cpuset.setter
+    def cpuset(self, cpuset: Optional[str]):
+        self._cpuset = cpuset
+
+    @property
+    def state_ttl(self) -> float:
+        """Maximum age (in seconds) of the cached container state. The cache is
+        also invalidated by docker events if watch_events() has been called.
+
+        Returns:
+            float: Time to live in seconds
+        """
+        return self._state_ttl
+
+    @state_ttl.setter
+    def state_ttl(self, ttl: float):
+        self._state_ttl = ttl
+
+    def invalidate_state(self):
+        """Discard the cached container state, so it is read again on next use"""
+        with self._state_lock:
+            self._state = None
+            self._state_generation += 1
+
+    def watch_events(self, listener: ContainerEventListener):
+        """Invalidate the cached container state when the container is started,
+        stopped or restarted
+
+        Args:
+            listener (ContainerEventListener): Docker event listener
+        """
+        listener.subscribe(self.container.id, self._on_container_event)
+
+    def _on_container_event(self, event: Dict[str, Any] = None):
+        # No event means the events stream ended, so changes may have been missed
+        if event is None or event.get("Action", event.get("status")) in STATE_EVENTS:
+            self.invalidate_state()
+
+    @property
+    def container_state(self) -> Dict[str, Any]:
+        """Container state (as provided by docker inspect). The state is cached
+        for up to state_ttl seconds, or until a docker event invalidates it
+
+        Returns:
+            Dict[str, Any]: Container state, e.g. Status, StartedAt etc.
+        """
+        with self._state_lock:
+            if (
+                self._state is not None
+                and time.monotonic() - self._state_time < self._state_ttl
+            ):
+                return self._state
+            generation = self._state_generation
+
+        now = time.monotonic()
+        self.container.reload()
+        state = self.container.attrs["State"]
+
+        with self._state_lock:
+            # Don't cache the state if it was invalidated while it was being read
+            if generation == self._state_generation:
+                self._state, self._state_time = state, now
+        return state
+
+    @property
+    def environment(self) -> Dict[str, str]:
+        """Additional environment variables passed to each executed command
+
+        Returns:
+            Dict[str, str]: Environment variables
+        """
+        return self._environment
+
+    @environment.setter
+    def environment(self, environment: Dict[str, str]):
+        self._environment = environment or {}
+
+    @property
+    def use_shell_session(self) -> bool:
+        """Execute shell commands via a long-lived shell session instead of
+        creating a new docker exec for each command
+
+        Returns:
+            bool: Shell session is used
+        """
+        return self._use_shell_session
+
+    @use_shell_session.setter
+    def use_shell_session(self, enabled: bool):
+        self._use_shell_session = enabled
+        if not enabled:
+            self.close_shell_session()
+
+    def _get_shell_session(self) -> ShellSession:
+        with self._shell_session_lock:
+            if self._shell_session is None or self._shell_session.closed:
+                self._shell_session = ShellSession(self.container, self._environment)
+            return self._shell_session
+
+    def close_shell_session(self):
+        """Stop the shell session (if running)"""
+        with self._shell_session_lock:
+            session, self._shell_session = self._shell_session, None
+        if session is not None:
+            session.close()
+
+    def _run_in_shell_session(self, func):
+        try:
+            return func(self._get_shell_session())
+        except ShellSessionClosed as ex:
+            if ex.command_sent:
+                raise
+            # The shell ended while idle (e.g. device was restarted), so use a new one
+            logging.info("Shell session closed, starting a new one. %s", ex)
+            return func(self._get_shell_session())
 
     @property
     def is_existing_device(self) -> bool:
@@ -106,8 +276,7 @@ class DockerDeviceAdapter(DeviceAdapter):
         Returns:
             datetime: Device start time. None if the container does not exist
         """
-        self.container.reload()
-        return convert_docker_timestamp(self.container.attrs["State"]["StartedAt"])
+        return convert_docker_timestamp(self.container_state["StartedAt"])
 
     def get_uptime(self) -> int:
         """Get device uptime in seconds
@@ -127,6 +296,36 @@ class DockerDeviceAdapter(DeviceAdapter):
         """
         return self.container.stats(stream=False)
 
+    @property
+    def stats_sampler(self) -> StatsSampler:
+        """Background resource usage sampler. None if it has not been started
+
+        Returns:
+            StatsSampler: Stats sampler
+        """
+        return self._stats_sampler
+
+    def start_stats_sampler(self, capacity: int = 3600) -> StatsSampler:
+        """Start sampling the container resource usage (cpu, memory, network and
+        block io) in the background, using a single docker stats stream
+
+        Args:
+            capacity (int, optional): Maximum number of samples (one per second) to keep.
+                Defaults to 3600.
+
+        Returns:
+            StatsSampler: Stats sampler
+        """
+        if self._stats_sampler is None:
+            self._stats_sampler = StatsSampler(self.container, capacity=capacity)
+        self._stats_sampler.start()
+        return self._stats_sampler
+
+    def stop_stats_sampler(self):
+        """Stop sampling the resource usage. The collected samples are kept"""
+        if self._stats_sampler is not None:
+            self._stats_sampler.stop()
+
     def execute_command(
         self, cmd: str, log_output: bool = True, shell: bool = True, **kwargs
     ) -> Tuple[int, Any]:
@@ -144,10 +343,17 @@ class DockerDeviceAdapter(DeviceAdapter):
         Returns:
             Tuple[int, Any]: Docker command output (exit_code, output)
         """
-        if shell:
-            cmd = ["/bin/bash", "-c", cmd]
+        if shell and self._use_shell_session:
+            exit_code, output = self._run_in_shell_session(
+                lambda session: session.run(cmd)
+            )
+        else:
+            if shell:
+                cmd = ["/bin/bash", "-c", cmd]
 
-        exit_code, output = self.container.exec_run(cmd)
+            exit_code, output = self.container.exec_run(
+                cmd, environment=self._environment or None
+            )
         if log_output:
             logging.info(
                 "cmd: %s, exit code: %d, stdout: %s",
@@ -159,6 +365,244 @@ class DockerDeviceAdapter(DeviceAdapter):
             logging.info("cmd: %s, exit code: %d", cmd, exit_code)
         return exit_code, output
 
+    def stream_command(self, cmd: str) -> CommandStream:
+        """Start a shell command and stream its output as it arrives
+
+        Args:
+            cmd (str): Command to execute
+
+        Returns:
+            CommandStream: Command output stream
+        """
+        logging.info("cmd (streaming): %s", cmd)
+        return CommandStream(self.container, cmd, environment=self._environment)
+
+    def wait_for_log(
+        self,
+        pattern: Union[str, Pattern],
+        unit: str = None,
+        timeout: float = 30,
+        since: datetime = None,
+    ) -> JournalEntry:
+        """Wait for a journal entry matching a pattern. A single journal stream
+        is followed per device (from the start of the test), so waiting for
+        multiple entries does not start additional processes on the device.
+
+        By default only entries which appear after the call are matched. Use
+        since=test_start_time to also match entries since the start of the test.
+
+        Args:
+            pattern (Union[str, Pattern]): Regular expression which the message must contain
+            unit (str, optional): Systemd unit (or glob), e.g. tedge-agent, tedge-*
+            timeout (float, optional): Timeout in seconds. Defaults to 30.
+            since (datetime, optional): Ignore entries before this time. Defaults to
+                the time of the call.
+
+        Raises:
+            TimeoutError: No matching entry appeared within the timeout
+
+        Returns:
+            JournalEntry: Matching entry
+        """
+        if self._log_follower is None:
+            self._log_follower = JournalFollower(
+                self.stream_command, since=self._test_start_time
+            )
+        entry = self._log_follower.wait_for(
+            pattern, unit=unit, timeout=timeout, since=since
+        )
+        logging.info("Found log entry. unit=%s, message=%s", entry.unit, entry.message)
+        return entry
+
+    def mqtt_address(self) -> Tuple[str, int]:
+        """Get the host address of the device's MQTT broker. The device factory
+        must publish the broker port (expose_mqtt=True).
+
+        The host can be overridden using the INTTEST_MQTT_HOST environment variable,
+        e.g. when the docker host is a remote machine.
+
+        Raises:
+            Exception: The broker port is not published
+
+        Returns:
+            Tuple[str, int]: Host and port
+        """
+        self.container.reload()
+        ports = (self.container.attrs["NetworkSettings"].get("Ports") or {}).get(
+            MQTT_HOST_PORT
+        )
+        if not ports:
+            raise Exception(
+                f"MQTT broker port is not published. device={self.name}, "
+                f"port={MQTT_HOST_PORT}"
+            )
+        host = os.environ.get("INTTEST_MQTT_HOST") or ports[0]["HostIp"]
+        if host in ("", "0.0.0.0", "::"):
+            host = "127.0.0.1"
+        return host, int(ports[0]["HostPort"])
+
+    def get_mqtt_client(self, size: int = 1) -> MqttClientPool:
+        """Get a persistent MQTT client connected to the device's broker.
+        The client is reused until the device is restarted or cleaned up.
+
+        Args:
+            size (int, optional): Number of connections used when the client is
+                created. Defaults to 1.
+
+        Returns:
+            MqttClientPool: MQTT client pool
+        """
+        if self._mqtt_client is None:
+            host, port = self.mqtt_address()
+            self._mqtt_client = MqttClientPool(
+                host, port, size=size, client_id_prefix=f"inttest-{self.name}"
+            )
+        return self._mqtt_client
+
+    def close_mqtt_client(self):
+        """Disconnect the MQTT client (if connected)"""
+        if self._mqtt_client is not None:
+            self._mqtt_client.close()
+            self._mqtt_client = None
+
+    @property
+    def capture(self) -> MqttCapture:
+        """MQTT traffic capture. None if it has not been started
+
+        Returns:
+            MqttCapture: MQTT capture
+        """
+        return self._capture
+
+    def start_capture(
+        self, path: str, topics: Tuple[str, ...] = CAPTURE_TOPICS
+    ) -> MqttCapture:
+        """Record the messages of the device's broker to a capture file (in the
+        background). The device factory must publish the broker port (expose_mqtt=True).
+
+        The capture reconnects when the device is restarted, so the messages
+        published during the restart are not recorded.
+
+        Args:
+            path (str): Capture file (see integration.fixtures.mqtt.capture.CaptureReader)
+            topics (Tuple[str, ...], optional): Topic filters. Defaults to c8y/# and tedge/#
+
+        Returns:
+            MqttCapture: MQTT capture
+        """
+        self.stop_capture()
+        self._capture = MqttCapture(self.mqtt_address, path, topics=topics).start()
+        return self._capture
+
+    def stop_capture(self):
+        """Stop recording the MQTT messages. The capture file is kept"""
+        if self._capture is not None:
+            self._capture.stop()
+
+    def publish(
+        self, topic: str, payload: Union[str, bytes], qos: int = 0, retain: bool = False
+    ):
+        """Publish a message to the device's broker from the host (without a docker exec)
+
+        Args:
+            topic (str): Topic
+            payload (Union[str, bytes]): Payload
+            qos (int, optional): Quality of service. Defaults to 0.
+            retain (bool, optional): Retain the message. Defaults to False.
+        """
+        self.get_mqtt_client().publish(topic, payload, qos=qos, retain=retain)
+
+    def publish_many(
+        self, messages: List[Message], qos: int = 0, timeout: float = 60
+    ) -> int:
+        """Publish many messages to the device's broker from the host
+
+        Example:
+            device.publish_many(
+                [("tedge/measurements", f'{{"temperature": {i}}}') for i in range(10000)]
+            )
+
+        Args:
+            messages (List[Message]): Messages (topic and payload)
+            qos (int, optional): Quality of service. Defaults to 0.
+            timeout (float, optional): Time to wait for all messages to be sent (QoS 0)
+                or acknowledged (QoS 1/2). Defaults to 60.
+
+        Returns:
+            int: Number of published messages
+        """
+        start = time.monotonic()
+        count = self.get_mqtt_client().publish_many(messages, qos=qos, timeout=timeout)
+        duration = time.monotonic() - start
+        logging.info(
+            "Published messages. count=%d, qos=%d, duration=%.3f, rate=%.1f/s",
+            count,
+            qos,
+            duration,
+            count / duration if duration else 0,
+        )
+        return count
+
+    def execute_command_stream(
+        self,
+        cmd: str,
+        on_line: Callable[[str], None] = None,
+        stop_when: Callable[[str], bool] = None,
+        log_output: bool = False,
+    ) -> int:
+        """Execute a shell command and process its output line by line as it arrives.
+        The output is never fully held in memory.
+
+        Args:
+            cmd (str): Command to execute
+            on_line (Callable[[str], None], optional): Called with each output line
+            stop_when (Callable[[str], bool], optional): Stop the command as soon as
+                this returns True for an output line
+            log_output (bool, optional): Log each output line. Defaults to False.
+
+        Returns:
+            int: Exit code. If the command was stopped early, it is the exit code
+                caused by terminating it (e.g. 143)
+        """
+        stream = self.stream_command(cmd)
+        for line in stream.lines():
+            if log_output:
+                logging.info("%s", line)
+            if on_line:
+                on_line(line)
+            if stop_when and stop_when(line):
+                stream.stop()
+                break
+        exit_code = stream.wait()
+        logging.info("cmd (streaming): %s, exit code: %s", cmd, exit_code)
+        return exit_code
+
+    def run_batch(
+        self, cmds: List[str], log_output: bool = True
+    ) -> List[Tuple[int, Any]]:
+        """Execute multiple shell commands (in order) using a single shell session.
+        This avoids the overhead of creating a docker exec for each command.
+
+        Args:
+            cmds (List[str]): Commands to execute
+            log_output (bool, optional): Log the stdout after the commands have executed
+
+        Returns:
+            List[Tuple[int, Any]]: Docker command output (exit_code, output) of each command
+        """
+        results = self._run_in_shell_session(lambda session: session.run_batch(cmds))
+        for cmd, (exit_code, output) in zip(cmds, results):
+            if log_output:
+                logging.info(
+                    "cmd: %s, exit code: %d, stdout: %s",
+                    cmd,
+                    exit_code,
+                    output.decode("utf-8"),
+                )
+            else:
+                logging.info("cmd: %s, exit code: %d", cmd, exit_code)
+        return results
+
     def assert_command(
         self, cmd: str, exp_exit_code: int = 0, log_output: bool = True, **kwargs
     ) -> Any:
@@ -199,15 +643,25 @@ class DockerDeviceAdapter(DeviceAdapter):
         """
         return self._name
 
-    def restart(self):
-        """Restart the docker container"""
+    def restart(self, wait: bool = True, **kwargs):
+        """Restart the docker container
+
+        Args:
+            wait (bool, optional): Wait until the tedge services are ready. The cloud
+                bridge is only waited for if it is configured. Defaults to True.
+            **kwargs (Any, optional): Additional keyword arguments passed to
+                wait_until_ready, e.g. services, bridge or timeout
+        """
         logging.info("Restarting %s", self.name)
-        startup_delay_sec = 1
+        self.close_shell_session()
+        # The published broker port can change when the container is restarted
+        self.close_mqtt_client()
         self.container.stop()
-        if startup_delay_sec > 0:
-            time.sleep(startup_delay_sec)
         logging.info("Starting container %s", self.name)
         self.container.start()
+        self.invalidate_state()
+        if wait:
+            self.wait_until_ready(**kwargs)
 
     def disconnect_network(self):
         """Disconnect the docker container from the network"""
@@ -219,32 +673,79 @@ class DockerDeviceAdapter(DeviceAdapter):
         if self.simulator:
             self.simulator.connect_network(self.container)
 
-    def get_logs(self, since: Any = None) -> List[str]:
-        """Get a list of log entries from the docker container
+    def write_logs(
+        self, file: TextIO, since: Any = None, incremental: bool = True
+    ) -> int:
+        """Stream the log entries from the docker container to a file,
+        without holding all of the entries in memory
+
+        Args:
+            file (TextIO): File to write to
+            since (Any, optional): Get logs since the provided data. Defaults to None.
+            incremental (bool, optional): Only write the entries which are newer than
+                the last incremental call. Defaults to True.
+
+        Returns:
+            int: Number of log entries written
+        """
+        cmd = self._journal_command(since, incremental)
+        stream = self.stream_command(cmd)
+
+        # The cursor is printed as the last line, so hold back one line
+        count = 0
+        previous = None
+        for line in stream.lines():
+            if previous is not None:
+                file.write(previous + "\n")
+                count += 1
+            previous = line
+
+        if previous is not None and not (
+            incremental and self._take_log_cursor(previous)
+        ):
+            file.write(previous + "\n")
+            count += 1
+
+        exit_code = stream.wait()
+        if exit_code != 0:
+            logging.warning(
+                "Could not retrieve journalctl logs. cmd=%s, exit_code=%s",
+                cmd,
+                exit_code,
+            )
+        return count
+
+    def get_journal(self, since: Any = None, incremental: bool = False) -> JournalStore:
+        """Get the log entries as structured data (in a compact columnar store).
+        The entries are parsed as they are streamed from the container
 
         Args:
-            timestamps (bool, optional): Included timestamps in the log entries. Defaults to False.
             since (Any, optional): Get logs since the provided data. Defaults to None.
+            incremental (bool, optional): Only get the entries which are newer than
+                the last incremental call. Defaults to False.
 
         Returns:
-            List[str]: List of log entries
+            JournalStore: Journal entries
         """
-        cmd = "journalctl --lines 100000 --no-pager -u 'tedge*' -u 'c8y*' -u mosquitto"
+        cmd = self._journal_command(since, incremental, structured=True)
+        stream = self.stream_command(cmd)
 
-        output = []
-        if since:
-            cmd += f' --since "{since}"'
-        exit_code, logs = self.execute_command(cmd, log_output=False)
+        store = JournalStore()
+        for line in stream.lines():
+            if line.strip():
+                store.append_json(json.loads(line))
 
+        exit_code = stream.wait()
         if exit_code != 0:
             logging.warning(
-                "Could not retrieve journalctl logs. cmd=%d, exit_code=%d",
+                "Could not retrieve journalctl logs. cmd=%s, exit_code=%s",
                 cmd,
                 exit_code,
             )
-        output.extend(logs.decode("utf8").splitlines())
 
-        return output
+        if incremental and store.cursor:
+            self._log_cursor = store.cursor
+        return store
 
     def get_id(self) -> str:
         """Get the device id
@@ -256,7 +757,10 @@ class DockerDeviceAdapter(DeviceAdapter):
             str: Device id
         """
         (code, output) = self.container.exec_run(
-            'sh -c "tedge config get device.id"', stderr=True, demux=True
+            'sh -c "tedge config get device.id"',
+            stderr=True,
+            demux=True,
+            environment=self._environment or None,
         )
         stdout, stderr = output
         if code != 0:
@@ -270,29 +774,95 @@ class DockerDeviceAdapter(DeviceAdapter):
         logging.info("Device id: %s", device_id)
         return device_id
 
-    def copy_to(self, src: str, dst: str):
-        """Copy file to the device
+    def copy_to(self, src: str, dst: str, compression: str = ""):
+        """Copy a file or directory to the device. The archive is streamed to
+        the container, so large files are not loaded into memory.
 
         Args:
-            src (str): Source file (on host)
-            dst (str): Destination (in container)
+            src (str): Source file or directory (on host)
+            dst (str): Destination (in container). If it is an existing directory
+                (or ends with "/"), then the source is copied into this directory
+                under its own name. Otherwise it is the path of the copy.
+            compression (str, optional): Compress the transferred archive,
+                e.g. gz, bz2, xz. Defaults to no compression.
+
+        Raises:
+            Exception: The archive could not be copied to the container
         """
-        abs_src = os.path.abspath(src)
-        owd = os.getcwd()
-        os.chdir(os.path.dirname(src))
-        src_name = os.path.basename(src)
+        if dst.endswith("/") or self.container.exec_run(["test", "-d", dst])[0] == 0:
+            dst_dir, arcname = dst, os.path.basename(os.path.normpath(src))
+        else:
+            dst_dir, arcname = os.path.split(dst)
+
+        logging.info("Copying %s to %s:%s", src, self.name, dst)
+        stream = tar_stream(src, arcname, compression=compression)
+        try:
+            copied = self.container.put_archive(dst_dir or "/", stream)
+        finally:
+            # Stops the archive writer if the stream was not fully consumed
+            stream.close()
+        if not copied:
+            raise Exception(f"Could not copy {src} to {self.name}:{dst}")
+
+    def copy_from(self, src: str, dst: str) -> Path:
+        """Copy a file or directory from the device. The archive is extracted
+        while it is being received, so large files are not loaded into memory.
 
-        with tarfile.open(abs_src + ".tar", mode="w") as tar:
-            tar.add(src_name)
+        Args:
+            src (str): Source file or directory (in container)
+            dst (str): Destination (on host). If it is an existing directory, then
+                the source is copied into this directory
 
-        data = Path(abs_src + ".tar").read_bytes()
-        self.container.put_archive(os.path.dirname(dst), data)
+        Returns:
+            Path: Path of the copied file or directory
+        """
+        logging.info("Copying %s:%s to %s", self.name, src, dst)
+        chunks, stat = self.container.get_archive(src, chunk_size=None)
+        dst_path = Path(dst)
+        if dst_path.is_dir():
+            dst_path = dst_path / stat["name"]
+        extract_stream(chunks, dst_path.parent, stat["name"], dst_path.name)
+        return dst_path
+
+    def collect_artifacts(
+        self,
+        dst: str,
+        paths: List[str] = DEFAULT_ARTIFACT_PATHS,
+        max_size: Union[str, int] = DEFAULT_MAX_ARTIFACT_SIZE,
+    ) -> ArtifactSummary:
+        """Collect files (e.g. logs and configuration) from the device into a
+        compressed archive, using a single archive request.
 
-        os.remove(abs_src + ".tar")
-        os.chdir(owd)
+        Args:
+            dst (str): Output file (on host), e.g. test_output/device.tar.gz
+            paths (List[str], optional): Files or directories to collect. Paths
+                which do not exist are ignored.
+            max_size (Union[str, int], optional): Maximum total size of the collected
+                files, e.g. 20m. Files exceeding the limit are skipped.
+
+        Returns:
+            ArtifactSummary: Summary of the collected artifacts
+        """
+        summary = collect_artifacts(self.container, dst, paths, max_size)
+        logging.info(
+            "Collected artifacts. device=%s, files=%d, size=%d, duration=%.3f",
+            self.name,
+            summary.files,
+            summary.size,
+            summary.duration,
+        )
+        return summary
 
     def cleanup(self):
         """Cleanup the device. This will be called when the define is no longer needed"""
+        self.close_shell_session()
+        if self._log_follower is not None:
+            self._log_follower.stop()
+            self._log_follower = None
+        self.stop_stats_sampler()
+        self.stop_capture()
+        self.close_mqtt_client()
+
         # Make sure device is connected again after the test
         if self.simulator:
             self.simulator.connect_network(self.container)
@@ -0,0 +1,174 @@
+"""Docker container event listener"""
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from docker import DockerClient
+
+# pylint: disable=broad-except
+
+log = logging.getLogger()
+
+# Called with the decoded docker event, or None if the events stream has ended
+# (so events may have been missed)
+EventCallback = Callable[[Optional[Dict[str, Any]]], None]
+
+
+class ContainerEventListener:
+    """Listen to the docker events stream (in a background thread) and wake
+    any threads which are waiting for a change of a specific container, or call
+    any subscribed callbacks.
+
+    A single listener (and events stream) is shared by all waiters.
+    """
+
+    def __init__(self, client: DockerClient, labels: List[str] = None):
+        """Create a new listener. The listener is not started until start() is called
+
+        Args:
+            client (DockerClient): Docker client
+            labels (List[str], optional): Only listen to events of containers with
+                these labels. Defaults to ["tedge.inttest=1"].
+        """
+        self._client = client
+        self._labels = labels or ["tedge.inttest=1"]
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, List[threading.Event]] = {}
+        self._subscribers: Dict[str, List[EventCallback]] = {}
+        self._stream = None
+        self._thread = None
+
+    @property
+    def is_alive(self) -> bool:
+        """The listener is currently receiving events"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """Start the listener (if not already running)
+
+        The events stream is opened before returning, so any event which occurs
+        after this call is guaranteed to be received.
+
+        Returns:
+            bool: True if the listener is running
+        """
+        with self._lock:
+            if self.is_alive:
+                return True
+            try:
+                self._stream = self._client.events(
+                    decode=True,
+                    filters={
+                        "type": "container",
+                        "label": self._labels,
+                    },
+                )
+            except Exception as ex:
+                log.warning("Could not subscribe to docker events. exception=%s", ex)
+                return False
+
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(self._stream,),
+                name="docker-events",
+                daemon=True,
+            )
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Stop the listener"""
+        with self._lock:
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception as ex:
+                log.debug("Could not close docker events stream. exception=%s", ex)
+
+    def _run(self, stream):
+        try:
+            for event in stream:
+                self._notify(event.get("id", ""), event)
+        except Exception as ex:
+            log.debug("Docker events stream closed. exception=%s", ex)
+        finally:
+            # Wake everyone so they can fall back to polling
+            with self._lock:
+                waiters = [w for items in self._waiters.values() for w in items]
+                callbacks = [c for items in self._subscribers.values() for c in items]
+            for waiter in waiters:
+                waiter.set()
+            for callback in callbacks:
+                self._call(callback, None)
+
+    @staticmethod
+    def _call(callback: EventCallback, event: Optional[Dict[str, Any]]):
+        try:
+            callback(event)
+        except Exception as ex:
+            log.warning("Docker event callback failed. exception=%s", ex)
+
+    def _notify(self, container_id: str, event: Dict[str, Any] = None):
+        with self._lock:
+            waiters = list(self._waiters.get(container_id, []))
+            callbacks = list(self._subscribers.get(container_id, []))
+        for waiter in waiters:
+            waiter.set()
+        for callback in callbacks:
+            self._call(callback, event)
+
+    def subscribe(self, container_id: str, callback: EventCallback):
+        """Call a function for each event of a container (from the listener thread).
+        The callback is also called with None when the events stream ends.
+
+        Args:
+            container_id (str): Container id
+            callback (EventCallback): Function called with the decoded event
+        """
+        with self._lock:
+            self._subscribers.setdefault(container_id, []).append(callback)
+
+    def unsubscribe(self, container_id: str, callback: EventCallback = None):
+        """Remove a callback (or all callbacks) of a container
+
+        Args:
+            container_id (str): Container id
+            callback (EventCallback, optional): Callback to remove. Defaults to
+                all callbacks of the container.
+        """
+        with self._lock:
+            items = self._subscribers.get(container_id, [])
+            if callback is not None and callback in items:
+                items.remove(callback)
+            if callback is None or not items:
+                self._subscribers.pop(container_id, None)
+
+    @contextmanager
+    def watch(self, container_id: str) -> Iterator[threading.Event]:
+        """Register interest in the events of a container
+
+        Example:
+            with listener.watch(container.id) as changed:
+                changed.wait(timeout)
+
+        Args:
+            container_id (str): Container id
+
+        Yields:
+            threading.Event: Event which is set when the container emits a docker
+                event (or the listener stops). It should be cleared by the caller
+                after handling it.
+        """
+        waiter = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(container_id, []).append(waiter)
+        try:
+            yield waiter
+        finally:
+            with self._lock:
+                items = self._waiters.get(container_id, [])
+                if waiter in items:
+                    items.remove(waiter)
+                if not items:
+                    self._waiters.pop(container_id, None)
@@ -1,30 +1,108 @@
 """Device fixture"""
 
+import hashlib
 import logging
 import os
+import threading
 import time
+import uuid
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import Dict, Optional, Union
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Union
 import dotenv
-import docker
-from docker.errors import NotFound, APIError
+from docker.errors import NotFound, APIError, ImageNotFound
+from docker import DockerClient
 from docker.models.containers import Container
-from docker.models.networks import Network
-from integration.fixtures.docker.device import DockerDeviceAdapter
+from integration.fixtures.docker.batch import (
+    BatchCreationResult,
+    DeviceCreationResult,
+    RemovalSummary,
+)
+from integration.fixtures.docker.client import (
+    cache_network,
+    find_network,
+    get_docker_client,
+    get_or_create_network,
+)
+from integration.fixtures.docker.artifacts import (
+    DEFAULT_ARTIFACT_PATHS,
+    DEFAULT_MAX_ARTIFACT_SIZE,
+    ArtifactSummary,
+)
+from integration.fixtures.docker.device import MQTT_HOST_PORT, DockerDeviceAdapter
+from integration.fixtures.docker.events import ContainerEventListener
+from integration.fixtures.docker.pool import DevicePool
+from integration.fixtures.docker.resources import (
+    CpuAllocator,
+    HostScheduler,
+    ResourceProfile,
+    get_profile,
+)
 
 # pylint: disable=broad-except
 
 log = logging.getLogger()
 
+# Command used to prepare pooled containers. It installs tedge but does not
+# register the device in the cloud, as the device id is not known yet
+POOL_PREPARE_COMMAND = "command -v tedge >/dev/null || /demo/install-tedge.sh apt"
+
+# Images with tedge already installed (but not registered in the cloud)
+INSTALLED_IMAGE_REPOSITORY = "tedge-installed"
+INSTALL_SCRIPT = Path(__file__).parents[3] / "images" / "install-tedge.sh"
+
+# Resolved installed image tags (by cache key), shared by all factories
+_installed_images: Dict[str, str] = {}
+_installed_images_lock = threading.Lock()
+
+# Lock per cache key, so only builds of the same image wait for each other
+_installed_image_locks: Dict[str, threading.Lock] = {}
+# Resolved latest tedge versions (by base image id)
+_candidate_versions: Dict[str, str] = {}
+
+
+def container_name(container: Container) -> str:
+    """Get the name of a container. Containers from a sparse list call do not
+    have the name attribute set, so the name is taken from the list result
+
+    Args:
+        container (Container): Container
+
+    Returns:
+        str: Container name
+    """
+    if container.name:
+        return container.name
+    names = container.attrs.get("Names") or [""]
+    return names[0].lstrip("/")
+
 
 class DockerDeviceFactory:
     """Test device fixture to use in integration tests"""
 
-    def __init__(self, keep_containers=False, force_network_recreate: bool = False):
-        self._docker_client = docker.from_env()
+    def __init__(
+        self,
+        keep_containers=False,
+        force_network_recreate: bool = False,
+        cache_images: bool = False,
+        docker_client: DockerClient = None,
+        scheduler: HostScheduler = None,
+        cpu_allocator: CpuAllocator = None,
+        expose_mqtt: bool = False,
+        mqtt_host_ip: str = "127.0.0.1",
+    ):
+        self._docker_client = docker_client or get_docker_client()
         self._network_name = os.environ.get("INTTEST_NETWORK", "inttest-network")
         self._force_network_recreate = force_network_recreate
         self._keep_containers = keep_containers
+        self._cache_images = cache_images
+        self._scheduler = scheduler
+        self._cpu_allocator = cpu_allocator
+        self._expose_mqtt = expose_mqtt
+        self._mqtt_host_ip = mqtt_host_ip
 
         self._network = self._create_network()
 
@@ -39,30 +117,42 @@ class DockerDeviceFactory:
 
         self._device_containers = {}
 
-    def _create_network(self):
-        network = self._find_network(self._network_name)
+        # Memory reservations (see HostScheduler) of the live containers
+        self._reservations: Dict[str, int] = {}
 
-        if self._force_network_recreate and network is not None:
-            try:
-                for container in network.containers:
-                    try:
-                        network.disconnect(container, force=True)
-                    except Exception as ex:
-                        logging.warning(
-                            "Could not disconnect container. exception=%s", ex
-                        )
-            except Exception as ex:
-                logging.warning("Could not access network containers. exception=%s", ex)
-            network.remove()
-            logging.info("Removed network: %s", self._network_name)
-            network = None
+        # Ids of the containers which are known to be connected to the network
+        self._network_members: Set[str] = set()
+        self._network_members_lock = threading.Lock()
 
-        if network is None:
-            network = self._docker_client.networks.create(
-                self._network_name, driver="bridge", check_duplicate=True
-            )
+        self._pool = None
+        self._pool_key = None
+        self._events = ContainerEventListener(
+            self._docker_client, labels=["tedge.inttest=1"]
+        )
 
-        return network
+    def _create_network(self):
+        if self._force_network_recreate:
+            network = find_network(self._docker_client, self._network_name)
+            if network is not None:
+                cache_network(self._network_name, None)
+                try:
+                    # Network objects from the list call do not include the containers
+                    network.reload()
+                    for container in network.containers:
+                        try:
+                            network.disconnect(container, force=True)
+                        except Exception as ex:
+                            logging.warning(
+                                "Could not disconnect container. exception=%s", ex
+                            )
+                except Exception as ex:
+                    logging.warning(
+                        "Could not access network containers. exception=%s", ex
+                    )
+                network.remove()
+                logging.info("Removed network: %s", self._network_name)
+
+        return get_or_create_network(self._docker_client, self._network_name)
 
     def create_device(
         self,
@@ -73,6 +163,8 @@ class DockerDeviceFactory:
         test_suite: str = "",
         test_id: str = "",
         env: Dict[str, str] = None,
+        timings: Dict[str, float] = None,
+        profile: Union[str, ResourceProfile] = "default",
     ) -> DockerDeviceAdapter:
         """Create a new device (container) from the provided image
 
@@ -91,7 +183,14 @@ class DockerDeviceFactory:
             env (Dict[str,str], optional): Additional environment variables to be added to
                 the container.
                 These will override any values provided by the env_file. (docker devices only!).
+                When the device is served from the pool (see enable_pool), these, and
+                the device id, are only passed to the commands executed via the adapter.
                 Defaults to None.
+            timings (Dict[str, float], optional): Populated with the duration (in seconds)
+                of each creation phase (admit, create, start, network). Defaults to None.
+            profile (Union[str, ResourceProfile], optional): Resource profile (or name of
+                a profile in PROFILES) used for the container. Ignored when the device is
+                served from the pool. Defaults to 'default'.
 
         Returns:
             DockerDeviceAdapter: The docker device simulator
@@ -101,27 +200,253 @@ class DockerDeviceFactory:
         env_options["DEVICE_ID"] = device_id
         env_options["DEVICE_TYPE"] = device_type
 
+        if self._expose_mqtt:
+            # Enable the broker listener for the test runner (see inttest-listener.sh)
+            env_options["INTTEST_EXPOSE_MQTT"] = "1"
+
         if env is not None:
             logging.info("Using custom environment settings. %s", env)
             env_options = {**env_options, **env}
 
+        if timings is None:
+            timings = {}
+
+        # check for existing container
+        self.remove_device(device_id)
+
+        container = self._acquire_pool_container(image, env_file, test_suite)
+        cpuset = None
+
+        # Pooled containers already exist, so no admission is required
+        with self._admitted(
+            None if container else get_profile(profile), device_id, timings
+        ):
+            phase_start = time.monotonic()
+            if container is not None:
+                cpuset = self._assign_pool_container(container, device_id)
+            else:
+                logging.info(
+                    "Creating new container [%s] with device type [%s]",
+                    device_id,
+                    device_type,
+                )
+                container = self._start_container(
+                    self.get_installed_image(image) if self._cache_images else image,
+                    device_id,
+                    env_options,
+                    labels={
+                        "tedge.device_id": device_id,
+                        "tedge.test_group_id": test_suite,
+                        "tedge.test_id": test_id,
+                    },
+                    profile=get_profile(profile),
+                )
+
+            self._device_containers[device_id] = container
+            test_start = datetime.now(timezone.utc)
+            timings["create"] = time.monotonic() - phase_start
+
+            # Wait for container to be ready
+            phase_start = time.monotonic()
+            self.wait_for_container_running(container, timeout=30)
+            timings["start"] = time.monotonic() - phase_start
+
+            device = DockerDeviceAdapter(device_id)
+            device.test_start_time = test_start
+            device.container = container
+            device.cpuset = cpuset or container.labels.get("tedge.cpuset")
+            device.simulator = self
+            if self._events.start():
+                device.watch_events(self._events)
+            if container.labels.get("tedge.pool") == "1":
+                # The container environment was fixed when the pooled container was
+                # created, so pass the device specific values to each command instead
+                device.environment = {
+                    "DEVICE_ID": device_id,
+                    "DEVICE_TYPE": device_type,
+                    **(env or {}),
+                }
+
+            phase_start = time.monotonic()
+            self.connect_network(container)
+            timings["network"] = time.monotonic() - phase_start
+        return device
+
+    def _assign_pool_container(
+        self, container: Container, device_id: str
+    ) -> Optional[str]:
+        """Assign a pooled container to a device by renaming it, and pin it to
+        dedicated cpus (if cpu pinning is enabled)
+
+        Idle pooled containers are not pinned, so that they do not hold any cpus.
+        The tedge.cpuset label can not be added later, so the assignment is only
+        available via the device adapter.
+
+        Args:
+            container (Container): Pooled container
+            device_id (str): Device id (new container name)
+
+        Returns:
+            Optional[str]: Cpuset of the container, or None if it is not pinned
+        """
+        cpuset = None
+        if self._cpu_allocator is not None:
+            cpuset = self._cpu_allocator.allocate(device_id)
+        try:
+            if cpuset:
+                container.update(cpuset_cpus=cpuset)
+            container.rename(device_id)
+        except Exception:
+            if cpuset:
+                self._cpu_allocator.release(device_id)
+            raise
+        if container.name in self._reservations:
+            self._reservations[device_id] = self._reservations.pop(container.name)
+        return cpuset
+
+    @contextmanager
+    def _admitted(
+        self,
+        profile: Optional[ResourceProfile],
+        name: str,
+        timings: Dict[str, float] = None,
+    ) -> Iterator[None]:
+        """Wait for the scheduler to admit a new container with the given profile.
+        If the context exits without an error, the reservation is kept until the
+        container is removed (see remove_device), otherwise it is released.
+        Does nothing if there is no scheduler or profile.
+
+        Args:
+            profile (Optional[ResourceProfile]): Resource profile of the new container
+            name (str): Container name
+            timings (Dict[str, float], optional): Populated with the admission time
+        """
+        if self._scheduler is None or profile is None:
+            yield
+            return
+
+        phase_start = time.monotonic()
+        reservation = self._scheduler.admit(profile)
+        if timings is not None:
+            timings["admit"] = time.monotonic() - phase_start
+        try:
+            yield
+        except BaseException:
+            self._scheduler.release(reservation)
+            raise
+        self._reservations[name] = reservation
+
+    def create_devices(
+        self,
+        count: int = 0,
+        device_ids: List[str] = None,
+        prefix: str = "tedge",
+        bootstrap_cmd: str = None,
+        max_workers: int = 8,
+        **kwargs,
+    ) -> BatchCreationResult:
+        """Create multiple devices concurrently
+
+        Each device is created, started, connected to the network and
+        (optionally) bootstrapped in a worker thread. A failure of one device
+        does not stop the creation of the others.
+
+        Args:
+            count (int, optional): Number of devices to create. The device ids are
+                generated from the prefix. Ignored if device_ids is given.
+            device_ids (List[str], optional): Device ids of the devices to create.
+            prefix (str, optional): Prefix used for generated device ids. Defaults to 'tedge'.
+            bootstrap_cmd (str, optional): Command to run on each device once started,
+                e.g. '/demo/bootstrap.sh'. Defaults to None.
+            max_workers (int, optional): Maximum number of devices created in parallel.
+                Defaults to 8.
+            **kwargs (Any, optional): Additional keyword arguments passed to create_device
+
+        Returns:
+            BatchCreationResult: Results (in the requested order) including the timing
+                of each phase
+        """
+        if device_ids is None:
+            device_ids = [f"{prefix}-{i:03d}" for i in range(count)]
+
+        def create(device_id: str) -> DeviceCreationResult:
+            result = DeviceCreationResult(device_id)
+            try:
+                result.device = self.create_device(
+                    device_id, timings=result.timings, **kwargs
+                )
+                if bootstrap_cmd:
+                    phase_start = time.monotonic()
+                    result.device.assert_command(bootstrap_cmd, log_output=False)
+                    result.timings["bootstrap"] = time.monotonic() - phase_start
+            except Exception as ex:
+                logging.error(
+                    "Failed to create device. device_id=%s, exception=%s",
+                    device_id,
+                    ex,
+                )
+                result.error = ex
+            return result
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(device_ids))),
+            thread_name_prefix="create-device",
+        ) as executor:
+            results = list(executor.map(create, device_ids))
+
+        batch = BatchCreationResult(results, duration=time.monotonic() - start)
+        logging.info(
+            "Created devices. total=%d, failed=%d, duration=%.3f, phases=%s",
+            len(results),
+            len(batch.failed),
+            batch.duration,
+            batch.phase_summary(),
+        )
+        return batch
+
+    def _start_container(
+        self,
+        image: str,
+        name: str,
+        env_options: Dict[str, str],
+        labels: Dict[str, str] = None,
+        profile: ResourceProfile = None,
+        pin_cpus: bool = True,
+    ) -> Container:
+        """Start a new device container
+
+        Args:
+            image (str): Docker image
+            name (str): Container name
+            env_options (Dict[str, str]): Container environment variables
+            labels (Dict[str, str], optional): Additional container labels
+            profile (ResourceProfile, optional): Resource profile. Defaults to the
+                default profile.
+            pin_cpus (bool, optional): Assign dedicated cpus to the container (if cpu
+                pinning is enabled). Defaults to True.
+
+        Returns:
+            Container: Container
+        """
+        profile = get_profile(profile)
+        labels = dict(labels or {})
+        pin_cpus = pin_cpus and self._cpu_allocator is not None
+        if pin_cpus:
+            # Dedicated cpus for reproducible performance measurements
+            profile = replace(profile, cpuset_cpus=self._cpu_allocator.allocate(name))
+            labels["tedge.cpuset"] = profile.cpuset_cpus
+            labels["tedge.runner_cpuset"] = self._cpu_allocator.runner_cpuset
+
         options = {
-            "name": device_id,
+            "name": name,
             "detach": True,
             "tty": True,
             "environment": env_options,
             "restart_policy": {
                 "Name": "always",
             },
-            "tmpfs": {
-                # support a non-persistent directories to mimic behaviour of real devices
-                # /tmp is needed to make the reboot detection work, as the `uptime` shows the hosts
-                # uptime and not the container's
-                "/tmp": "size=64m",
-                "/run": "size=64m",
-            },
             "read_only": False,
-            "mem_limit": "128m",
             "network": self._network.id,
             "volumes": {
                 # Required when running as systemd service
@@ -129,40 +454,292 @@ class DockerDeviceFactory:
             },
             "labels": {
                 "tedge.inttest": "1",
-                "tedge.device_id": device_id,
-                "tedge.test_group_id": test_suite,
-                "tedge.test_id": test_id,
+                "tedge.profile": profile.name,
+                **labels,
             },
-            "privileged": True,
+            **profile.container_options(),
         }
+        if self._expose_mqtt:
+            # Publish the broker on an ephemeral host port
+            options["ports"] = {MQTT_HOST_PORT: (self._mqtt_host_ip, None)}
+        try:
+            container = self._docker_client.containers.run(image, None, **options)
+        except Exception:
+            if pin_cpus:
+                self._cpu_allocator.release(name)
+            raise
+        self._set_network_member(container, True)
+        return container
+
+    def get_installed_image(self, image: str, tedge_version: str = None) -> str:
+        """Get an image based on the given image which already has tedge installed
+        (but not registered in the cloud). The image is built on first use by
+        running the install script in a container and committing it.
+
+        The image tag is a hash of the install script, the tedge version and the
+        base image id, so changing any of them results in a new image. If no version
+        is given, the latest version is resolved from the apt repository first, so a
+        new release also results in a new image. If it can not be resolved (e.g. the
+        repository is not reachable), the last image built without a version is
+        reused. Remove the images to force a rebuild, e.g.
+        docker image rm $(docker images -q --filter label=tedge.inttest.image=1)
+
+        Args:
+            image (str): Base image
+            tedge_version (str, optional): tedge version to install. Defaults to
+                the TEDGE_VERSION environment variable, or latest if not set.
+
+        Returns:
+            str: Image tag
+        """
+        if tedge_version is None:
+            tedge_version = os.environ.get("TEDGE_VERSION", "")
+
+        base_image_id = self._docker_client.images.get(image).id
+        key_version = tedge_version or self._resolve_tedge_version(image, base_image_id)
+        key = hashlib.sha256(
+            b"\0".join(
+                [
+                    INSTALL_SCRIPT.read_bytes(),
+                    key_version.encode("utf8"),
+                    base_image_id.encode("utf8"),
+                ]
+            )
+        ).hexdigest()[:16]
+        tag = f"{INSTALLED_IMAGE_REPOSITORY}:{key}"
+
+        with _installed_images_lock:
+            if key in _installed_images:
+                return _installed_images[key]
+            image_lock = _installed_image_locks.setdefault(key, threading.Lock())
+
+        with image_lock:
+            with _installed_images_lock:
+                if key in _installed_images:
+                    return _installed_images[key]
+
+            try:
+                self._docker_client.images.get(tag)
+                logging.info("Using cached installed image. image=%s", tag)
+            except ImageNotFound:
+                self._build_installed_image(image, key, key_version)
+
+            with _installed_images_lock:
+                _installed_images[key] = tag
+            return tag
+
+    def _resolve_tedge_version(self, image: str, base_image_id: str) -> str:
+        """Resolve the tedge version which would be installed in the given image
+        (the candidate version of the apt repository). The result is cached per
+        base image for the lifetime of the process.
+
+        Args:
+            image (str): Base image
+            base_image_id (str): Id of the base image
+
+        Returns:
+            str: tedge version. Empty if it could not be resolved
+        """
+        with _installed_images_lock:
+            if base_image_id in _candidate_versions:
+                return _candidate_versions[base_image_id]
+
+        version = ""
+        try:
+            # Use the local install script, as it is also part of the cache key
+            output = self._docker_client.containers.run(
+                image,
+                [
+                    "/bin/bash",
+                    "-c",
+                    INSTALL_SCRIPT.read_text(encoding="utf8"),
+                    "install-tedge.sh",
+                    "apt-version",
+                ],
+                environment={"TEDGE_VERSION": ""},
+                remove=True,
+                stdout=True,
+                stderr=False,
+            )
+            version = output.decode("utf8").strip()
+            if version == "(none)":
+                version = ""
+        except Exception as ex:
+            log.warning("Could not resolve the tedge version. image=%s, %s", image, ex)
+
+        if not version:
+            log.warning(
+                "Unknown tedge version, the latest installed image is reused. image=%s",
+                image,
+            )
+        with _installed_images_lock:
+            _candidate_versions[base_image_id] = version
+        return version
+
+    def _build_installed_image(self, image: str, key: str, tedge_version: str):
+        """Install tedge in a container and commit it as a new image
+
+        Args:
+            image (str): Base image
+            key (str): Cache key (used as the image tag)
+            tedge_version (str): tedge version to install. Empty for latest
+        """
+        start = time.monotonic()
+        logging.info("Building installed image. base=%s, key=%s", image, key)
+        # Not pinned, as the cpuset labels would be inherited by the image
+        container = self._start_container(
+            image, f"inttest-image-{key}", {}, pin_cpus=False
+        )
+        try:
+            self.wait_for_container_running(container, timeout=30)
+            exit_code, output = container.exec_run(
+                [
+                    "/bin/bash",
+                    "-c",
+                    "/demo/install-tedge.sh apt && apt-get clean && : > /etc/machine-id",
+                ],
+                environment={"TEDGE_VERSION": tedge_version},
+            )
+            if exit_code != 0:
+                raise Exception(
+                    f"Failed to install tedge. image={image}, code={exit_code}, "
+                    f"output={output.decode('utf8', 'replace')}"
+                )
+
+            _, installed_version = container.exec_run(
+                ["dpkg-query", "--show", "--showformat=${Version}", "tedge"]
+            )
+            container.commit(
+                repository=INSTALLED_IMAGE_REPOSITORY,
+                tag=key,
+                conf={
+                    # The container labels are merged into the image labels, so
+                    # clear the ones which only apply to the build container
+                    "Labels": {
+                        "tedge.inttest": "",
+                        "tedge.profile": "",
+                        "tedge.inttest.image": "1",
+                        "tedge.base_image": image,
+                        "tedge.version": installed_version.decode("utf8").strip(),
+                    },
+                },
+            )
+        finally:
+            self.remove_device(container)
 
         logging.info(
-            "Creating new container [%s] with device type [%s]", device_id, device_type
+            "Built installed image. image=%s:%s, duration=%.3f",
+            INSTALLED_IMAGE_REPOSITORY,
+            key,
+            time.monotonic() - start,
         )
 
-        # check for existing container
-        self.remove_device(device_id)
+    def enable_pool(
+        self,
+        size: int,
+        image: str = "debian-systemd",
+        env_file=".env",
+        test_suite: str = "",
+        prepare_cmd: str = POOL_PREPARE_COMMAND,
+    ) -> DevicePool:
+        """Keep a pool of containers which are already created and prepared
+        (but not registered in the cloud) so that create_device does not have
+        to wait for them. Only create_device calls using the same image, env_file
+        and test_suite are served from the pool.
 
-        container = self._docker_client.containers.run(image, None, **options)
-        self._device_containers[device_id] = container
-        test_start = datetime.now(timezone.utc)
+        Pooled containers are created before the device id is known, and docker does
+        not allow changing the environment, hostname or labels of a container. So the
+        DEVICE_ID container environment variable and the hostname are pool-scoped
+        (inttest-pool-<id>), and the containers do not have a tedge.device_id label.
+        The device id is only reflected in the container name (the container is
+        renamed when acquired) and in the environment of the commands executed via
+        the adapter. Use the container name (not the hostname, container environment
+        or labels) to identify the device.
 
-        # Wait for container to be ready
-        self.wait_for_container_running(container, timeout=30)
+        Args:
+            size (int): Number of containers to keep ready
+            image (str, optional): Docker image. Defaults to 'debian-systemd'.
+            env_file (str, optional): Environment file to be passed to the containers.
+                Defaults to '.env'.
+            test_suite (str, optional): Test set which the containers belong to.
+            prepare_cmd (str, optional): Command used to prepare each container.
+                Defaults to installing tedge.
 
-        device = DockerDeviceAdapter(device_id)
-        device.test_start_time = test_start
-        device.container = container
-        device.simulator = self
-        self.connect_network(container)
-        return device
+        Returns:
+            DevicePool: Device pool
+        """
+        self.close_pool()
 
-    def remove_device(self, container: Union[str, Container], alias: str = ""):
+        def spawn() -> Container:
+            name = f"inttest-pool-{uuid.uuid4().hex[:12]}"
+            env_options = dotenv.dotenv_values(env_file) or {}
+            env_options["DEVICE_ID"] = name
+            if self._expose_mqtt:
+                env_options["INTTEST_EXPOSE_MQTT"] = "1"
+            with self._admitted(get_profile(None), name):
+                container = self._start_container(
+                    self.get_installed_image(image) if self._cache_images else image,
+                    name,
+                    env_options,
+                    pin_cpus=False,
+                    # The device id is not known yet, and labels can not be changed
+                    # later, so pooled containers do not have a tedge.device_id label
+                    labels={
+                        "tedge.pool": "1",
+                        "tedge.test_group_id": test_suite,
+                    },
+                )
+                try:
+                    self.wait_for_container_running(container, timeout=30)
+                    exit_code, output = container.exec_run(
+                        ["/bin/bash", "-c", prepare_cmd]
+                    )
+                    if exit_code != 0:
+                        raise Exception(
+                            f"Failed to prepare pooled container. name={name}, "
+                            f"code={exit_code}, output={output.decode('utf8', 'replace')}"
+                        )
+                except Exception:
+                    self.remove_device(container)
+                    raise
+            return container
+
+        self._pool_key = (image, env_file, test_suite)
+        self._pool = DevicePool(spawn, self.remove_device, size)
+        logging.info(
+            "Enabled device pool. size=%d, image=%s, test_suite=%s",
+            size,
+            image,
+            test_suite,
+        )
+        return self._pool
+
+    def close_pool(self):
+        """Stop the device pool (if enabled) and remove the unused containers"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+            self._pool_key = None
+
+    def _acquire_pool_container(
+        self, image: str, env_file: str, test_suite: str
+    ) -> Optional[Container]:
+        if self._pool is None or self._pool_key != (image, env_file, test_suite):
+            return None
+        return self._pool.acquire()
+
+    def remove_device(self, container: Union[str, Container], alias: str = "") -> bool:
         """Remove device container
 
+        The container is not explicitly disconnected from the network, as
+        docker does that when force removing it.
+
         Args:
             container (Union[str, Container]): Container, container id or container name
             alias (str): Device alias (i.e. device-01)
+
+        Returns:
+            bool: True if the container was removed (or did not exist)
         """
         if isinstance(container, str):
             name = container
@@ -171,99 +748,191 @@ class DockerDeviceFactory:
                 logging.info(
                     "Container does not exist, so no need to remove it. name=%s", name
                 )
-                return
+                return True
 
+        name = container_name(container)
         logging.info(
             "Found existing container. alias=%s, name=%s, id=%s",
             alias,
-            container.name,
+            name,
             container.id,
         )
-        try:
-            self.disconnect_network(container)
-            logging.info("Disconnected container from the network")
-        except Exception as ex:
-            logging.warning(
-                "Could not remove container from the network. exception=%s", ex
-            )
 
         try:
             container.remove(force=True)
             logging.info(
                 "Removed existing container [alias=%s, name=%s, id=%s]",
                 alias,
-                container.name,
+                name,
                 container.id,
             )
+        except NotFound:
+            logging.info("Container was already removed. id=%s", container.id)
         except Exception as ex:
             logging.error("Failed to remove container. exception=%s", ex)
+            return False
+
+        self._set_network_member(container, False)
+        self._events.unsubscribe(container.id)
+        self._device_containers.pop(alias or name, None)
+        if self._cpu_allocator is not None:
+            self._cpu_allocator.release(alias or name)
+        reservation = self._reservations.pop(alias or name, None)
+        if reservation is not None:
+            self._scheduler.release(reservation)
+        return True
+
+    def remove_devices(
+        self, containers: List[Union[str, Container]], max_workers: int = 16
+    ) -> RemovalSummary:
+        """Remove multiple device containers concurrently
+
+        Args:
+            containers (List[Union[str, Container]]): Containers, container ids or names
+            max_workers (int, optional): Maximum number of containers removed in
+                parallel. Defaults to 16.
+
+        Returns:
+            RemovalSummary: Number of removed/failed containers and the wall time
+        """
+        start = time.monotonic()
+        if not containers:
+            return RemovalSummary()
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(containers))),
+            thread_name_prefix="remove-device",
+        ) as executor:
+            results = list(executor.map(self.remove_device, containers))
 
-    def _find_network(self, name: str) -> Optional[Network]:
-        """Find network by name
+        summary = RemovalSummary(
+            removed=results.count(True),
+            failed=results.count(False),
+            duration=time.monotonic() - start,
+        )
+        logging.info(
+            "Removed containers. removed=%d, failed=%d, duration=%.3f",
+            summary.removed,
+            summary.failed,
+            summary.duration,
+        )
+        return summary
+
+    def collect_artifacts(
+        self,
+        devices: List[DockerDeviceAdapter],
+        output_dir: str = "test_output",
+        prefix: str = "",
+        paths: List[str] = DEFAULT_ARTIFACT_PATHS,
+        max_size: Union[str, int] = DEFAULT_MAX_ARTIFACT_SIZE,
+        max_workers: int = 8,
+    ) -> Dict[str, ArtifactSummary]:
+        """Collect the artifacts (logs, configuration etc.) of multiple devices
+        concurrently. Each device is written to its own compressed archive,
+        <output_dir>/<prefix><device name>.artifacts.tar.gz
 
         Args:
-            name (str): Network name or id
+            devices (List[DockerDeviceAdapter]): Devices
+            output_dir (str, optional): Output directory. Defaults to test_output.
+            prefix (str, optional): Prefix of the archive file names
+            paths (List[str], optional): Files or directories to collect
+            max_size (Union[str, int], optional): Maximum total size of the files
+                collected per device
+            max_workers (int, optional): Maximum number of devices collected in
+                parallel. Defaults to 8.
 
         Returns:
-            Network: Network object
+            Dict[str, ArtifactSummary]: Summary per device name
+        """
+        start = time.monotonic()
+        devices = [device for device in devices if device is not None]
+        if not devices:
+            return {}
+
+        def collect(device: DockerDeviceAdapter) -> ArtifactSummary:
+            return device.collect_artifacts(
+                os.path.join(output_dir, f"{prefix}{device.name}.artifacts.tar.gz"),
+                paths=paths,
+                max_size=max_size,
+            )
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(devices))),
+            thread_name_prefix="collect-artifacts",
+        ) as executor:
+            summaries = dict(
+                zip(
+                    (device.name for device in devices),
+                    executor.map(collect, devices),
+                )
+            )
+
+        logging.info(
+            "Collected artifacts. devices=%d, failed=%d, duration=%.3f",
+            len(summaries),
+            sum(1 for summary in summaries.values() if not summary.ok),
+            time.monotonic() - start,
+        )
+        return summaries
+
+    def _set_network_member(self, container: Container, connected: bool):
+        """Update the local index of containers connected to the network
+
+        Args:
+            container (Container): Container
+            connected (bool): Container is connected to the network
         """
-        for network in self._docker_client.networks.list(greedy=True):
-            if name in [network.name, network.id]:
-                return network
-        return None
+        with self._network_members_lock:
+            if connected:
+                self._network_members.add(container.id)
+            else:
+                self._network_members.discard(container.id)
 
-    def _is_container_connected(self, container: Container) -> bool:
+    def _is_container_connected(
+        self, container: Container, refresh: bool = True
+    ) -> bool:
         """Test if a container is already connected to the network
 
         Args:
             container (Container): Container
+            refresh (bool, optional): Inspect the container instead of only using the
+                local index of connected containers. Defaults to True.
 
         Returns:
             bool: True if the container is already connected to the internal network
         """
-        # Use updated network object
         network = self._network
 
         if network is None:
             logging.info("Network object is empty")
             return False
 
-        retries = 5
-        network_containers = None
-        while retries > 0:
-            try:
-                network.reload()
-                network_containers = network.containers
-                break
-            except NotFound as ex:
-                logging.debug("Could not get container list. exception=%s", ex)
-
-            # Wait in case api is busy
-            time.sleep(0.25)
-            retries -= 1
-
-        if network_containers is None:
-            logging.warning(
-                "Could not get list of containers on the network. name=%s",
-                self._network_name,
-            )
+        if not refresh:
+            with self._network_members_lock:
+                return container.id in self._network_members
+
+        try:
+            container.reload()
+        except NotFound as ex:
+            logging.warning("Could not find container. exception=%s", ex)
+            self._set_network_member(container, False)
             return False
 
-        found = False
-        for i_container in network_containers:
-            try:
-                i_container.reload()
-                if i_container.id == container.id:
-                    found = True
-                    break
-            except NotFound as ex:
-                logging.warning("Could not find container. exception=%s", ex)
+        networks = container.attrs.get("NetworkSettings", {}).get("Networks") or {}
+        found = any(
+            name == network.name or settings.get("NetworkID") == network.id
+            for name, settings in networks.items()
+        )
+        self._set_network_member(container, found)
         return found
 
-    @classmethod
-    def wait_for_container_running(cls, container: Container, timeout: float = 30):
+    def wait_for_container_running(self, container: Container, timeout: float = 30):
         """Wait for the container to be in the running state
 
+        The container state is only inspected when docker reports an event for
+        the container. Polling is used as a fallback if the docker events
+        can not be received.
+
         Args:
             container (Container): Container
             timeout (float, optional): Timeout in seconds. Defaults to 30.
@@ -271,7 +940,6 @@ class DockerDeviceFactory:
         Raises:
             TimeoutError: Container did not reach the running state within the given timeout period.
         """
-        # Wait for container to be ready (10s max)
         timeout_limit = time.time() + timeout
         timed_out = True
 
@@ -279,20 +947,29 @@ class DockerDeviceFactory:
 
         start = time.time()
 
-        while time.time() < timeout_limit:
-            container.reload()
-            if container.status == "running":
-                logging.info(
-                    "Container ready: name=%s, id=%s, duration=%.3f, retries=%d",
-                    container.name,
-                    container.id,
-                    time.time() - start,
-                    retries,
-                )
-                timed_out = False
-                break
-            retries += 1
-            time.sleep(0.25)
+        use_events = self._events.start()
+
+        with self._events.watch(container.id) as changed:
+            while time.time() < timeout_limit:
+                container.reload()
+                if container.status == "running":
+                    logging.info(
+                        "Container ready: name=%s, id=%s, duration=%.3f, retries=%d",
+                        container.name,
+                        container.id,
+                        time.time() - start,
+                        retries,
+                    )
+                    timed_out = False
+                    break
+                retries += 1
+
+                if use_events and self._events.is_alive:
+                    # Only poll occasionally in case an event was missed
+                    changed.wait(min(max(timeout_limit - time.time(), 0), 2.0))
+                    changed.clear()
+                else:
+                    time.sleep(0.25)
 
         if timed_out:
             raise TimeoutError(
@@ -300,17 +977,26 @@ class DockerDeviceFactory:
                 f"name={container.name}, id={container.id}, status={container.status}"
             )
 
-    def connect_network(self, container: Container):
+    def connect_network(self, container: Container, force: bool = False):
         """Connect the container to the internal network
 
         Args:
             container (Container): Container
+            force (bool, optional): Connect the container even if the local index
+                reports that it is already connected. Defaults to False.
 
         Raises:
             APIError: Docker API Error
         """
         if self._network:
             name = container.name
+            if not force and self._is_container_connected(container, refresh=False):
+                logging.info(
+                    "Container [%s] already connected to network [%s]",
+                    name,
+                    self._network.name,
+                )
+                return
             try:
                 # Try connecting the container, and ignore already exists network
                 # as checking if it is already connected is unreliable
@@ -325,6 +1011,7 @@ class DockerDeviceFactory:
                     name,
                     self._network.name,
                 )
+            self._set_network_member(container, True)
 
     def disconnect_network(self, container: Container):
         """Disconnect a container to the internal network to simulate
@@ -339,6 +1026,7 @@ class DockerDeviceFactory:
         if container and self._network:
             try:
                 self._network.disconnect(container, force=True)
+                self._set_network_member(container, False)
                 logging.info(
                     "Disconnected [%s] from network [%s]",
                     container.name,
@@ -347,6 +1035,7 @@ class DockerDeviceFactory:
             except APIError as ex:
                 if "is not connected to network" not in ex.explanation:
                     raise
+                self._set_network_member(container, False)
                 logging.info(
                     "Container [%s] already disconnected from network [%s]",
                     container.name,
@@ -379,27 +1068,44 @@ class DockerDeviceFactory:
         """
         return self._device_containers.get(name, None)
 
-    def cleanup(self):
-        """Cleanup resources created by the fixture"""
+    def cleanup(self) -> RemovalSummary:
+        """Cleanup resources created by the fixture
+
+        Returns:
+            RemovalSummary: Summary of the removed device containers
+        """
+        self.close_pool()
+        summary = RemovalSummary()
         if not self._keep_containers:
-            for alias, container in self._device_containers.items():
-                self.remove_device(container, alias)
+            summary = self.remove_devices(list(self._device_containers.values()))
+        self._events.stop()
+        return summary
+
+    def remove_container_devices(
+        self, group_id: str = "", max_workers: int = 16
+    ) -> RemovalSummary:
+        """Remove the containers related to the integration testing
+
+        Args:
+            group_id (str, optional): Only remove containers of the given test group
+            max_workers (int, optional): Maximum number of containers removed in
+                parallel. Defaults to 16.
 
-    def remove_container_devices(self, group_id: str = ""):
-        """Remove the containers related to the integration testing"""
+        Returns:
+            RemovalSummary: Number of removed/failed containers and the wall time
+        """
         logging.info("Removing all pre-existing docker device containers")
         labels = ["tedge.inttest=1"]
         if group_id:
             labels.append(f"tedge.test_group_id={group_id}")
 
+        # Use sparse results, otherwise each container is inspected individually
         containers = self._docker_client.containers.list(
             all=True,
+            sparse=True,
             filters={
                 "label": labels,
             },
         )
-        for container in containers:
-            logging.info(
-                "Removing container. name=%s, id=%s", container.name, container.id
-            )
-            self.remove_device(container)
+        logging.info("Removing %d containers", len(containers))
+        return self.remove_devices(containers, max_workers=max_workers)
@@ -0,0 +1,204 @@
+"""Follow the journal of a device and wait for log entries"""
+import collections
+import fnmatch
+import json
+import logging
+import re
+import shlex
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Deque, List, Optional, Pattern, Union
+from docker.errors import NotFound
+from integration.fixtures.device.journal import (
+    JournalEntry,
+    parse_json_entry,
+    to_nanoseconds,
+)
+from integration.fixtures.docker.stream import CommandStream
+
+# pylint: disable=broad-except
+
+log = logging.getLogger()
+
+
+def normalize_unit(unit: Optional[str]) -> Optional[str]:
+    """Normalize a unit name/glob, e.g. tedge-agent => tedge-agent.service"""
+    if unit and "." not in unit and not unit.endswith("*"):
+        return unit + ".service"
+    return unit
+
+
+class LogWaiter:
+    """Waiter for a log entry matching a pattern"""
+
+    # pylint: disable=too-few-public-methods
+    def __init__(self, pattern: Pattern, unit: Optional[str], since: Optional[int]):
+        self.pattern = pattern
+        self.unit = normalize_unit(unit)
+        self.since = since
+        self.match: Optional[JournalEntry] = None
+        self.event = threading.Event()
+
+    def matches(self, entry: JournalEntry) -> bool:
+        """Check if the entry matches the waiter's criteria"""
+        if self.since is not None and entry.timestamp < self.since:
+            return False
+        if self.unit is not None and not fnmatch.fnmatchcase(entry.unit, self.unit):
+            return False
+        return self.pattern.search(entry.message) is not None
+
+
+class JournalFollower:
+    """Follow the journal of a device using a single `journalctl --follow` stream,
+    and notify any number of waiters as soon as a matching entry appears.
+
+    Recent entries are kept so that a waiter can also match entries which appeared
+    before it was registered (see the since argument of wait_for). If the stream
+    ends (e.g. the device restarted), it is restarted after the cursor of the last
+    received entry. Following stops once the container no longer exists.
+    """
+
+    def __init__(
+        self,
+        start_stream: Callable[[str], CommandStream],
+        since: datetime,
+        backlog: int = 10000,
+    ):
+        """Create a follower. It is started on first use
+
+        Args:
+            start_stream (Callable[[str], CommandStream]): Function to start a command
+                on the device and stream its output
+            since (datetime): Follow the entries since this time
+            backlog (int, optional): Number of recent entries to keep. Defaults to 10000.
+        """
+        self._start_stream = start_stream
+        self._since = to_nanoseconds(since)
+        # Journal cursor of the last received entry
+        self._cursor: Optional[str] = None
+        self._backlog: Deque[JournalEntry] = collections.deque(maxlen=backlog)
+        self._waiters: List[LogWaiter] = []
+        self._lock = threading.Lock()
+        self._stream: Optional[CommandStream] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def start(self):
+        """Start following the journal (if not already started)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._thread = threading.Thread(
+                target=self._run, name="journal-follower", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stop following the journal"""
+        self._stopped = True
+        stream = self._stream
+        if stream is not None:
+            try:
+                stream.stop()
+            except Exception as ex:
+                log.debug("Could not stop journal stream. exception=%s", ex)
+
+    def _command(self) -> str:
+        cmd = "journalctl --no-pager --quiet --follow --output json"
+        if self._cursor:
+            return f"{cmd} --after-cursor {shlex.quote(self._cursor)}"
+        # Seconds resolution, so older entries are skipped when they are added
+        return f"{cmd} --since @{self._since // 1_000_000_000}"
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                self._stream = self._start_stream(self._command())
+                for line in self._stream.lines():
+                    if line.strip():
+                        self._add(line)
+            except NotFound as ex:
+                log.info("Container was removed, stop following journal. %s", ex)
+                self._stopped = True
+                break
+            except Exception as ex:
+                log.debug("Journal stream ended. exception=%s", ex)
+
+            if not self._stopped:
+                # e.g. the device is restarting
+                time.sleep(1)
+
+    def _add(self, line: str):
+        data = json.loads(line)
+        cursor = data.get("__CURSOR")
+        if cursor is not None:
+            if cursor == self._cursor:
+                return
+            self._cursor = cursor
+        timestamp, unit, priority, message = parse_json_entry(data)
+        if timestamp < self._since:
+            return
+
+        entry = JournalEntry(
+            timestamp, unit, priority, message.decode("utf8", errors="replace")
+        )
+        with self._lock:
+            self._backlog.append(entry)
+            waiters = [waiter for waiter in self._waiters if waiter.matches(entry)]
+            for waiter in waiters:
+                waiter.match = entry
+                self._waiters.remove(waiter)
+
+        for waiter in waiters:
+            waiter.event.set()
+
+    def wait_for(
+        self,
+        pattern: Union[str, Pattern],
+        unit: str = None,
+        timeout: float = 30,
+        since: datetime = None,
+    ) -> JournalEntry:
+        """Wait for a log entry matching the pattern
+
+        Args:
+            pattern (Union[str, Pattern]): Regular expression which the message must contain
+            unit (str, optional): Systemd unit (or glob), e.g. tedge-agent, tedge-*
+            timeout (float, optional): Timeout in seconds. Defaults to 30.
+            since (datetime, optional): Ignore entries before this time, e.g. to also
+                match entries which appeared before the call. Defaults to the time
+                of the call, so only new entries are matched.
+
+        Raises:
+            TimeoutError: No matching entry appeared within the timeout
+
+        Returns:
+            JournalEntry: Matching entry
+        """
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern)
+
+        if since is None:
+            since = datetime.now(timezone.utc)
+        waiter = LogWaiter(pattern, unit, to_nanoseconds(since))
+
+        with self._lock:
+            for entry in self._backlog:
+                if waiter.matches(entry):
+                    return entry
+            self._waiters.append(waiter)
+
+        self.start()
+
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if waiter.match is None:
+                raise TimeoutError(
+                    f"Log entry not found after {timeout} seconds. "
+                    f"pattern={pattern.pattern}, unit={waiter.unit}"
+                )
+        return waiter.match
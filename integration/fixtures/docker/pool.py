@@ -0,0 +1,221 @@
+"""Warm pool of pre-installed device containers"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+from docker.models.containers import Container
+from integration.fixtures.docker.stats import percentile
+
+# pylint: disable=broad-except
+
+log = logging.getLogger()
+
+
+class PoolStats:
+    """Device pool statistics (thread-safe). Only the most recent refill
+    durations are kept, so the memory usage does not grow with the session length.
+    """
+
+    def __init__(self, max_durations: int = 1000):
+        """Create the statistics
+
+        Args:
+            max_durations (int, optional): Number of recent refill durations to keep.
+                Defaults to 1000.
+        """
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_failures = 0
+        self.refill_total = 0.0
+        self.refill_max = 0.0
+        self.refill_durations: Deque[float] = deque(maxlen=max_durations)
+
+    def record_hit(self):
+        """Record a request which was served from the pool"""
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self):
+        """Record a request which could not be served from the pool"""
+        with self._lock:
+            self.misses += 1
+
+    def record_refill(self, duration: float):
+        """Record a successful refill
+
+        Args:
+            duration (float): Time in seconds taken to create and prepare the container
+        """
+        with self._lock:
+            self.refills += 1
+            self.refill_total += duration
+            self.refill_max = max(self.refill_max, duration)
+            self.refill_durations.append(duration)
+
+    def record_refill_failure(self):
+        """Record a failed refill"""
+        with self._lock:
+            self.refill_failures += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """Get a summary of the pool statistics
+
+        Returns:
+            Dict[str, Any]: Hit/miss counts and refill latency (in seconds). The
+                refill percentiles only include the most recent refills.
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            durations = sorted(self.refill_durations)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "refills": self.refills,
+                "refill_failures": self.refill_failures,
+                "refill_avg": self.refill_total / self.refills if self.refills else 0.0,
+                "refill_max": self.refill_max,
+                "refill_p50": percentile(durations, 50) if durations else 0.0,
+                "refill_p95": percentile(durations, 95) if durations else 0.0,
+            }
+
+
+class DevicePool:
+    """Pool of containers which have already been created and prepared
+    (e.g. tedge installed), but not yet registered in the cloud.
+
+    A container is taken from the pool on each request, and a replacement
+    is created in the background. Failed refills are retried (with an increasing
+    delay) so the pool does not shrink.
+    """
+
+    def __init__(
+        self,
+        spawn: Callable[[], Container],
+        discard: Callable[[Container], None],
+        size: int,
+        max_workers: int = None,
+        max_retry_delay: float = 30.0,
+    ):
+        """Create a pool and start filling it in the background
+
+        Args:
+            spawn (Callable[[], Container]): Function which creates a ready-to-use container
+            discard (Callable[[Container], None]): Function which removes an unused container
+            size (int): Number of containers to keep ready
+            max_workers (int, optional): Number of containers which are prepared in parallel.
+                Defaults to the pool size.
+            max_retry_delay (float, optional): Maximum delay in seconds before a failed
+                refill is retried. Defaults to 30.
+        """
+        self._spawn = spawn
+        self._discard = discard
+        self._size = size
+        self._ready = queue.Queue()
+        self._closed = False
+        self._closed_event = threading.Event()
+        self._max_retry_delay = max_retry_delay
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or size, thread_name_prefix="device-pool"
+        )
+        self.stats = PoolStats()
+
+        for _ in range(size):
+            self._schedule_refill()
+
+    @property
+    def size(self) -> int:
+        """Target number of ready containers"""
+        return self._size
+
+    @property
+    def ready(self) -> int:
+        """Number of containers which are currently ready to be used"""
+        return self._ready.qsize()
+
+    def _schedule_refill(self, attempt: int = 0):
+        if self._closed:
+            return
+        try:
+            self._executor.submit(self._refill, attempt)
+        except RuntimeError:
+            # The executor was shut down by close()
+            pass
+
+    def _refill(self, attempt: int = 0):
+        if self._closed:
+            return
+
+        start = time.monotonic()
+        try:
+            container = self._spawn()
+        except Exception as ex:
+            self.stats.record_refill_failure()
+            delay = min(2.0**attempt, self._max_retry_delay)
+            log.warning(
+                "Could not refill device pool, retrying in %.1fs. exception=%s",
+                delay,
+                ex,
+            )
+            # Woken up early when the pool is closed
+            if not self._closed_event.wait(delay):
+                self._schedule_refill(attempt + 1)
+            return
+
+        duration = time.monotonic() - start
+        self.stats.record_refill(duration)
+
+        if self._closed:
+            self._discard(container)
+            return
+
+        self._ready.put(container)
+        log.info(
+            "Added container to device pool. name=%s, duration=%.3f, ready=%d",
+            container.name,
+            duration,
+            self.ready,
+        )
+
+    def acquire(self) -> Optional[Container]:
+        """Take a ready container from the pool. A replacement container
+        will be created in the background.
+
+        Returns:
+            Optional[Container]: Ready container, or None if the pool is empty
+        """
+        try:
+            container = self._ready.get_nowait()
+        except queue.Empty:
+            self.stats.record_miss()
+            log.info("Device pool miss. No ready containers")
+            return None
+
+        self.stats.record_hit()
+        log.info(
+            "Device pool hit. name=%s, ready=%d",
+            container.name,
+            self.ready,
+        )
+        self._schedule_refill()
+        return container
+
+    def close(self):
+        """Stop refilling the pool and remove any unused containers"""
+        self._closed = True
+        self._closed_event.set()
+        self._executor.shutdown(wait=True)
+
+        while True:
+            try:
+                container = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(container)
+
+        log.info("Closed device pool. stats=%s", self.stats.summary())
@@ -0,0 +1,371 @@
+"""Device resource profiles and host capacity scheduling"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+log = logging.getLogger()
+
+_UNITS = {"b": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def parse_size(value: Union[str, int]) -> int:
+    """Parse a docker style size (e.g. 128m, 1g) into bytes
+
+    Args:
+        value (Union[str, int]): Size
+
+    Returns:
+        int: Size in bytes
+    """
+    if isinstance(value, int):
+        return value
+    value = value.strip().lower()
+    if value and value[-1] in _UNITS:
+        return int(float(value[:-1]) * _UNITS[value[-1]])
+    return int(value)
+
+
+@dataclass(frozen=True)
+class ResourceProfile:
+    """Resources assigned to a device container"""
+
+    name: str
+    mem_limit: str = "128m"
+    # Number of cpus the container may use (cpu quota). 0 means unlimited
+    cpus: float = 0
+    # Cpus the container is allowed to run on, e.g. "2-3". Empty means any
+    cpuset_cpus: str = ""
+    tmp_size: str = "64m"
+    run_size: str = "64m"
+    privileged: bool = True
+
+    @property
+    def mem_bytes(self) -> int:
+        """Memory limit in bytes"""
+        return parse_size(self.mem_limit)
+
+    def container_options(self) -> Dict[str, Any]:
+        """Docker container options which apply the profile
+
+        Returns:
+            Dict[str, Any]: Options to be passed to containers.run
+        """
+        options = {
+            "mem_limit": self.mem_limit,
+            "tmpfs": {
+                # support a non-persistent directories to mimic behaviour of real devices
+                # /tmp is needed to make the reboot detection work, as the `uptime` shows the hosts
+                # uptime and not the container's
+                "/tmp": f"size={self.tmp_size}",
+                "/run": f"size={self.run_size}",
+            },
+            "privileged": self.privileged,
+        }
+        if self.cpus:
+            options["cpu_period"] = 100000
+            options["cpu_quota"] = int(self.cpus * 100000)
+        if self.cpuset_cpus:
+            options["cpuset_cpus"] = self.cpuset_cpus
+        return options
+
+
+PROFILES: Dict[str, ResourceProfile] = {
+    "small": ResourceProfile("small", mem_limit="96m", cpus=0.25, tmp_size="32m"),
+    "default": ResourceProfile("default"),
+    "large": ResourceProfile(
+        "large", mem_limit="256m", cpus=1.0, tmp_size="128m", run_size="128m"
+    ),
+}
+
+
+def get_profile(profile: Union[str, ResourceProfile, None]) -> ResourceProfile:
+    """Get a resource profile by name
+
+    Args:
+        profile (Union[str, ResourceProfile, None]): Profile name or profile.
+            None returns the default profile
+
+    Raises:
+        KeyError: Unknown profile name
+
+    Returns:
+        ResourceProfile: Resource profile
+    """
+    if profile is None:
+        return PROFILES["default"]
+    if isinstance(profile, ResourceProfile):
+        return profile
+    if profile not in PROFILES:
+        raise KeyError(
+            f"Unknown resource profile. name={profile}, available={list(PROFILES)}"
+        )
+    return PROFILES[profile]
+
+
+class HostScheduler:
+    """Admit new devices based on the memory and cpu of the host.
+
+    The memory limit of each admitted device is reserved until release() is
+    called, which should be done when the device is removed. A device is only
+    admitted if the reserved memory (including the new device) fits into the
+    total memory of the host, so that concurrent requests, and devices which
+    have not reached their memory usage yet (e.g. still bootstrapping), can not
+    overcommit the host. The available memory is also checked, to account for
+    memory used by other processes.
+
+    Note: The measurements are taken from /proc of the host running the tests,
+    which is assumed to be the docker host.
+    """
+
+    def __init__(
+        self,
+        mem_headroom: Union[str, int] = "512m",
+        max_cpu_usage: float = 0.85,
+        poll_interval: float = 0.5,
+    ):
+        """Create a scheduler
+
+        Args:
+            mem_headroom (Union[str, int], optional): Memory which should always remain
+                free on the host. Defaults to 512m.
+            max_cpu_usage (float, optional): Do not admit devices while the host cpu usage
+                (0-1) is above this value. Defaults to 0.85.
+            poll_interval (float, optional): Interval in seconds to re-check the host
+                capacity while waiting. Defaults to 0.5.
+        """
+        self._mem_headroom = parse_size(mem_headroom)
+        self._max_cpu_usage = max_cpu_usage
+        self._poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self._reserved = 0
+        self._cpu_sample: Optional[Tuple[float, int, int]] = None
+        self._cpu_usage: Optional[float] = None
+
+    @property
+    def reserved(self) -> int:
+        """Memory (in bytes) which is reserved for the admitted devices"""
+        return self._reserved
+
+    @staticmethod
+    def _meminfo(field: str) -> Optional[int]:
+        try:
+            with open("/proc/meminfo", encoding="utf8") as file:
+                for line in file:
+                    if line.startswith(f"{field}:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    @classmethod
+    def free_memory(cls) -> Optional[int]:
+        """Get the available memory of the host
+
+        Returns:
+            Optional[int]: Available memory in bytes. None if it can not be measured
+        """
+        return cls._meminfo("MemAvailable")
+
+    @classmethod
+    def total_memory(cls) -> Optional[int]:
+        """Get the total memory of the host
+
+        Returns:
+            Optional[int]: Total memory in bytes. None if it can not be measured
+        """
+        return cls._meminfo("MemTotal")
+
+    def cpu_usage(self) -> Optional[float]:
+        """Get the host cpu usage since the previous sample. A new sample is
+        only taken once per poll interval, so that frequent calls still
+        measure a meaningful period.
+
+        Returns:
+            Optional[float]: Cpu usage (0-1). None if it can not be measured
+        """
+        now = time.monotonic()
+        if (
+            self._cpu_sample is not None
+            and now - self._cpu_sample[0] < self._poll_interval
+        ):
+            return self._cpu_usage
+
+        try:
+            with open("/proc/stat", encoding="utf8") as file:
+                values = [int(value) for value in file.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+
+        # idle + iowait
+        idle = values[3] + (values[4] if len(values) > 4 else 0)
+        total = sum(values)
+        previous, self._cpu_sample = self._cpu_sample, (now, idle, total)
+        if previous is not None and total != previous[2]:
+            self._cpu_usage = 1.0 - (idle - previous[1]) / (total - previous[2])
+        return self._cpu_usage
+
+    def _has_capacity(self, profile: ResourceProfile) -> bool:
+        total = self.total_memory()
+        if total is not None:
+            if total - self._reserved - self._mem_headroom < profile.mem_bytes:
+                return False
+
+        free = self.free_memory()
+        if free is not None:
+            if free - self._mem_headroom < profile.mem_bytes:
+                return False
+
+        usage = self.cpu_usage()
+        if usage is not None and usage > self._max_cpu_usage:
+            return False
+        return True
+
+    def admit(self, profile: ResourceProfile, timeout: float = 300) -> int:
+        """Wait until the host has capacity for a device with the given profile
+
+        Args:
+            profile (ResourceProfile): Resource profile of the new device
+            timeout (float, optional): Timeout in seconds. Defaults to 300.
+
+        Raises:
+            TimeoutError: The host did not have enough capacity within the timeout
+
+        Returns:
+            int: Reserved memory (in bytes) which must be passed to release()
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._condition:
+            while not self._has_capacity(profile):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        "Host does not have enough capacity for device. "
+                        f"profile={profile.name}, free_memory={self.free_memory()}, "
+                        f"reserved={self._reserved}"
+                    )
+                self._condition.wait(min(remaining, self._poll_interval))
+
+            self._reserved += profile.mem_bytes
+
+        log.info(
+            "Admitted device. profile=%s, waited=%.3f, reserved=%d",
+            profile.name,
+            time.monotonic() - start,
+            self._reserved,
+        )
+        return profile.mem_bytes
+
+    def release(self, reservation: int):
+        """Release a reservation once the device has been removed
+
+        Args:
+            reservation (int): Value returned by admit()
+        """
+        with self._condition:
+            self._reserved = max(0, self._reserved - reservation)
+            self._condition.notify_all()
+
+
+def format_cpuset(cpus: Iterable[int]) -> str:
+    """Format a list of cpus as a docker cpuset string (e.g. "2,3")"""
+    return ",".join(str(cpu) for cpu in sorted(cpus))
+
+
+class CpuAllocator:
+    """Assign dedicated cpus to each device, and a separate set of cpus to the
+    test runner, so that performance measurements are comparable between runs.
+
+    The lowest free cpus are assigned first, so devices which are created one
+    after the other in the same order get the same cpus. When devices are created
+    concurrently (e.g. create_devices), the assignment depends on the order in
+    which the containers are started, so it can differ between runs.
+    """
+
+    def __init__(
+        self,
+        cpus_per_device: int = 1,
+        runner_cpus: int = 1,
+        cpus: Iterable[int] = None,
+    ):
+        """Create a cpu allocator
+
+        Args:
+            cpus_per_device (int, optional): Number of dedicated cpus per device.
+                Defaults to 1.
+            runner_cpus (int, optional): Number of cpus reserved for the test runner.
+                Defaults to 1.
+            cpus (Iterable[int], optional): Cpus which can be assigned. Defaults to
+                the cpus available to this process.
+
+        Raises:
+            ValueError: Not enough cpus to reserve for the runner and one device
+        """
+        if cpus is None:
+            cpus = os.sched_getaffinity(0)
+        available = sorted(cpus)
+        if len(available) < runner_cpus + cpus_per_device:
+            raise ValueError(
+                "Not enough cpus for pinning. "
+                f"available={len(available)}, runner_cpus={runner_cpus}, "
+                f"cpus_per_device={cpus_per_device}"
+            )
+
+        self._cpus_per_device = cpus_per_device
+        self._runner_cpus = available[:runner_cpus]
+        self._free = available[runner_cpus:]
+        self._assigned: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def runner_cpuset(self) -> str:
+        """Cpus reserved for the test runner"""
+        return format_cpuset(self._runner_cpus)
+
+    def pin_runner(self):
+        """Pin the test runner to its reserved cpus.
+
+        Only threads created after calling this inherit the affinity, so it
+        should be called as early as possible.
+        """
+        os.sched_setaffinity(0, self._runner_cpus)
+        log.info("Pinned test runner to cpus %s", self.runner_cpuset)
+
+    def allocate(self, name: str) -> str:
+        """Assign dedicated cpus to a device
+
+        Args:
+            name (str): Device (container) name
+
+        Raises:
+            RuntimeError: Not enough free cpus
+
+        Returns:
+            str: Cpuset of the device
+        """
+        with self._lock:
+            if name in self._assigned:
+                return format_cpuset(self._assigned[name])
+            if len(self._free) < self._cpus_per_device:
+                raise RuntimeError(
+                    f"No free cpus left to pin device. name={name}, "
+                    f"assigned={len(self._assigned)}"
+                )
+            cpus = self._free[: self._cpus_per_device]
+            self._free = self._free[self._cpus_per_device :]
+            self._assigned[name] = cpus
+            return format_cpuset(cpus)
+
+    def release(self, name: str):
+        """Release the cpus of a device
+
+        Args:
+            name (str): Device (container) name
+        """
+        with self._lock:
+            cpus = self._assigned.pop(name, None)
+            if cpus:
+                self._free = sorted(self._free + cpus)
@@ -0,0 +1,188 @@
+"""Persistent shell session inside a docker container"""
+import logging
+import select
+import shlex
+import socket
+import threading
+import uuid
+from typing import Dict, List, Tuple
+from docker.models.containers import Container
+from docker.utils.socket import next_frame_header, read_exactly
+
+# pylint: disable=broad-except
+
+log = logging.getLogger()
+
+STDOUT = 1
+
+
+class ShellSessionClosed(Exception):
+    """The shell session is no longer running (e.g. the container was restarted)"""
+
+    def __init__(self, message: str, command_sent: bool = True):
+        super().__init__(message)
+        # False if the command was definitely not executed, so it is safe to retry
+        self.command_sent = command_sent
+
+
+class ShellSession:
+    """Long-lived shell (a single docker exec) used to run many commands with
+    low latency. Commands are written to the shell's stdin, and the exit code
+    of each command is framed in the output using a unique marker.
+
+    Each command is run in its own non-interactive bash process (with stderr
+    redirected to stdout), so it behaves like `bash -c <cmd>` via exec_run.
+    """
+
+    def __init__(self, container: Container, environment: Dict[str, str] = None):
+        """Start a new shell session
+
+        Args:
+            container (Container): Container
+            environment (Dict[str, str], optional): Environment variables of the shell
+        """
+        api = container.client.api
+        self._exec_id = api.exec_create(
+            container.id,
+            ["/bin/bash"],
+            stdin=True,
+            stdout=True,
+            stderr=True,
+            tty=False,
+            environment=environment or None,
+        )["Id"]
+        self._socket = api.exec_start(self._exec_id, socket=True)
+        self._raw_socket = getattr(self._socket, "_sock", self._socket)
+        # Commands can run for a long time (e.g. installing packages)
+        self._raw_socket.settimeout(None)
+
+        self._marker = f"__INTTEST_{uuid.uuid4().hex}__".encode("ascii")
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        """The session can no longer be used"""
+        return self._closed
+
+    def _frame(self, cmd: str) -> bytes:
+        marker = self._marker.decode("ascii")
+        return (
+            f"bash -c {shlex.quote(cmd)} </dev/null 2>&1; "
+            f"printf '\\n%s %d\\n' {marker} \"$?\"\n"
+        ).encode("utf8")
+
+    def _check_alive(self):
+        """Detect if the shell has ended while the session was idle"""
+        if not hasattr(self._raw_socket, "recv"):
+            return
+        try:
+            readable, _, _ = select.select([self._raw_socket], [], [], 0)
+            if readable and not self._raw_socket.recv(1, socket.MSG_PEEK):
+                self._closed = True
+        except (OSError, ValueError):
+            self._closed = True
+
+    def _send(self, data: bytes):
+        try:
+            self._raw_socket.sendall(data)
+        except OSError as ex:
+            self._closed = True
+            raise ShellSessionClosed(
+                f"Could not write to shell session. {ex}", command_sent=False
+            ) from ex
+
+    def _read_result(self) -> Tuple[int, bytes]:
+        separator = b"\n" + self._marker + b" "
+        while True:
+            index = self._buffer.find(separator)
+            if index != -1:
+                end = self._buffer.find(b"\n", index + len(separator))
+                if end != -1:
+                    output = bytes(self._buffer[:index])
+                    exit_code = int(self._buffer[index + len(separator) : end])
+                    del self._buffer[: end + 1]
+                    return exit_code, output
+
+            stream, size = next_frame_header(self._socket)
+            if size < 0:
+                self._closed = True
+                raise ShellSessionClosed("Shell session ended unexpectedly")
+
+            data = read_exactly(self._socket, size) if size else b""
+            if stream == STDOUT:
+                self._buffer.extend(data)
+            else:
+                log.debug("Shell session stderr: %s", data)
+
+    def run(self, cmd: str) -> Tuple[int, bytes]:
+        """Run a command in the session
+
+        Args:
+            cmd (str): Shell command
+
+        Raises:
+            ShellSessionClosed: The session is no longer running
+
+        Returns:
+            Tuple[int, bytes]: Exit code and output (stdout and stderr)
+        """
+        with self._lock:
+            self._check_alive()
+            if self._closed:
+                raise ShellSessionClosed("Shell session is closed", command_sent=False)
+            self._send(self._frame(cmd))
+            return self._read_result()
+
+    def run_batch(self, cmds: List[str]) -> List[Tuple[int, bytes]]:
+        """Run multiple commands (sequentially) in the session. All commands are
+        sent at once, and the results are read as they arrive.
+
+        Args:
+            cmds (List[str]): Shell commands
+
+        Raises:
+            ShellSessionClosed: The session is no longer running
+
+        Returns:
+            List[Tuple[int, bytes]]: Exit code and output of each command
+        """
+        with self._lock:
+            self._check_alive()
+            if self._closed:
+                raise ShellSessionClosed("Shell session is closed", command_sent=False)
+
+            # Write from a separate thread so a large batch can not block on a
+            # full pipe while the output is not being read
+            errors = []
+
+            def write():
+                try:
+                    self._send(b"".join(self._frame(cmd) for cmd in cmds))
+                except ShellSessionClosed as ex:
+                    errors.append(ex)
+
+            writer = threading.Thread(target=write, name="shell-writer", daemon=True)
+            writer.start()
+            try:
+                results = [self._read_result() for _ in cmds]
+            finally:
+                writer.join()
+            if errors:
+                raise errors[0]
+            return results
+
+    def close(self):
+        """Stop the shell"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._raw_socket.sendall(b"exit\n")
+        except OSError:
+            pass
+        try:
+            self._socket.close()
+        except Exception as ex:
+            log.debug("Could not close shell session. exception=%s", ex)
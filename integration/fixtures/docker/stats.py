@@ -0,0 +1,303 @@
+"""Background sampling of docker container resource usage"""
+import csv
+import logging
+import math
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, TextIO
+from docker.errors import NotFound
+from docker.models.containers import Container
+
+# pylint: disable=broad-except
+
+log = logging.getLogger()
+
+COLUMNS = (
+    "cpu_percent",
+    "memory",
+    "memory_percent",
+    "net_rx",
+    "net_tx",
+    "block_read",
+    "block_write",
+)
+
+PERCENTILES = (50, 90, 99)
+
+
+def parse_stats(sample: Dict[str, Any]) -> Dict[str, float]:
+    """Extract the resource usage from a docker stats sample
+
+    The cpu usage is calculated the same way as the docker cli, using the previous
+    cpu counters which are included in each sample.
+
+    Args:
+        sample (Dict[str, Any]): Decoded docker stats sample
+
+    Returns:
+        Dict[str, float]: Cpu usage (percent of a single cpu), memory usage (bytes and
+            percent of the limit), and the cumulative network/block io (bytes)
+    """
+    cpu = sample.get("cpu_stats") or {}
+    precpu = sample.get("precpu_stats") or {}
+    cpu_delta = cpu.get("cpu_usage", {}).get("total_usage", 0) - precpu.get(
+        "cpu_usage", {}
+    ).get("total_usage", 0)
+    system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+    online_cpus = cpu.get("online_cpus") or len(
+        cpu.get("cpu_usage", {}).get("percpu_usage") or [1]
+    )
+    cpu_percent = 0.0
+    # The previous counters are not set for the first sample of a stream
+    if precpu.get("system_cpu_usage") and cpu_delta > 0 and system_delta > 0:
+        cpu_percent = cpu_delta / system_delta * online_cpus * 100.0
+
+    memory_stats = sample.get("memory_stats") or {}
+    details = memory_stats.get("stats") or {}
+    # Exclude the page cache (the same as the docker cli)
+    memory = memory_stats.get("usage", 0) - details.get(
+        "total_inactive_file", details.get("inactive_file", details.get("cache", 0))
+    )
+    limit = memory_stats.get("limit") or 0
+    memory_percent = memory / limit * 100.0 if limit else 0.0
+
+    net_rx = net_tx = 0
+    for network in (sample.get("networks") or {}).values():
+        net_rx += network.get("rx_bytes", 0)
+        net_tx += network.get("tx_bytes", 0)
+
+    block_read = block_write = 0
+    blkio = (sample.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []
+    for entry in blkio:
+        operation = entry.get("op", "").lower()
+        if operation == "read":
+            block_read += entry.get("value", 0)
+        elif operation == "write":
+            block_write += entry.get("value", 0)
+
+    return {
+        "cpu_percent": cpu_percent,
+        "memory": float(max(memory, 0)),
+        "memory_percent": memory_percent,
+        "net_rx": float(net_rx),
+        "net_tx": float(net_tx),
+        "block_read": float(block_read),
+        "block_write": float(block_write),
+    }
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Calculate a percentile (with linear interpolation) of sorted values"""
+    if not values:
+        return math.nan
+    rank = (len(values) - 1) * percent / 100.0
+    lower = math.floor(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+class StatsBuffer:
+    """Fixed size ring buffer of resource usage samples. Each column is stored
+    in a preallocated array of doubles, so the memory usage does not grow
+    once the buffer is full (the oldest samples are overwritten).
+    """
+
+    def __init__(self, capacity: int = 3600):
+        """Create a buffer
+
+        Args:
+            capacity (int, optional): Maximum number of samples. Defaults to 3600
+                (1 hour with the docker stats interval of 1 second)
+        """
+        self.capacity = capacity
+        self._timestamps = array("d", bytes(8 * capacity))
+        self._columns = {name: array("d", bytes(8 * capacity)) for name in COLUMNS}
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, timestamp: float, values: Dict[str, float]):
+        """Add a sample, overwriting the oldest sample if the buffer is full
+
+        Args:
+            timestamp (float): Unix timestamp (seconds)
+            values (Dict[str, float]): Value of each column
+        """
+        with self._lock:
+            index = self._next
+            self._timestamps[index] = timestamp
+            for name, column in self._columns.items():
+                column[index] = values.get(name, 0.0)
+            self._next = (index + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def _ordered(self, values: array) -> List[float]:
+        start = (self._next - self._count) % self.capacity
+        if start + self._count <= self.capacity:
+            return values[start : start + self._count].tolist()
+        return (values[start:] + values[: self._next]).tolist()
+
+    def series(self, start: float = None, end: float = None) -> Dict[str, List[float]]:
+        """Get the samples (oldest first) within a time range [start, end)
+
+        Args:
+            start (float, optional): Start unix timestamp (inclusive)
+            end (float, optional): End unix timestamp (exclusive)
+
+        Returns:
+            Dict[str, List[float]]: Timestamps ("timestamp") and values of each column
+        """
+        with self._lock:
+            timestamps = self._ordered(self._timestamps)
+            columns = {
+                name: self._ordered(values) for name, values in self._columns.items()
+            }
+
+        indices = [
+            i
+            for i, timestamp in enumerate(timestamps)
+            if (start is None or timestamp >= start)
+            and (end is None or timestamp < end)
+        ]
+        series = {"timestamp": [timestamps[i] for i in indices]}
+        for name, values in columns.items():
+            series[name] = [values[i] for i in indices]
+        return series
+
+    def summary(
+        self, start: float = None, end: float = None
+    ) -> Dict[str, Dict[str, float]]:
+        """Summarize each column within a time range
+
+        The network and block io columns are cumulative counters, so the rate
+        (bytes per second) between consecutive samples is summarized instead.
+
+        Args:
+            start (float, optional): Start unix timestamp (inclusive)
+            end (float, optional): End unix timestamp (exclusive)
+
+        Returns:
+            Dict[str, Dict[str, float]]: min, max, mean and percentiles (p50, p90, p99)
+                per column
+        """
+        series = self.series(start, end)
+        timestamps = series.pop("timestamp")
+        summary = {}
+        for name, values in series.items():
+            if name.startswith(("net_", "block_")):
+                name = f"{name}_rate"
+                values = [
+                    max(values[i] - values[i - 1], 0)
+                    / max(timestamps[i] - timestamps[i - 1], 1e-9)
+                    for i in range(1, len(values))
+                ]
+
+            ordered = sorted(values)
+            stats = {
+                "min": ordered[0] if ordered else math.nan,
+                "max": ordered[-1] if ordered else math.nan,
+                "mean": sum(ordered) / len(ordered) if ordered else math.nan,
+            }
+            for percent in PERCENTILES:
+                stats[f"p{percent}"] = percentile(ordered, percent)
+            summary[name] = stats
+        return summary
+
+    def write_csv(self, file: TextIO, start: float = None, end: float = None) -> int:
+        """Write the samples within a time range as csv
+
+        Args:
+            file (TextIO): Output file
+            start (float, optional): Start unix timestamp (inclusive)
+            end (float, optional): End unix timestamp (exclusive)
+
+        Returns:
+            int: Number of written samples
+        """
+        series = self.series(start, end)
+        writer = csv.writer(file)
+        writer.writerow(series.keys())
+        writer.writerows(zip(*series.values()))
+        return len(series["timestamp"])
+
+
+class StatsSampler:
+    """Sample the resource usage of a container in a background thread using
+    the docker stats stream (a single request which provides a sample every second).
+    The stream is reopened if it ends (e.g. the container restarted), until the
+    sampler is stopped or the container is removed.
+    """
+
+    def __init__(self, container: Container, capacity: int = 3600):
+        """Create a sampler. It is not started until start() is called
+
+        Args:
+            container (Container): Container
+            capacity (int, optional): Maximum number of samples to keep. Defaults to 3600.
+        """
+        self._container = container
+        self.buffer = StatsBuffer(capacity)
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def is_alive(self) -> bool:
+        """The sampler is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start sampling (if not already running)"""
+        if self.is_alive:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"stats-{self._container.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 2):
+        """Stop sampling. The collected samples are kept
+
+        Args:
+            timeout (float, optional): Time to wait for the sampler thread to stop
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            # The thread stops once the next sample arrives
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                for sample in self._container.stats(stream=True, decode=True):
+                    if self._stopped.is_set():
+                        return
+                    try:
+                        self.buffer.append(time.time(), parse_stats(sample))
+                    except Exception as ex:
+                        log.debug("Could not parse container stats. exception=%s", ex)
+            except NotFound:
+                break
+            except Exception as ex:
+                if not self._stopped.is_set():
+                    log.info(
+                        "Container stats stream ended. container=%s, exception=%s",
+                        self._container.name,
+                        ex,
+                    )
+
+            # The stream also ends when the container is restarted, so reopen
+            # it as long as the container exists
+            if self._stopped.wait(1):
+                break
+            try:
+                self._container.reload()
+            except NotFound:
+                break
+            except Exception as ex:
+                log.debug("Could not inspect container. exception=%s", ex)
+        log.info("Stopped sampling container stats. container=%s", self._container.name)
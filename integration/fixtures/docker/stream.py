@@ -0,0 +1,135 @@
+"""Streaming command execution inside a docker container"""
+import codecs
+import logging
+import time
+from typing import Dict, Iterator, Optional
+from docker.models.containers import Container
+
+# pylint: disable=broad-except
+
+log = logging.getLogger()
+
+# Print the pid (on stderr) before replacing the shell with the actual command,
+# so that the command can be stopped early. The command's stderr is merged
+# into stdout, so stderr only contains the pid
+PID_WRAPPER = 'echo "$$" >&2; exec /bin/bash -c "$0" 2>&1'
+
+
+class CommandStream:
+    """Output of a command which is read incrementally while the command is
+    running. Only the current chunk (and a partial line) is held in memory.
+
+    Example:
+        stream = CommandStream(container, "journalctl -f")
+        for line in stream.lines():
+            if "Started" in line:
+                stream.stop()
+                break
+        exit_code = stream.wait()
+    """
+
+    def __init__(
+        self, container: Container, cmd: str, environment: Dict[str, str] = None
+    ):
+        """Start a command
+
+        Args:
+            container (Container): Container
+            cmd (str): Shell command
+            environment (Dict[str, str], optional): Environment variables
+        """
+        self._container = container
+        self._api = container.client.api
+        self._cmd = cmd
+        self._exec_id = self._api.exec_create(
+            container.id,
+            ["/bin/bash", "-c", PID_WRAPPER, cmd],
+            environment=environment or None,
+        )["Id"]
+        self._output = self._api.exec_start(self._exec_id, stream=True, demux=True)
+        self._pid_buffer = b""
+        self._pid: Optional[int] = None
+        self._stopped = False
+
+    @property
+    def pid(self) -> Optional[int]:
+        """Process id of the command (inside the container)"""
+        return self._pid
+
+    def chunks(self) -> Iterator[bytes]:
+        """Iterate over the output as it arrives
+
+        Yields:
+            bytes: Output chunk (stdout and stderr)
+        """
+        try:
+            for stdout, stderr in self._output:
+                if stderr and self._pid is None:
+                    self._pid_buffer += stderr
+                    if b"\n" in self._pid_buffer:
+                        self._pid = int(self._pid_buffer.split(b"\n", 1)[0])
+                if stdout:
+                    yield stdout
+        except Exception as ex:
+            if not self._stopped:
+                raise
+            log.debug("Command stream closed. exception=%s", ex)
+
+    def lines(self, encoding: str = "utf8") -> Iterator[str]:
+        """Iterate over the output lines as they arrive
+
+        Args:
+            encoding (str, optional): Output encoding. Defaults to utf8.
+
+        Yields:
+            str: Output line (without the line ending)
+        """
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        partial = ""
+        for chunk in self.chunks():
+            partial += decoder.decode(chunk)
+            *lines, partial = partial.split("\n")
+            yield from lines
+        partial += decoder.decode(b"", final=True)
+        if partial:
+            yield partial
+
+    def stop(self):
+        """Stop the command (and its child processes) before it finishes"""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._pid is not None:
+            self._container.exec_run(
+                [
+                    "/bin/bash",
+                    "-c",
+                    f"kill -TERM $(cat /proc/{self._pid}/task/*/children 2>/dev/null) "
+                    f"{self._pid} 2>/dev/null",
+                ]
+            )
+        try:
+            self._output.close()
+        except Exception as ex:
+            log.debug("Could not close command stream. exception=%s", ex)
+
+    def wait(self, timeout: float = 10) -> Optional[int]:
+        """Wait for the command to finish, consuming any remaining output
+
+        Args:
+            timeout (float, optional): Timeout in seconds to wait for the exit code
+                once the output has ended. Defaults to 10.
+
+        Returns:
+            Optional[int]: Exit code. None if the command is still running
+        """
+        if not self._stopped:
+            for _ in self.chunks():
+                pass
+
+        deadline = time.monotonic() + timeout
+        while True:
+            result = self._api.exec_inspect(self._exec_id)
+            if not result.get("Running") or time.monotonic() > deadline:
+                return result.get("ExitCode")
+            time.sleep(0.05)
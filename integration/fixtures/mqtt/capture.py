@@ -0,0 +1,618 @@
+"""Record the MQTT traffic of a device to a compact, append-only capture file
+
+Capture file format (little endian):
+
+    header: b"TEDGECAP", version (u16), flags (u16)
+    record: timestamp_ns (u64), length (u32), MQTT PUBLISH body (length bytes)
+
+The record body is the variable header and payload of the received QoS 0 PUBLISH
+packet, i.e. topic length (u16, big endian), topic (utf8) and payload, so the
+received bytes are written to the file without decoding them.
+
+The index file (<capture>.idx) has the header b"TEDGEIDX", version, flags followed
+by a (timestamp_ns, offset) pair of u64 values for each record. It can be rebuilt
+from the capture file if it is missing or incomplete (e.g. after a crash).
+
+Timestamps are taken when the capture client reads from its socket, not when the
+messages are published. All messages returned by the same read share its timestamp,
+so the resolution is one socket read of up to read_size bytes (by default one
+ethernet MTU, i.e. a few small messages). If the capture falls behind, messages
+queue up in the socket buffer and are timestamped when they are read.
+"""
+import logging
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+log = logging.getLogger()
+
+CAPTURE_MAGIC = b"TEDGECAP"
+INDEX_MAGIC = b"TEDGEIDX"
+VERSION = 1
+FILE_HEADER = struct.Struct("<8sHH")
+RECORD_HEADER = struct.Struct("<QI")
+INDEX_SUFFIX = ".idx"
+
+# Topics of the messages sent to (c8y/#) and received from the cloud and the
+# local tedge api (tedge/#)
+CAPTURE_TOPICS = ("c8y/#", "tedge/#")
+
+# MQTT 3.1.1 packet types
+CONNECT, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, SUBACK = 1, 2, 3, 4, 8, 9
+PINGREQ, DISCONNECT = 12, 14
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Check if a topic matches an MQTT topic filter (with + and # wildcards)"""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts) or part not in ("+", topic_parts[index]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    header = bytearray([(packet_type << 4) | flags])
+    length = len(body)
+    while True:
+        byte, length = length % 128, length // 128
+        header.append(byte | (0x80 if length else 0))
+        if not length:
+            break
+    return bytes(header) + body
+
+
+def _encode_string(value: str) -> bytes:
+    data = value.encode("utf8")
+    return struct.pack("!H", len(data)) + data
+
+
+class CaptureWriter:
+    """Append records to a capture file and its index. Records are buffered
+    in memory and written in large blocks by flush().
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1024 * 1024):
+        """Open a capture file. An existing capture file is appended to.
+
+        Args:
+            path (str): Capture file
+            buffer_size (int, optional): Size in bytes of the records which are kept in
+                memory before they are written to the file. Defaults to 1 MiB.
+        """
+        self.path = path
+        self.buffer_size = buffer_size
+        exists = os.path.exists(path) and os.path.getsize(path) >= FILE_HEADER.size
+        if exists:
+            # Make sure the index matches the existing records before appending, and
+            # drop any incomplete record at the end (e.g. after a crash)
+            with CaptureReader(path) as reader:
+                end = reader.end_offset
+                with open(path + INDEX_SUFFIX, "wb") as file:
+                    file.write(FILE_HEADER.pack(INDEX_MAGIC, VERSION, 0))
+                    reader.index.tofile(file)
+            if os.path.getsize(path) > end:
+                os.truncate(path, end)
+        self._file = open(path, "ab")  # pylint: disable=consider-using-with
+        self._index_file = open(  # pylint: disable=consider-using-with
+            path + INDEX_SUFFIX, "ab"
+        )
+        if not exists:
+            self._file.write(FILE_HEADER.pack(CAPTURE_MAGIC, VERSION, 0))
+            self._index_file.write(FILE_HEADER.pack(INDEX_MAGIC, VERSION, 0))
+        self._offset = self._file.tell()
+        self._buffer = bytearray()
+        self._index = array("Q")
+        self._lock = threading.Lock()
+        self.records = 0
+
+    def add(self, timestamp_ns: int, body: Union[bytes, memoryview]):
+        """Add a record
+
+        Args:
+            timestamp_ns (int): Unix timestamp in nanoseconds
+            body (Union[bytes, memoryview]): PUBLISH body (topic length, topic and
+                payload)
+        """
+        with self._lock:
+            self._index.append(timestamp_ns)
+            self._index.append(self._offset + len(self._buffer))
+            self._buffer += RECORD_HEADER.pack(timestamp_ns, len(body))
+            self._buffer += body
+            self.records += 1
+            if len(self._buffer) >= self.buffer_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        # Records are written before their index entries, so the index never
+        # refers to incomplete records
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._index.tofile(self._index_file)
+        self._index_file.flush()
+        self._offset += len(self._buffer)
+        self._buffer = bytearray()
+        self._index = array("Q")
+
+    def flush(self):
+        """Write the buffered records to the file"""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Flush and close the file"""
+        with self._lock:
+            self._flush()
+            self._file.close()
+            self._index_file.close()
+
+
+class CaptureRecord(NamedTuple):
+    """Captured message"""
+
+    timestamp_ns: int
+    topic: str
+    payload: bytes
+
+
+class CaptureReader:
+    """Read a capture file. The file is memory mapped, and records are located
+    via the index, so large captures can be read without loading them.
+
+    Example:
+        with CaptureReader("device.capture") as capture:
+            for record in capture.records("c8y/s/us"):
+                print(record.timestamp_ns, record.payload)
+    """
+
+    def __init__(self, path: str, write_index: bool = False):
+        """Open a capture file
+
+        Args:
+            path (str): Capture file
+            write_index (bool, optional): Save the index if it had to be rebuilt.
+                Defaults to False.
+
+        Raises:
+            ValueError: The file is not a capture file
+        """
+        self.path = path
+        self._file = open(path, "rb")  # pylint: disable=consider-using-with
+        size = os.fstat(self._file.fileno()).st_size
+        header = self._file.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size or header[:8] != CAPTURE_MAGIC:
+            self._file.close()
+            raise ValueError(f"Not a capture file. path={path}")
+        self._data = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if size > FILE_HEADER.size
+            else b""
+        )
+        self._size = size
+
+        index = self._load_index()
+        if index is None:
+            index = self._scan(self._data, size)
+            log.info(
+                "Rebuilt capture index. path=%s, records=%d", path, len(index) // 2
+            )
+            if write_index:
+                with open(path + INDEX_SUFFIX, "wb") as file:
+                    file.write(FILE_HEADER.pack(INDEX_MAGIC, VERSION, 0))
+                    index.tofile(file)
+        self._index = index
+        self._timestamps = index[0::2]
+        self._offsets = index[1::2]
+
+        # End of the last complete record
+        self.end_offset = FILE_HEADER.size
+        if self._offsets:
+            _, length = RECORD_HEADER.unpack_from(self._data, self._offsets[-1])
+            self.end_offset = self._offsets[-1] + RECORD_HEADER.size + length
+
+    def _load_index(self) -> Optional[array]:
+        index = array("Q")
+        try:
+            with open(self.path + INDEX_SUFFIX, "rb") as file:
+                header = file.read(FILE_HEADER.size)
+                if header[:8] != INDEX_MAGIC:
+                    return None
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        entries = len(data) // (2 * index.itemsize)
+        index.frombytes(data[: entries * 2 * index.itemsize])
+
+        # The index must cover all (complete) records of the capture file
+        end = FILE_HEADER.size
+        if entries:
+            last = index[-1]
+            if last + RECORD_HEADER.size > self._size:
+                return None
+            _, length = RECORD_HEADER.unpack_from(self._data, last)
+            end = last + RECORD_HEADER.size + length
+        if end > self._size:
+            return None
+        if end + RECORD_HEADER.size <= self._size:
+            _, length = RECORD_HEADER.unpack_from(self._data, end)
+            if end + RECORD_HEADER.size + length <= self._size:
+                return None
+        return index
+
+    @staticmethod
+    def _scan(data, size: int) -> array:
+        index = array("Q")
+        offset = FILE_HEADER.size
+        while offset + RECORD_HEADER.size <= size:
+            timestamp_ns, length = RECORD_HEADER.unpack_from(data, offset)
+            if offset + RECORD_HEADER.size + length > size:
+                # Incomplete record at the end of the file
+                break
+            index.append(timestamp_ns)
+            index.append(offset)
+            offset += RECORD_HEADER.size + length
+        return index
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def close(self):
+        """Close the file"""
+        if isinstance(self._data, mmap.mmap):
+            try:
+                self._data.close()
+            except BufferError:
+                # Records returned by raw()/iter_raw() are still referenced, the
+                # mapping is released once they are garbage collected
+                pass
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    @property
+    def index(self) -> array:
+        """Timestamp (unix ns) and file offset pairs of each record"""
+        return self._index
+
+    @property
+    def timestamps(self) -> array:
+        """Timestamp (unix ns) of each record"""
+        return self._timestamps
+
+    @property
+    def duration_ns(self) -> int:
+        """Time between the first and last record"""
+        if not self._timestamps:
+            return 0
+        return self._timestamps[-1] - self._timestamps[0]
+
+    def raw(self, index: int) -> Tuple[int, memoryview, memoryview]:
+        """Get a record without decoding it
+
+        Args:
+            index (int): Record number
+
+        Returns:
+            Tuple[int, memoryview, memoryview]: Timestamp (unix ns), topic and payload
+        """
+        offset = self._offsets[index]
+        timestamp_ns, length = RECORD_HEADER.unpack_from(self._data, offset)
+        start = offset + RECORD_HEADER.size
+        view = memoryview(self._data)[start : start + length]
+        topic_length = (view[0] << 8) | view[1]
+        return timestamp_ns, view[2 : 2 + topic_length], view[2 + topic_length :]
+
+    def __getitem__(self, index: int) -> CaptureRecord:
+        timestamp_ns, topic, payload = self.raw(index)
+        return CaptureRecord(timestamp_ns, str(topic, "utf8"), bytes(payload))
+
+    def find(self, timestamp_ns: int) -> int:
+        """Get the number of the first record at or after the given time
+
+        Args:
+            timestamp_ns (int): Unix timestamp in nanoseconds
+
+        Returns:
+            int: Record number (len(self) if there are no later records)
+        """
+        return bisect_left(self._timestamps, timestamp_ns)
+
+    def iter_raw(
+        self, start_ns: int = None, end_ns: int = None
+    ) -> Iterator[Tuple[int, memoryview, memoryview]]:
+        """Iterate over the records within a time range [start_ns, end_ns), without
+        decoding them
+
+        Args:
+            start_ns (int, optional): Start unix timestamp in nanoseconds (inclusive)
+            end_ns (int, optional): End unix timestamp in nanoseconds (exclusive)
+
+        Yields:
+            Tuple[int, memoryview, memoryview]: Timestamp (unix ns), topic and payload
+        """
+        first = 0 if start_ns is None else self.find(start_ns)
+        last = len(self) if end_ns is None else self.find(end_ns)
+        for index in range(first, last):
+            yield self.raw(index)
+
+    def records(
+        self,
+        topic_filter: str = None,
+        start_ns: int = None,
+        end_ns: int = None,
+    ) -> Iterator[CaptureRecord]:
+        """Iterate over the records
+
+        Args:
+            topic_filter (str, optional): Only include records matching the
+                MQTT topic filter, e.g. c8y/s/us or c8y/#
+            start_ns (int, optional): Start unix timestamp in nanoseconds (inclusive)
+            end_ns (int, optional): End unix timestamp in nanoseconds (exclusive)
+
+        Yields:
+            CaptureRecord: Record
+        """
+        matches: Dict[bytes, bool] = {}
+        for timestamp_ns, topic, payload in self.iter_raw(start_ns, end_ns):
+            key = bytes(topic)
+            if topic_filter is not None:
+                matched = matches.get(key)
+                if matched is None:
+                    matched = matches[key] = topic_matches(
+                        topic_filter, str(key, "utf8")
+                    )
+                if not matched:
+                    continue
+            yield CaptureRecord(timestamp_ns, str(key, "utf8"), bytes(payload))
+
+    def topic_counts(self) -> Dict[str, int]:
+        """Number of records per topic"""
+        counts: Dict[bytes, int] = {}
+        for _, topic, _ in self.iter_raw():
+            key = bytes(topic)
+            counts[key] = counts.get(key, 0) + 1
+        return {str(topic, "utf8"): count for topic, count in counts.items()}
+
+
+class MqttCapture:
+    """Subscribe to a broker and record all received messages to a capture file
+    (in a background thread).
+
+    A minimal MQTT client is used which writes the received PUBLISH packets to the
+    capture file without decoding them, so sustained high message rates do not
+    create python objects per message. All messages received by the same socket
+    read share the timestamp of the read (see the module description).
+
+    The connection is re-established (e.g. after the device is restarted) until
+    the capture is stopped.
+    """
+
+    def __init__(
+        self,
+        address: Callable[[], Tuple[str, int]],
+        path: str,
+        topics: Iterable[str] = CAPTURE_TOPICS,
+        keepalive: int = 60,
+        read_size: int = 1500,
+    ):
+        """Create a capture. It is not started until start() is called
+
+        Args:
+            address (Callable[[], Tuple[str, int]]): Function returning the broker's
+                host and port, e.g. DockerDeviceAdapter.mqtt_address. It is called
+                on each (re)connect
+            path (str): Capture file. An existing capture file is appended to
+            topics (Iterable[str], optional): Topic filters. Defaults to c8y/# and tedge/#
+            keepalive (int, optional): MQTT keep alive interval in seconds
+            read_size (int, optional): Maximum bytes received per socket read. Larger
+                reads need fewer system calls, but more messages share a timestamp.
+                Defaults to 1500 (one ethernet MTU).
+        """
+        self._address = address
+        self.path = path
+        self.topics = tuple(topics)
+        self.keepalive = keepalive
+        self.read_size = read_size
+        self.reconnects = 0
+        self.subscribed = threading.Event()
+        self._writer: Optional[CaptureWriter] = None
+        self._socket: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def is_alive(self) -> bool:
+        """The capture is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def records(self) -> int:
+        """Number of recorded messages"""
+        return self._writer.records if self._writer is not None else 0
+
+    def start(self, timeout: float = 10) -> "MqttCapture":
+        """Start capturing, and wait until the subscription is active
+
+        Args:
+            timeout (float, optional): Time in seconds to wait for the subscription.
+                Defaults to 10.
+
+        Raises:
+            TimeoutError: Subscription is not active within the timeout
+
+        Returns:
+            MqttCapture: The capture
+        """
+        if self.is_alive:
+            return self
+        self._stopped.clear()
+        self.subscribed.clear()
+        self._writer = CaptureWriter(self.path)
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"mqtt-capture-{os.path.basename(self.path)}",
+            daemon=True,
+        )
+        self._thread.start()
+        if not self.subscribed.wait(timeout):
+            self.stop()
+            raise TimeoutError(f"Capture could not subscribe within {timeout}s")
+        return self
+
+    def stop(self, timeout: float = 5):
+        """Stop capturing and close the capture file
+
+        Args:
+            timeout (float, optional): Time to wait for the capture thread to stop
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._writer is not None:
+            self._writer.close()
+            log.info("Stopped capture. path=%s, records=%d", self.path, self.records)
+
+    def _run(self):
+        backoff = 0.1
+        while not self._stopped.is_set():
+            try:
+                self._capture()
+                backoff = 0.1
+            except (OSError, ConnectionError, ValueError) as ex:
+                if self._stopped.is_set():
+                    break
+                log.info("Capture connection lost, reconnecting. error=%s", ex)
+            except Exception as ex:  # pylint: disable=broad-except
+                # e.g. a malformed packet, which must not stop the capture
+                if self._stopped.is_set():
+                    break
+                log.warning("Capture failed, reconnecting. error=%s", ex, exc_info=True)
+            finally:
+                self._writer.flush()
+                if self._socket is not None:
+                    self._socket.close()
+                    self._socket = None
+            self.reconnects += 1
+            self._stopped.wait(backoff)
+            backoff = min(backoff * 2, 2.0)
+
+    def _connect(self) -> socket.socket:
+        host, port = self._address()
+        sock = socket.create_connection((host, port), timeout=10)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connect = (
+            _encode_string("MQTT")
+            + bytes([4, 0x02])  # protocol level 3.1.1, clean session
+            + struct.pack("!H", self.keepalive)
+            + _encode_string(f"inttest-capture-{uuid.uuid4().hex[:8]}")
+        )
+        subscribe = struct.pack("!H", 1) + b"".join(
+            _encode_string(topic) + b"\x00" for topic in self.topics
+        )
+        sock.sendall(
+            _encode_packet(CONNECT, 0, connect)
+            + _encode_packet(SUBSCRIBE, 2, subscribe)
+        )
+        # Wake up regularly to send pings, flush and check if stopped
+        sock.settimeout(0.5)
+        return sock
+
+    def _capture(self):
+        self._socket = sock = self._connect()
+        writer = self._writer
+        chunk = bytearray(self.read_size)
+        chunk_view = memoryview(chunk)
+        pending = bytearray()
+        ping = _encode_packet(PINGREQ, 0, b"")
+        last_sent = time.monotonic()
+
+        while not self._stopped.is_set():
+            # The broker only considers the packets sent by the client as activity
+            if time.monotonic() - last_sent > self.keepalive / 2:
+                sock.sendall(ping)
+                last_sent = time.monotonic()
+            try:
+                size = sock.recv_into(chunk)
+            except socket.timeout:
+                writer.flush()
+                continue
+            if not size:
+                raise ConnectionError("Connection closed by broker")
+            timestamp_ns = time.time_ns()
+            pending += chunk_view[:size]
+
+            position = 0
+            end_of_data = len(pending)
+            with memoryview(pending) as view:
+                while end_of_data - position >= 2:
+                    first = pending[position]
+                    # Remaining length (variable length encoding, up to 4 bytes)
+                    length, multiplier, header = 0, 1, position + 1
+                    while header < end_of_data:
+                        byte = pending[header]
+                        length += (byte & 0x7F) * multiplier
+                        multiplier *= 128
+                        header += 1
+                        if not byte & 0x80:
+                            break
+                    else:
+                        break
+                    end = header + length
+                    if end > end_of_data:
+                        break
+
+                    if first >> 4 == PUBLISH and not first & 0x06:
+                        # QoS 0 publish, which is written to the capture as is
+                        writer.add(timestamp_ns, view[header:end])
+                    else:
+                        self._handle_packet(sock, first, view[header:end], timestamp_ns)
+                    position = end
+            del pending[:position]
+
+        sock.sendall(_encode_packet(DISCONNECT, 0, b""))
+
+    def _handle_packet(
+        self, sock: socket.socket, first: int, body: memoryview, timestamp_ns: int
+    ):
+        packet_type, qos = first >> 4, (first >> 1) & 0x03
+        if packet_type == PUBLISH:
+            # Remove the packet id, so all records have the same layout
+            topic_end = 2 + ((body[0] << 8) | body[1])
+            packet_id = bytes(body[topic_end : topic_end + 2])
+            self._writer.add(
+                timestamp_ns, bytes(body[:topic_end]) + bytes(body[topic_end + 2 :])
+            )
+            if qos == 1:
+                sock.sendall(_encode_packet(PUBACK, 0, packet_id))
+        elif packet_type == CONNACK:
+            if body[1] != 0:
+                raise ConnectionError(f"Connection refused by broker. rc={body[1]}")
+        elif packet_type == SUBACK:
+            log.info("Capture subscribed. path=%s, topics=%s", self.path, self.topics)
+            self.subscribed.set()
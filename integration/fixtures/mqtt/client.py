@@ -0,0 +1,233 @@
+"""Persistent MQTT clients used to publish messages to a device's broker"""
+import itertools
+import logging
+import threading
+import time
+import uuid
+from typing import Iterable, List, Optional, Tuple, Union
+import paho.mqtt.client as mqtt
+
+log = logging.getLogger()
+
+Payload = Union[str, bytes]
+Message = Tuple[str, Payload]
+
+
+class MqttPublishError(Exception):
+    """Message(s) could not be published"""
+
+
+class MqttClientPool:
+    """Pool of persistent MQTT connections to a single broker.
+
+    Each connection has its own network thread, so publishing a large number
+    of messages is spread over the connections. Messages published via
+    the same call to publish_many() are only guaranteed to be delivered in
+    order when the pool has a single connection.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        size: int = 1,
+        client_id_prefix: str = "inttest",
+        connect_timeout: float = 10,
+        max_inflight: int = 1000,
+    ):
+        """Connect to a broker
+
+        Args:
+            host (str): Broker host
+            port (int): Broker port
+            size (int, optional): Number of connections. Defaults to 1.
+            client_id_prefix (str, optional): Prefix of the client ids
+            connect_timeout (float, optional): Timeout in seconds to wait for all
+                connections to be established. Defaults to 10.
+            max_inflight (int, optional): Maximum number of unacknowledged QoS 1/2
+                messages per connection. Defaults to 1000.
+
+        Raises:
+            MqttPublishError: Could not connect to the broker
+        """
+        self.host = host
+        self.port = port
+        self._clients: List[mqtt.Client] = []
+        self._connected: List[threading.Event] = []
+        self._next = itertools.cycle(range(size))
+        self._lock = threading.Lock()
+
+        for index in range(size):
+            connected = threading.Event()
+            client = mqtt.Client(
+                client_id=f"{client_id_prefix}-{uuid.uuid4().hex[:8]}-{index}",
+                clean_session=True,
+            )
+            client.max_inflight_messages_set(max_inflight)
+            client.on_connect = self._on_connect(connected)
+            client.on_disconnect = self._on_disconnect(connected)
+            client.connect_async(host, port)
+            client.loop_start()
+            self._clients.append(client)
+            self._connected.append(connected)
+
+        deadline = time.monotonic() + connect_timeout
+        for connected in self._connected:
+            if not connected.wait(max(0, deadline - time.monotonic())):
+                self.close()
+                raise MqttPublishError(
+                    f"Could not connect to broker. host={host}, port={port}, "
+                    f"timeout={connect_timeout}"
+                )
+        log.info(
+            "Connected to MQTT broker. host=%s, port=%s, connections=%d",
+            host,
+            port,
+            size,
+        )
+
+    @staticmethod
+    def _on_connect(connected: threading.Event):
+        def on_connect(_client, _userdata, _flags, rc):
+            if rc == mqtt.MQTT_ERR_SUCCESS:
+                connected.set()
+            else:
+                log.warning("MQTT connection refused. rc=%s", rc)
+
+        return on_connect
+
+    @staticmethod
+    def _on_disconnect(connected: threading.Event):
+        def on_disconnect(_client, _userdata, rc):
+            connected.clear()
+            if rc != mqtt.MQTT_ERR_SUCCESS:
+                log.info("MQTT connection lost, reconnecting. rc=%s", rc)
+
+        return on_disconnect
+
+    @property
+    def size(self) -> int:
+        """Number of connections"""
+        return len(self._clients)
+
+    @property
+    def is_connected(self) -> bool:
+        """All connections are established"""
+        return bool(self._clients) and all(
+            connected.is_set() for connected in self._connected
+        )
+
+    def _client(self) -> mqtt.Client:
+        with self._lock:
+            return self._clients[next(self._next)]
+
+    def publish(
+        self,
+        topic: str,
+        payload: Payload,
+        qos: int = 0,
+        retain: bool = False,
+        timeout: Optional[float] = 10,
+    ) -> mqtt.MQTTMessageInfo:
+        """Publish a single message
+
+        Args:
+            topic (str): Topic
+            payload (Payload): Payload
+            qos (int, optional): Quality of service (0, 1 or 2). Defaults to 0.
+            retain (bool, optional): Retain the message. Defaults to False.
+            timeout (Optional[float], optional): Time to wait for the message to be
+                sent (QoS 0) or acknowledged (QoS 1/2). None does not wait.
+
+        Raises:
+            MqttPublishError: Message could not be published
+
+        Returns:
+            mqtt.MQTTMessageInfo: Message info
+        """
+        info = self._client().publish(topic, payload, qos=qos, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise MqttPublishError(
+                "Could not publish message. "
+                f"topic={topic}, error={mqtt.error_string(info.rc)}"
+            )
+        if timeout is not None:
+            info.wait_for_publish(timeout)
+            if not info.is_published():
+                raise MqttPublishError(
+                    f"Message was not published within {timeout} seconds. topic={topic}"
+                )
+        return info
+
+    def publish_many(
+        self,
+        messages: Iterable[Message],
+        qos: int = 0,
+        retain: bool = False,
+        timeout: Optional[float] = 60,
+    ) -> int:
+        """Publish many messages as fast as possible. The messages are split into
+        contiguous chunks, one per connection.
+
+        Example:
+            pool.publish_many(
+                ("tedge/measurements", f'{{"temperature": {i}}}') for i in range(10000)
+            )
+
+        Args:
+            messages (Iterable[Message]): Messages (topic and payload)
+            qos (int, optional): Quality of service (0, 1 or 2). Defaults to 0.
+            retain (bool, optional): Retain the messages. Defaults to False.
+            timeout (Optional[float], optional): Time to wait for all messages to be
+                sent (QoS 0) or acknowledged (QoS 1/2). None does not wait.
+
+        Raises:
+            MqttPublishError: Not all messages were published within the timeout
+
+        Returns:
+            int: Number of published messages
+        """
+        messages = messages if isinstance(messages, list) else list(messages)
+        if not messages:
+            return 0
+
+        chunk_size = -(-len(messages) // self.size)
+        pending: List[mqtt.MQTTMessageInfo] = []
+        for index, client in enumerate(self._clients):
+            last = None
+            chunk = messages[index * chunk_size : (index + 1) * chunk_size]
+            for topic, payload in chunk:
+                info = client.publish(topic, payload, qos=qos, retain=retain)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    raise MqttPublishError(
+                        "Could not publish message. "
+                        f"topic={topic}, error={mqtt.error_string(info.rc)}"
+                    )
+                if qos > 0:
+                    pending.append(info)
+                last = info
+            # QoS 0 messages are written in order, so the last message is enough
+            if qos == 0 and last is not None:
+                pending.append(last)
+
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+            for info in pending:
+                info.wait_for_publish(max(0, deadline - time.monotonic()))
+                if not info.is_published():
+                    raise MqttPublishError(
+                        f"Messages were not published within {timeout} seconds. "
+                        f"total={len(messages)}"
+                    )
+        return len(messages)
+
+    def close(self):
+        """Disconnect all connections"""
+        for client in self._clients:
+            try:
+                client.disconnect()
+                client.loop_stop()
+            except Exception as ex:  # pylint: disable=broad-except
+                log.debug("Could not close MQTT client. exception=%s", ex)
+        self._clients = []
+        self._connected = []
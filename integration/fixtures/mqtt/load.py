@@ -0,0 +1,369 @@
+"""Measurement load generator with rate control and latency accounting"""
+import logging
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from integration.fixtures.c8y_realtime import JsonReader
+from integration.fixtures.docker.stats import PERCENTILES, percentile
+from integration.fixtures.mqtt.client import Message
+
+log = logging.getLogger()
+
+# Measurement fragment used to embed the sequence number and send time (unix ms)
+LOAD_FRAGMENT = "inttest_load"
+
+# Sequence number of the messages used to check that the subscriber is receiving
+WARMUP_SEQUENCE = -1
+
+# Series name (or group.series) and the (min, max) range of its random values
+SeriesSchema = Dict[str, Tuple[float, float]]
+
+DEFAULT_SCHEMA: SeriesSchema = {"temperature": (20.0, 30.0)}
+
+
+@dataclass(frozen=True)
+class RateProfile:
+    """Message rate over time
+
+    * constant: rate messages per second
+    * ramp: rate increases linearly from start_rate to rate
+    * burst: burst_size messages every burst_interval seconds, plus rate messages
+      per second in between
+    """
+
+    kind: str
+    duration: float
+    rate: float = 0.0
+    start_rate: float = 0.0
+    burst_size: int = 0
+    burst_interval: float = 1.0
+
+    @classmethod
+    def constant(cls, rate: float, duration: float) -> "RateProfile":
+        """Constant rate (messages per second)"""
+        return cls("constant", duration, rate=rate)
+
+    @classmethod
+    def ramp(cls, start_rate: float, end_rate: float, duration: float) -> "RateProfile":
+        """Rate which increases (or decreases) linearly over the duration"""
+        return cls("ramp", duration, rate=end_rate, start_rate=start_rate)
+
+    @classmethod
+    def burst(
+        cls, size: int, interval: float, duration: float, base_rate: float = 0.0
+    ) -> "RateProfile":
+        """Bursts of messages at a fixed interval (starting immediately)"""
+        return cls(
+            "burst", duration, rate=base_rate, burst_size=size, burst_interval=interval
+        )
+
+    def cumulative(self, elapsed: float) -> float:
+        """Number of messages which should have been sent after the elapsed time
+
+        Args:
+            elapsed (float): Time since the start in seconds
+
+        Returns:
+            float: Number of messages
+        """
+        elapsed = min(max(elapsed, 0.0), self.duration)
+        if self.kind == "ramp":
+            slope = (self.rate - self.start_rate) / self.duration
+            return self.start_rate * elapsed + slope * elapsed**2 / 2
+        if self.kind == "burst":
+            bursts = math.floor(elapsed / self.burst_interval) + 1
+            if elapsed >= self.duration:
+                # No burst at the end of the duration
+                bursts = math.ceil(self.duration / self.burst_interval)
+            return self.burst_size * bursts + self.rate * elapsed
+        return self.rate * elapsed
+
+    @property
+    def total(self) -> int:
+        """Total number of messages"""
+        return int(self.cumulative(self.duration))
+
+
+def payload_template(schema: SeriesSchema) -> str:
+    """Create a thin-edge json measurement template (for printf-style formatting)
+    with the sequence number, send time and the value of each series
+
+    Args:
+        schema (SeriesSchema): Series (or group.series) names and value ranges
+
+    Returns:
+        str: Template with the placeholders (sequence, send time, *series values)
+    """
+    groups: Dict[str, List[str]] = {}
+    fields = []
+    for name in schema:
+        group, _, series = name.rpartition(".")
+        if group:
+            groups.setdefault(group, []).append(f'"{series}":%.3f')
+        else:
+            fields.append(f'"{name}":%.3f')
+    fields.extend(f'"{group}":{{{",".join(items)}}}' for group, items in groups.items())
+    fields.insert(0, f'"{LOAD_FRAGMENT}":{{"seq":%d,"sent":%.3f}}')
+    return "{" + ",".join(fields) + "}"
+
+
+def series_bounds(schema: SeriesSchema) -> List[Tuple[float, float]]:
+    """Value range of each series, in the order of the placeholders of payload_template"""
+    plain = [bounds for name, bounds in schema.items() if "." not in name]
+    grouped: Dict[str, List[Tuple[float, float]]] = {}
+    for name, bounds in schema.items():
+        if "." in name:
+            grouped.setdefault(name.rpartition(".")[0], []).append(bounds)
+    return plain + [bounds for items in grouped.values() for bounds in items]
+
+
+def generate_batch(
+    template: str,
+    bounds: List[Tuple[float, float]],
+    first_sequence: int,
+    count: int,
+    sent: float,
+    rng: random.Random,
+) -> List[str]:
+    """Generate a batch of payloads. Each series is generated as a column for
+    the whole batch, and the payloads are formatted from the columns.
+
+    Args:
+        template (str): Payload template (see payload_template)
+        bounds (List[Tuple[float, float]]): Value range of each series (in template order)
+        first_sequence (int): Sequence number of the first payload
+        count (int): Number of payloads
+        sent (float): Send time (unix ms)
+        rng (random.Random): Random number generator
+
+    Returns:
+        List[str]: Payloads
+    """
+    columns = [[rng.uniform(low, high) for _ in range(count)] for low, high in bounds]
+    sequences = range(first_sequence, first_sequence + count)
+    return [
+        template % (sequence, sent, *values)
+        for sequence, *values in zip(sequences, *columns)
+    ]
+
+
+@dataclass
+class LoadReport:
+    """Result of a load run"""
+
+    target: int
+    sent: int
+    duration: float
+    # Largest delay (in seconds) behind the planned schedule
+    max_lag: float = 0.0
+    received: Optional[int] = None
+    duplicates: int = 0
+    # End-to-end latency (send to received by the realtime subscriber). The receive
+    # time is taken when the test runner reads the message from the stdout pipe of
+    # the subscriber process, so it includes the output buffering of the process
+    # and is an upper bound of the actual latency (mainly affecting the tail, e.g. p99)
+    latency_ms: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def send_rate(self) -> float:
+        """Achieved send rate (messages per second)"""
+        return self.sent / self.duration if self.duration else 0.0
+
+    @property
+    def dropped(self) -> Optional[int]:
+        """Messages which were sent but not received. None without a subscriber"""
+        if self.received is None:
+            return None
+        return self.sent - self.received
+
+
+class LatencyCollector:
+    """Read measurements from a realtime subscription (in a background thread)
+    and record the sequence number and latency of each load test message.
+
+    The latency is measured until the message is read from the subscriber's
+    output (see LoadReport.latency_ms), not until it is received by the subscriber.
+    """
+
+    def __init__(self, reader: JsonReader):
+        self._reader = reader
+        self._sequences = set()
+        self._latencies: List[float] = []
+        self.duplicates = 0
+        self.warmup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="load-latency", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for received, measurement in self._reader.iter_lines():
+                fragment = measurement.get(LOAD_FRAGMENT)
+                if not fragment:
+                    continue
+                sequence = int(fragment["seq"]["value"])
+                if sequence == WARMUP_SEQUENCE:
+                    self.warmup.set()
+                    continue
+                with self._lock:
+                    if sequence in self._sequences:
+                        self.duplicates += 1
+                        continue
+                    self._sequences.add(sequence)
+                    self._latencies.append(received * 1000 - fragment["sent"]["value"])
+        except Exception as ex:  # pylint: disable=broad-except
+            log.warning("Realtime subscription ended. exception=%s", ex)
+
+    @property
+    def received(self) -> int:
+        """Number of unique messages received"""
+        return len(self._sequences)
+
+    def latency_summary(self) -> Dict[str, float]:
+        """Latency percentiles (and maximum) in milliseconds"""
+        with self._lock:
+            ordered = sorted(self._latencies)
+        summary = {
+            f"p{percent}": percentile(ordered, percent) for percent in PERCENTILES
+        }
+        summary["max"] = ordered[-1] if ordered else math.nan
+        return summary
+
+    def stop(self):
+        """Stop the subscription"""
+        self._reader.stop()
+
+
+class LoadGenerator:
+    """Publish measurements following a rate profile, and measure the achieved
+    send rate and (optionally) the end-to-end latency via a realtime subscription.
+
+    Example:
+        report = load_generator.run(RateProfile.constant(1000, duration=30))
+    """
+
+    def __init__(
+        self,
+        publish_many: Callable[..., int],
+        subscribe: Callable[[float], JsonReader] = None,
+        topic: str = "tedge/measurements",
+        tick: float = 0.01,
+    ):
+        """Create a load generator
+
+        Args:
+            publish_many (Callable[..., int]): Function to publish a list of messages,
+                e.g. DockerDeviceAdapter.publish_many
+            subscribe (Callable[[float], JsonReader], optional): Function to create a
+                realtime measurement subscription for the given duration (seconds).
+                Drops and latency are only reported when set.
+            topic (str, optional): Topic. Defaults to tedge/measurements.
+            tick (float, optional): Interval in seconds between batches. Defaults to 0.01.
+        """
+        self._publish_many = publish_many
+        self._subscribe = subscribe
+        self.topic = topic
+        self.tick = tick
+
+    def _wait_for_subscriber(self, collector: LatencyCollector, timeout: float):
+        template = payload_template({})
+        deadline = time.monotonic() + timeout
+        while not collector.warmup.is_set():
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"Realtime subscriber did not receive any messages after {timeout}s"
+                )
+            payload = template % (WARMUP_SEQUENCE, time.time() * 1000)
+            self._publish_many([(self.topic, payload)], qos=1)
+            collector.warmup.wait(1)
+
+    def run(
+        self,
+        profile: RateProfile,
+        schema: SeriesSchema = None,
+        qos: int = 0,
+        settle_timeout: float = 30,
+        seed: int = None,
+    ) -> LoadReport:
+        """Publish messages following the rate profile
+
+        Args:
+            profile (RateProfile): Rate profile
+            schema (SeriesSchema, optional): Series (or group.series) to include in each
+                measurement, and the range of their random values.
+                Defaults to a single temperature series.
+            qos (int, optional): Quality of service. Defaults to 0.
+            settle_timeout (float, optional): Time in seconds to wait for the remaining
+                messages to be received after sending. Defaults to 30.
+            seed (int, optional): Seed of the random values. Defaults to random.
+
+        Returns:
+            LoadReport: Achieved send rate, drops and latency percentiles
+        """
+        schema = schema or DEFAULT_SCHEMA
+        template = payload_template(schema)
+        bounds = series_bounds(schema)
+        rng = random.Random(seed)
+
+        collector = None
+        if self._subscribe is not None:
+            collector = LatencyCollector(
+                self._subscribe(profile.duration + settle_timeout + 60)
+            )
+            self._wait_for_subscriber(collector, timeout=30)
+
+        sent = 0
+        max_lag = 0.0
+        start = time.monotonic()
+        next_tick = start
+        while True:
+            elapsed = time.monotonic() - start
+            max_lag = max(max_lag, time.monotonic() - next_tick)
+            count = int(profile.cumulative(elapsed)) - sent
+            if count > 0:
+                payloads = generate_batch(
+                    template, bounds, sent, count, time.time() * 1000, rng
+                )
+                messages: List[Message] = [
+                    (self.topic, payload) for payload in payloads
+                ]
+                self._publish_many(messages, qos=qos)
+                sent += count
+
+            if elapsed >= profile.duration:
+                break
+            next_tick += self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        duration = time.monotonic() - start
+
+        report = LoadReport(
+            target=profile.total, sent=sent, duration=duration, max_lag=max_lag
+        )
+        if collector is not None:
+            deadline = time.monotonic() + settle_timeout
+            while collector.received < sent and time.monotonic() < deadline:
+                time.sleep(0.5)
+            collector.stop()
+            report.received = collector.received
+            report.duplicates = collector.duplicates
+            report.latency_ms = collector.latency_summary()
+
+        log.info(
+            "Load test finished. profile=%s, sent=%d, send_rate=%.1f/s, max_lag=%.3f, "
+            "received=%s, dropped=%s, latency_ms=%s",
+            profile.kind,
+            report.sent,
+            report.send_rate,
+            report.max_lag,
+            report.received,
+            report.dropped,
+            report.latency_ms,
+        )
+        return report
@@ -0,0 +1,357 @@
+"""Replay recorded MQTT captures into the broker of one or more devices"""
+import logging
+import math
+import re
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Sequence, Tuple
+
+from integration.fixtures.docker.stats import PERCENTILES, percentile
+from integration.fixtures.mqtt.capture import CaptureReader, topic_matches
+from integration.fixtures.mqtt.client import Message
+
+log = logging.getLogger()
+
+# Only the local tedge api messages are replayed by default, so the messages are
+# processed by the mapper (c8y/# messages would be sent to the cloud as is)
+REPLAY_TOPICS = ("tedge/#",)
+
+
+@dataclass(frozen=True)
+class ReplayTiming:
+    """When each recorded message is published
+
+    * original: same interval between messages as in the capture
+    * speedup: intervals divided by the speed factor
+    * max: as fast as possible (no schedule)
+    """
+
+    kind: str
+    speed: float = 1.0
+
+    @classmethod
+    def original(cls) -> "ReplayTiming":
+        """Original timing"""
+        return cls("original")
+
+    @classmethod
+    def speedup(cls, factor: float) -> "ReplayTiming":
+        """Original timing, sped up by a factor (e.g. 10 = ten times faster)"""
+        if factor <= 0:
+            raise ValueError(f"Speed factor must be greater than 0. factor={factor}")
+        return cls("speedup", speed=factor)
+
+    @classmethod
+    def max_rate(cls) -> "ReplayTiming":
+        """Publish all messages as fast as possible"""
+        return cls("max", speed=math.inf)
+
+    @property
+    def scheduled(self) -> bool:
+        """Messages are published according to a schedule"""
+        return self.kind != "max"
+
+    def offset(self, elapsed_ns: int) -> float:
+        """Time (in seconds, since the start of the replay) at which a message
+        should be published
+
+        Args:
+            elapsed_ns (int): Time of the message since the first replayed message
+                in the capture (nanoseconds)
+
+        Returns:
+            float: Scheduled time in seconds
+        """
+        if not self.scheduled:
+            return 0.0
+        return elapsed_ns / 1e9 / self.speed
+
+
+def rewrite_topic(topic: str, device_ids: Dict[str, str]) -> str:
+    """Replace device ids in the levels of a topic. Only whole levels, and child
+    device ids prefixed with the device id (e.g. tedge/measurements/<device>_child01)
+    are replaced, so device01 does not match device010.
+
+    Args:
+        topic (str): Topic
+        device_ids (Dict[str, str]): Recorded and target device ids
+
+    Returns:
+        str: Topic
+    """
+    if not device_ids:
+        return topic
+    levels = topic.split("/")
+    for index, level in enumerate(levels):
+        for source, target in device_ids.items():
+            if level == source or level.startswith(source + "_"):
+                levels[index] = target + level[len(source) :]
+                break
+    return "/".join(levels)
+
+
+def device_id_pattern(device_ids: Dict[str, str]) -> Optional[Pattern]:
+    """Bytes regular expression matching the recorded device ids in a payload,
+    e.g. the external id of a device or of its child devices (<device>_child01).
+    Ids which are part of a longer id (e.g. device01 in device010) do not match.
+
+    Args:
+        device_ids (Dict[str, str]): Recorded and target device ids
+
+    Returns:
+        Optional[Pattern]: Pattern. None if there are no device ids
+    """
+    if not device_ids:
+        return None
+    # Longest first, so a device id which is a prefix of another one does not win
+    sources = sorted(device_ids, key=len, reverse=True)
+    alternatives = b"|".join(re.escape(source.encode("utf8")) for source in sources)
+    return re.compile(rb"(?<![\w-])(" + alternatives + rb")(?![a-zA-Z0-9-])")
+
+
+def rewrite_payload(
+    payload: bytes, device_ids: Dict[str, str], pattern: Pattern = None
+) -> bytes:
+    """Replace device ids in a payload (see device_id_pattern)
+
+    Args:
+        payload (bytes): Payload
+        device_ids (Dict[str, str]): Recorded and target device ids
+        pattern (Pattern, optional): Pattern returned by device_id_pattern, to
+            avoid compiling it for each payload
+
+    Returns:
+        bytes: Payload
+    """
+    pattern = pattern or device_id_pattern(device_ids)
+    if pattern is None:
+        return payload
+    targets = {
+        source.encode("utf8"): target.encode("utf8")
+        for source, target in device_ids.items()
+    }
+    return pattern.sub(lambda match: targets[match.group(1)], payload)
+
+
+@dataclass
+class ReplayReport:
+    """Result of a replay to a device"""
+
+    device: str
+    messages: int
+    duration: float
+    # Scheduled duration of the replay (0 for max rate)
+    schedule_duration: float = 0.0
+    # Delay of the batches behind the schedule (in milliseconds)
+    lag_ms: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def send_rate(self) -> float:
+        """Achieved send rate (messages per second)"""
+        return self.messages / self.duration if self.duration else 0.0
+
+
+class CaptureReplay:
+    """Publish the messages of a capture file (see integration.fixtures.mqtt.capture)
+    to the broker of a device, following the recorded timing (optionally sped up)
+    or as fast as possible.
+
+    Messages which are scheduled within the same tick are published as a single
+    batch, and the delay of each batch behind its scheduled time is reported as
+    the replay lag.
+
+    Note: The capture records the time of each socket read, not of each message,
+    so messages which were received together (e.g. a burst) have the same
+    timestamp and are replayed at the same time, even with the original timing.
+
+    Example:
+        replay = CaptureReplay("recorded.capture", ReplayTiming.speedup(10))
+        reports = replay.run_many(devices, source_id="prod-device01")
+    """
+
+    def __init__(
+        self,
+        path: str,
+        timing: ReplayTiming = None,
+        topics: Sequence[str] = REPLAY_TOPICS,
+        start_ns: int = None,
+        end_ns: int = None,
+        tick: float = 0.001,
+        max_batch: int = 1000,
+        rewrite_payloads: bool = True,
+    ):
+        """Create a replay
+
+        Args:
+            path (str): Capture file
+            timing (ReplayTiming, optional): Timing. Defaults to the original timing.
+            topics (Sequence[str], optional): Only replay messages matching the topic
+                filters. Defaults to tedge/#.
+            start_ns (int, optional): Only replay the messages recorded at or after
+                this time (unix ns)
+            end_ns (int, optional): Only replay the messages recorded before this
+                time (unix ns)
+            tick (float, optional): Messages scheduled within this interval (seconds)
+                are published together. Defaults to 0.001.
+            max_batch (int, optional): Maximum number of messages per batch.
+                Defaults to 1000.
+            rewrite_payloads (bool, optional): Also replace the recorded device id in
+                the payloads (e.g. external ids), not only in the topics.
+                Defaults to True.
+        """
+        self.path = path
+        self.timing = timing or ReplayTiming.original()
+        self.topics = tuple(topics)
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.tick = tick
+        self.max_batch = max_batch
+        self.rewrite_payloads = rewrite_payloads
+
+    def _batches(
+        self, reader: CaptureReader, device_ids: Dict[str, str]
+    ) -> Iterator[Tuple[float, List[Message]]]:
+        """Group the messages into batches of (scheduled time, messages)"""
+        # The topics are decoded, filtered and rewritten once per distinct topic
+        topics: Dict[bytes, Optional[str]] = {}
+        pattern = device_id_pattern(device_ids) if self.rewrite_payloads else None
+        sources = [source.encode("utf8") for source in device_ids]
+        first_ns = None
+        batch: List[Message] = []
+        batch_due = 0.0
+        for timestamp_ns, raw_topic, payload in reader.iter_raw(
+            self.start_ns, self.end_ns
+        ):
+            key = bytes(raw_topic)
+            if key not in topics:
+                topic = str(key, "utf8")
+                topics[key] = (
+                    rewrite_topic(topic, device_ids)
+                    if any(topic_matches(f, topic) for f in self.topics)
+                    else None
+                )
+            topic = topics[key]
+            if topic is None:
+                continue
+
+            if first_ns is None:
+                first_ns = timestamp_ns
+            due = self.timing.offset(timestamp_ns - first_ns)
+            if batch and (due - batch_due > self.tick or len(batch) >= self.max_batch):
+                yield batch_due, batch
+                batch = []
+            if not batch:
+                batch_due = due
+            payload = bytes(payload)
+            if pattern is not None and any(source in payload for source in sources):
+                payload = rewrite_payload(payload, device_ids, pattern)
+            batch.append((topic, payload))
+        if batch:
+            yield batch_due, batch
+
+    def run(
+        self,
+        device,
+        source_id: str = None,
+        qos: int = 0,
+        start_at: float = None,
+    ) -> ReplayReport:
+        """Replay the capture to a device
+
+        Args:
+            device (DockerDeviceAdapter): Target device. Its broker port must be
+                published (expose_mqtt=True)
+            source_id (str, optional): Device id of the recorded device, which is
+                replaced by the target device's id in the topics (and payloads)
+            qos (int, optional): Quality of service. Defaults to 0.
+            start_at (float, optional): Start time (time.monotonic) of the schedule,
+                used to start multiple replays at the same time. Defaults to now.
+
+        Returns:
+            ReplayReport: Number of messages, duration and lag
+        """
+        device_ids = {source_id: device.name} if source_id else {}
+        lags = array("d")
+        messages = 0
+        schedule_duration = 0.0
+
+        with CaptureReader(self.path) as reader:
+            # Connect before the replay starts
+            device.get_mqtt_client()
+            start = time.monotonic() if start_at is None else start_at
+            time.sleep(max(start - time.monotonic(), 0))
+            for due, batch in self._batches(reader, device_ids):
+                if self.timing.scheduled:
+                    delay = start + due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    lags.append((time.monotonic() - start - due) * 1000)
+                    schedule_duration = due
+                device.publish_many(batch, qos=qos)
+                messages += len(batch)
+            duration = time.monotonic() - start
+
+        ordered = sorted(lags)
+        lag_ms = {}
+        if ordered:
+            lag_ms = {
+                f"p{percent}": percentile(ordered, percent) for percent in PERCENTILES
+            }
+            lag_ms["max"] = ordered[-1]
+
+        report = ReplayReport(
+            device=device.name,
+            messages=messages,
+            duration=duration,
+            schedule_duration=schedule_duration,
+            lag_ms=lag_ms,
+        )
+        log.info(
+            "Replay finished. device=%s, timing=%s, messages=%d, duration=%.3f, "
+            "send_rate=%.1f/s, lag_ms=%s",
+            report.device,
+            self.timing.kind,
+            report.messages,
+            report.duration,
+            report.send_rate,
+            report.lag_ms,
+        )
+        return report
+
+    def run_many(
+        self,
+        devices: Iterable,
+        source_id: str = None,
+        qos: int = 0,
+        start_delay: float = 1.0,
+    ) -> Dict[str, ReplayReport]:
+        """Replay the capture to multiple devices in parallel (one thread per device).
+        All replays share the same start time.
+
+        Args:
+            devices (Iterable[DockerDeviceAdapter]): Target devices
+            source_id (str, optional): Device id of the recorded device, which is
+                replaced by each target device's id in the topics (and payloads)
+            qos (int, optional): Quality of service. Defaults to 0.
+            start_delay (float, optional): Time in seconds to connect to all devices
+                before the replays start. Defaults to 1.0.
+
+        Returns:
+            Dict[str, ReplayReport]: Report per device name
+        """
+        devices = list(devices)
+        if not devices:
+            return {}
+        start_at = time.monotonic() + start_delay
+        with ThreadPoolExecutor(
+            max_workers=len(devices), thread_name_prefix="replay"
+        ) as executor:
+            futures = {
+                device.name: executor.submit(
+                    self.run, device, source_id=source_id, qos=qos, start_at=start_at
+                )
+                for device in devices
+            }
+            return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,126 @@
+"""MQTT capture file tests (no device required)"""
+
+import os
+import struct
+import pytest
+from integration.fixtures.mqtt.capture import (
+    INDEX_SUFFIX,
+    RECORD_HEADER,
+    CaptureReader,
+    CaptureWriter,
+    topic_matches,
+)
+
+RECORDS = [
+    (1000, "tedge/measurements", b'{"temp": 1}'),
+    (2000, "c8y/s/us", b"200,temp,T,1"),
+    (3000, "tedge/measurements", b'{"temp": 2}'),
+]
+
+
+def publish_body(topic: str, payload: bytes) -> bytes:
+    """PUBLISH body (topic length, topic and payload) as received from the broker"""
+    data = topic.encode("utf8")
+    return struct.pack("!H", len(data)) + data + payload
+
+
+def write_capture(path: str, records):
+    """Write records to a capture file"""
+    writer = CaptureWriter(path)
+    for timestamp_ns, topic, payload in records:
+        writer.add(timestamp_ns, publish_body(topic, payload))
+    writer.close()
+
+
+@pytest.fixture(name="path")
+def fixture_path(tmp_path) -> str:
+    """Capture file with the test records"""
+    path = str(tmp_path / "device.capture")
+    write_capture(path, RECORDS)
+    return path
+
+
+def test_round_trip(path: str):
+    """Records are read back as written"""
+    with CaptureReader(path) as reader:
+        assert len(reader) == 3
+        assert [tuple(record) for record in reader.records()] == RECORDS
+        assert reader.duration_ns == 2000
+        assert reader.topic_counts() == {"tedge/measurements": 2, "c8y/s/us": 1}
+        assert [record.payload for record in reader.records("c8y/#")] == [
+            b"200,temp,T,1"
+        ]
+        assert [r.timestamp_ns for r in reader.records(start_ns=2000)] == [2000, 3000]
+        assert [r.timestamp_ns for r in reader.records(end_ns=2000)] == [1000]
+
+
+def test_append(path: str):
+    """An existing capture file is appended to"""
+    write_capture(path, [(4000, "tedge/events/login", b"{}")])
+    with CaptureReader(path) as reader:
+        assert len(reader) == 4
+        assert reader[3].topic == "tedge/events/login"
+
+
+@pytest.mark.parametrize("write_index", [False, True])
+def test_rebuild_missing_index(path: str, write_index: bool):
+    """The index is rebuilt from the capture file if it is missing"""
+    os.remove(path + INDEX_SUFFIX)
+    with CaptureReader(path, write_index=write_index) as reader:
+        assert [tuple(record) for record in reader.records()] == RECORDS
+    assert os.path.exists(path + INDEX_SUFFIX) == write_index
+
+
+def test_rebuild_incomplete_index(path: str):
+    """The index is rebuilt if it does not cover all records"""
+    size = os.path.getsize(path + INDEX_SUFFIX)
+    os.truncate(path + INDEX_SUFFIX, size - 16)
+    with CaptureReader(path) as reader:
+        assert len(reader) == 3
+
+
+def test_incomplete_last_record(path: str):
+    """An incomplete record at the end (e.g. after a crash) is ignored, and
+    dropped when the capture is appended to"""
+    complete_size = os.path.getsize(path)
+    with open(path, "ab") as file:
+        file.write(RECORD_HEADER.pack(4000, 100) + b"partial")
+    os.remove(path + INDEX_SUFFIX)
+
+    with CaptureReader(path) as reader:
+        assert len(reader) == 3
+        assert reader.end_offset == complete_size
+
+    write_capture(path, [(5000, "tedge/events/login", b"{}")])
+    with CaptureReader(path) as reader:
+        assert [record.timestamp_ns for record in reader.records()] == [
+            1000,
+            2000,
+            3000,
+            5000,
+        ]
+
+
+def test_not_a_capture_file(tmp_path):
+    """Other files are rejected"""
+    path = tmp_path / "other.capture"
+    path.write_bytes(b"not a capture file")
+    with pytest.raises(ValueError):
+        CaptureReader(str(path))
+
+
+@pytest.mark.parametrize(
+    "topic_filter,topic,expected",
+    [
+        pytest.param("c8y/s/us", "c8y/s/us", True, id="exact"),
+        pytest.param("c8y/s/us", "c8y/s/ds", False, id="exact_mismatch"),
+        pytest.param("c8y/#", "c8y/s/us", True, id="multi_level"),
+        pytest.param("c8y/#", "c8y", True, id="multi_level_parent"),
+        pytest.param("tedge/+/child", "tedge/measurements/child", True, id="single"),
+        pytest.param("tedge/+", "tedge/measurements/child", False, id="single_depth"),
+        pytest.param("tedge/measurements", "tedge", False, id="shorter_topic"),
+    ],
+)
+def test_topic_matches(topic_filter: str, topic: str, expected: bool):
+    """MQTT topic filter wildcards"""
+    assert topic_matches(topic_filter, topic) == expected
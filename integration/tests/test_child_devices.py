@@ -1,14 +1,17 @@
 """Cumulocity child device tests"""
 
-import time
 from integration.fixtures.device.device import Device
 
 
 def test_child_device_registration(dut: Device, random_name_factory: str):
     """Register child devices"""
     child_name = random_name_factory()
-    # TODO: Sleep is required due to delayed startup
-    time.sleep(5)
+    # Wait for the mapper to start, otherwise the child device is not registered
+    dut.device.wait_for_log(
+        r"^Started tedge-mapper-c8y",
+        unit="tedge-mapper-c8y",
+        since=dut.device.test_start_time,
+    )
     dut.device.assert_command(
         f"mkdir -p /etc/tedge/operations/c8y/{child_name}",
     )
@@ -19,7 +22,11 @@ def test_child_device_registration(dut: Device, random_name_factory: str):
 def test_child_supported_operations(dut: Device, random_name_factory: str):
     """Register child devices with supported operations"""
     child_name = random_name_factory()
-    time.sleep(5)
+    dut.device.wait_for_log(
+        r"^Started tedge-mapper-c8y",
+        unit="tedge-mapper-c8y",
+        since=dut.device.test_start_time,
+    )
     dut.device.assert_command(
         f"""
         mkdir -p /etc/tedge/operations/c8y/{child_name};
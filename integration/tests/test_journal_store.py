@@ -0,0 +1,51 @@
+"""Journal store tests (no device required)"""
+
+import re
+import pytest
+from integration.fixtures.device.journal import JournalStore
+
+
+@pytest.fixture(name="store")
+def fixture_store() -> JournalStore:
+    """Store with entries of multiple units"""
+    store = JournalStore()
+    store.append(1000, "tedge-agent.service", 6, b"Starting tedge-agent")
+    store.append(2000, "tedge-mapper-c8y.service", 3, b"mqtt error: connection lost")
+    store.append(3000, "tedge-agent.service", 6, b"tedge-agent started")
+    store.append(
+        4000, "tedge-mapper-c8y.service", 6, "Verbindung hergestellt ✓".encode("utf8")
+    )
+    return store
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        pytest.param("started", [2], id="str"),
+        pytest.param("^tedge", [2], id="anchored_start"),
+        pytest.param("agent$", [0], id="anchored_end"),
+        pytest.param("^Starting tedge-agent$", [0], id="anchored_full"),
+        pytest.param(re.compile("^mqtt"), [1], id="precompiled_str"),
+        pytest.param(re.compile("^TEDGE", re.IGNORECASE), [2], id="precompiled_flags"),
+        pytest.param(re.compile(b"^Verbindung"), [3], id="precompiled_bytes"),
+        pytest.param("hergestellt ✓$", [3], id="non_ascii"),
+    ],
+)
+def test_filter_pattern(store: JournalStore, pattern, expected):
+    """Patterns are matched against each message individually"""
+    assert store.filter(pattern=pattern) == expected
+
+
+def test_filter_combined(store: JournalStore):
+    """All criteria must match"""
+    assert store.filter(unit="tedge-agent.service", pattern="^tedge") == [2]
+    assert store.filter(max_priority=3, pattern="^mqtt") == [1]
+    assert store.filter(start=2500, pattern="^tedge") == [2]
+    assert store.filter(end=2500, pattern="^tedge") == []
+
+
+def test_append_after_filter(store: JournalStore):
+    """The message buffer can still grow after filtering"""
+    store.filter(pattern="^tedge")
+    store.append(5000, "tedge-agent.service", 6, b"tedge-agent stopped")
+    assert store.filter(pattern="^tedge") == [2, 4]
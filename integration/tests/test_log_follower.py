@@ -0,0 +1,138 @@
+"""Journal follower tests (no device required)"""
+
+import json
+import queue
+from datetime import datetime, timedelta, timezone
+from typing import List
+import pytest
+from docker.errors import NotFound
+from integration.fixtures.docker.log_follower import JournalFollower
+
+
+def journal_line(cursor: str, timestamp: datetime, message: str) -> str:
+    """Journal entry in the journalctl json output format"""
+    return json.dumps(
+        {
+            "__CURSOR": cursor,
+            "__REALTIME_TIMESTAMP": str(int(timestamp.timestamp() * 1_000_000)),
+            "_SYSTEMD_UNIT": "tedge-agent.service",
+            "PRIORITY": "6",
+            "MESSAGE": message,
+        }
+    )
+
+
+class FakeStream:
+    """Command stream which outputs the lines put into a queue. None ends it"""
+
+    def __init__(self, lines: "queue.Queue"):
+        self._lines = lines
+
+    def lines(self):
+        """Output lines"""
+        while True:
+            line = self._lines.get()
+            if line is None:
+                return
+            yield line
+
+    def stop(self):
+        """Stop the stream"""
+        self._lines.put(None)
+
+
+class FakeDevice:
+    """Starts a fake stream per journalctl command"""
+
+    def __init__(self):
+        self.commands: List[str] = []
+        self.streams: "queue.Queue[queue.Queue]" = queue.Queue()
+        self.removed = False
+
+    def start_stream(self, cmd: str) -> FakeStream:
+        """Start a journalctl command"""
+        if self.removed:
+            raise NotFound("No such container")
+        self.commands.append(cmd)
+        lines = queue.Queue()
+        self.streams.put(lines)
+        return FakeStream(lines)
+
+    def next_stream(self) -> "queue.Queue":
+        """Wait for the follower to start the next stream"""
+        return self.streams.get(timeout=5)
+
+
+@pytest.fixture(name="device")
+def fixture_device() -> FakeDevice:
+    """Fake device"""
+    return FakeDevice()
+
+
+@pytest.fixture(name="start")
+def fixture_start() -> datetime:
+    """Start time of the follower"""
+    return datetime.now(timezone.utc) - timedelta(seconds=10)
+
+
+def test_since_defaults_to_now(device: FakeDevice, start: datetime):
+    """Entries before the call are only matched when requested"""
+    follower = JournalFollower(device.start_stream, since=start)
+    follower.start()
+    lines = device.next_stream()
+    lines.put(journal_line("c1", start + timedelta(seconds=1), "Started tedge-agent"))
+
+    entry = follower.wait_for("^Started", since=start, timeout=5)
+    assert entry.message == "Started tedge-agent"
+
+    with pytest.raises(TimeoutError):
+        follower.wait_for("^Started", timeout=0.2)
+    follower.stop()
+
+
+def test_entries_with_same_timestamp(device: FakeDevice, start: datetime):
+    """Distinct entries sharing a timestamp are all received"""
+    follower = JournalFollower(device.start_stream, since=start)
+    follower.start()
+    lines = device.next_stream()
+    timestamp = start + timedelta(seconds=1)
+    lines.put(journal_line("c1", timestamp, "first"))
+    lines.put(journal_line("c2", timestamp, "second"))
+
+    assert follower.wait_for("^second$", since=start, timeout=5).message == "second"
+    assert follower.wait_for("^first$", since=start, timeout=5).message == "first"
+    follower.stop()
+
+
+def test_resume_after_cursor(device: FakeDevice, start: datetime):
+    """A new stream resumes after the last received entry"""
+    follower = JournalFollower(device.start_stream, since=start)
+    follower.start()
+    lines = device.next_stream()
+    assert "--since @" in device.commands[0]
+    lines.put(journal_line("c1", start + timedelta(seconds=1), "first"))
+    follower.wait_for("^first$", since=start, timeout=5)
+
+    # e.g. the device restarted
+    lines.put(None)
+    lines = device.next_stream()
+    assert device.commands[1].endswith("--after-cursor c1")
+
+    lines.put(journal_line("c1", start + timedelta(seconds=1), "first"))
+    lines.put(journal_line("c2", start + timedelta(seconds=2), "second"))
+    follower.wait_for("^second$", since=start, timeout=5)
+    # pylint: disable=protected-access
+    assert [entry.message for entry in follower._backlog] == ["first", "second"]
+    follower.stop()
+
+
+def test_stop_when_container_removed(device: FakeDevice, start: datetime):
+    """Following stops once the container no longer exists"""
+    follower = JournalFollower(device.start_stream, since=start)
+    follower.start()
+    lines = device.next_stream()
+    device.removed = True
+    lines.put(None)
+    # pylint: disable=protected-access
+    follower._thread.join(timeout=5)
+    assert not follower._thread.is_alive()
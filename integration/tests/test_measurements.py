@@ -2,6 +2,7 @@
 
 import pytest
 from integration.fixtures.device.device import Device
+from integration.fixtures.mqtt.load import LoadGenerator, RateProfile
 
 # pylint: disable=too-many-arguments
 
@@ -33,3 +34,20 @@ def test_tedge_measurement(
         series=exp_series,
     )
     assert items[0][exp_fragment][exp_series]["value"] == exp_value
+
+
+@pytest.mark.parametrize(
+    "profile",
+    [
+        pytest.param(RateProfile.constant(100, duration=10), id="constant"),
+        pytest.param(RateProfile.ramp(10, 200, duration=10), id="ramp"),
+        pytest.param(RateProfile.burst(200, interval=2, duration=10), id="burst"),
+    ],
+)
+def test_tedge_measurement_load(load_generator: LoadGenerator, profile: RateProfile):
+    """Publish measurements at a given rate and check that all of them arrive"""
+    report = load_generator.run(profile)
+    assert report.sent == profile.total
+    # Drops are not measured without a realtime subscription (e.g. mock tenant)
+    if report.received is not None:
+        assert report.dropped == 0, f"latency_ms={report.latency_ms}"
@@ -0,0 +1,50 @@
+"""Readiness probe tests (no device required)"""
+
+import pytest
+from integration.fixtures.device.readiness import (
+    BRIDGE_CONFIG,
+    DEFAULT_SERVICES,
+    ReadinessStatus,
+    probe_command,
+)
+
+CONNECTED = """mosquitto=active
+bridge=[tedge/health/mosquitto-c8y-bridge] 1
+tedge-agent=active
+tedge-mapper-c8y=active
+"""
+
+
+@pytest.mark.parametrize(
+    "output,bridge,ready",
+    [
+        pytest.param(CONNECTED, None, True, id="connected"),
+        pytest.param("mosquitto=active\n", None, True, id="not_configured"),
+        pytest.param("mosquitto=active\n", True, False, id="bridge_required"),
+        pytest.param(
+            CONNECTED.replace("] 1", "] 0"), None, False, id="bridge_disconnected"
+        ),
+        pytest.param(
+            "mosquitto=active\ntedge-agent=active\ntedge-mapper-c8y=active\n",
+            False,
+            True,
+            id="bridge_skipped",
+        ),
+        pytest.param(
+            "mosquitto=active\ntedge-agent=inactive\n", False, False, id="inactive"
+        ),
+    ],
+)
+def test_parse(output: str, bridge, ready: bool):
+    """Cloud checks are only required when the bridge is configured (auto mode)"""
+    assert ReadinessStatus.parse(output, DEFAULT_SERVICES, bridge).ready == ready
+
+
+def test_probe_command_auto_bridge():
+    """The cloud services and bridge are only probed if the bridge is configured"""
+    cmd = probe_command(DEFAULT_SERVICES)
+    configured = cmd[cmd.index(f"if [ -f {BRIDGE_CONFIG} ]") :]
+    assert "systemctl is-active mosquitto" not in configured
+    assert "systemctl is-active tedge-mapper-c8y" in configured
+    assert "tedge mqtt sub" in configured
+    assert "tedge mqtt sub" not in probe_command(DEFAULT_SERVICES, bridge=False)
@@ -0,0 +1,135 @@
+"""MQTT capture replay tests (no device required)"""
+
+import struct
+import pytest
+from integration.fixtures.mqtt.capture import CaptureReader, CaptureWriter
+from integration.fixtures.mqtt.replay import (
+    CaptureReplay,
+    ReplayTiming,
+    rewrite_payload,
+    rewrite_topic,
+)
+
+DEVICE_IDS = {"device01": "target"}
+
+
+@pytest.mark.parametrize(
+    "topic,expected",
+    [
+        pytest.param("tedge/measurements/device01", "tedge/measurements/target"),
+        pytest.param("tedge/measurements/device010", "tedge/measurements/device010"),
+        pytest.param(
+            "tedge/measurements/device01_child1",
+            "tedge/measurements/target_child1",
+            id="child",
+        ),
+        pytest.param("tedge/measurements", "tedge/measurements", id="no_device"),
+        pytest.param("c8y/device01/s/us", "c8y/target/s/us", id="inner_level"),
+    ],
+)
+def test_rewrite_topic(topic: str, expected: str):
+    """Only whole topic levels (and child device ids) are replaced"""
+    assert rewrite_topic(topic, DEVICE_IDS) == expected
+
+
+@pytest.mark.parametrize(
+    "payload,expected",
+    [
+        pytest.param(b'{"externalId":"device01"}', b'{"externalId":"target"}'),
+        pytest.param(b'{"externalId":"device010"}', b'{"externalId":"device010"}'),
+        pytest.param(b"101,device01_child1,child", b"101,target_child1,child"),
+        pytest.param(b"101,my-device01", b"101,my-device01", id="longer_id"),
+    ],
+)
+def test_rewrite_payload(payload: bytes, expected: bytes):
+    """Device ids which are part of a longer id are not replaced"""
+    assert rewrite_payload(payload, DEVICE_IDS) == expected
+
+
+def test_rewrite_prefixed_device_ids():
+    """A device id which is a prefix of another one does not win"""
+    device_ids = {"device01": "target", "device010": "other"}
+    assert rewrite_payload(b"device01,device010", device_ids) == b"target,other"
+
+
+def test_timing_offset():
+    """Scheduled time (seconds) of a message since the start of the replay"""
+    assert ReplayTiming.original().offset(1_500_000_000) == 1.5
+    assert ReplayTiming.speedup(10).offset(1_500_000_000) == pytest.approx(0.15)
+    assert ReplayTiming.max_rate().offset(1_500_000_000) == 0.0
+    assert not ReplayTiming.max_rate().scheduled
+    with pytest.raises(ValueError):
+        ReplayTiming.speedup(0)
+
+
+@pytest.fixture(name="path")
+def fixture_path(tmp_path) -> str:
+    """Capture file with messages at 0, 0.5, 3, 3.2 and 10 ms"""
+    path = str(tmp_path / "device.capture")
+    writer = CaptureWriter(path)
+    start = 1_000_000_000
+    for offset_us, topic in [
+        (0, "tedge/measurements/device01"),
+        (500, "tedge/measurements/device01"),
+        (1000, "c8y/s/us"),
+        (3000, "tedge/measurements/device01_child1"),
+        (3200, "tedge/measurements/device01"),
+        (10000, "tedge/events/login/device01"),
+    ]:
+        data = topic.encode("utf8")
+        body = struct.pack("!H", len(data)) + data + b'{"source":"device01"}'
+        writer.add(start + offset_us * 1000, body)
+    writer.close()
+    return path
+
+
+def batches(replay: CaptureReplay, path: str):
+    """Batches of (scheduled time in ms, topics)"""
+    with CaptureReader(path) as reader:
+        # pylint: disable=protected-access
+        return [
+            (round(due * 1000, 3), [topic for topic, _ in batch])
+            for due, batch in replay._batches(reader, DEVICE_IDS)
+        ]
+
+
+def test_batches_per_tick(path: str):
+    """Messages scheduled within the same tick are published together"""
+    assert batches(CaptureReplay(path, tick=0.001), path) == [
+        (0.0, ["tedge/measurements/target", "tedge/measurements/target"]),
+        (
+            3.0,
+            ["tedge/measurements/target_child1", "tedge/measurements/target"],
+        ),
+        (10.0, ["tedge/events/login/target"]),
+    ]
+
+
+def test_batches_speedup(path: str):
+    """The schedule is sped up, and the tick applies to the sped up schedule"""
+    assert [
+        (due, len(topics))
+        for due, topics in batches(
+            CaptureReplay(path, ReplayTiming.speedup(4), tick=0.001), path
+        )
+    ] == [(0.0, 4), (2.5, 1)]
+
+
+def test_batches_max_rate(path: str):
+    """Without a schedule the batches are only limited by the batch size"""
+    replay = CaptureReplay(path, ReplayTiming.max_rate(), max_batch=2)
+    assert [(due, len(topics)) for due, topics in batches(replay, path)] == [
+        (0.0, 2),
+        (0.0, 2),
+        (0.0, 1),
+    ]
+
+
+def test_batches_payload_rewrite(path: str):
+    """Payloads are rewritten unless disabled"""
+    for rewrite, expected in [(True, b"target"), (False, b"device01")]:
+        replay = CaptureReplay(path, rewrite_payloads=rewrite)
+        with CaptureReader(path) as reader:
+            # pylint: disable=protected-access
+            _, batch = next(replay._batches(reader, DEVICE_IDS))
+            assert batch[0][1] == b'{"source":"' + expected + b'"}'
@@ -1,6 +1,5 @@
 """Restart tests"""
 
-import time
 from integration.fixtures.device.device import Device
 
 
@@ -8,6 +7,15 @@ def test_restart(dut: Device):
     """Restart device via Cumulocity operation"""
     # Wait for devices to startup before restarting
     # NOTE: Check if this is an issue or not, or just something more related to containers
-    time.sleep(5)
+    dut.device.wait_for_log(
+        r"^Started tedge-agent",
+        unit="tedge-agent",
+        since=dut.device.test_start_time,
+    )
+    dut.device.wait_for_log(
+        r"^Started tedge-mapper-c8y",
+        unit="tedge-mapper-c8y",
+        since=dut.device.test_start_time,
+    )
     operation = dut.cloud.restart()
     operation.assert_success()
@@ -30,6 +30,12 @@ def build(c, name="debian-systemd"):
     c.sudo(f"docker build -t {name} -f images/debian-systemd.dockerfile images")
 
 
+@task(name="build-mock")
+def build_mock(c, name="c8y-mock"):
+    """Build the local Cumulocity mock tenant image (used with INTTEST_C8Y_MOCK=1)"""
+    c.sudo(f"docker build -t {name} -f images/c8y-mock.dockerfile images")
+
+
 @task
 def usecontext(_c, context):
     """Change the .env file contents based on the target environment